@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('web', 'web'), ('personal_finance.db', '.')],
-    hiddenimports=['pandas._libs.tslibs.np_datetime', 'pandas._libs.tslibs.timedeltas', 'openpyxl', 'numbers', 'pkg_resources.py2_warn'],
+    hiddenimports=['data.importer', 'data.exporter', 'data.analytics', 'data.jobs', 'data.maintenance', 'data.rules', 'numpy', 'openpyxl', 'numbers', 'pkg_resources.py2_warn'], # data.* are imported lazily via importlib
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1 @@
+# Synthetic ledger generator and benchmark harness; see run.py.
@@ -0,0 +1,107 @@
+# generate.py
+"""Deterministic synthetic ledgers for benchmarks.
+
+The same arguments (including --seed) always produce the same accounts, categories, budgets and transactions,
+so timings from different commits are measured against identical data. Rows go through the normal data layer
+(database.bulk_insert_transactions), so indexes, the search index and monthly rollups are all populated.
+Categorization rules are drawn from their own random stream, so the transactions do not depend on --rules.
+
+    python -m bench.generate ledger.db --transactions 1000000 --accounts 8 --categories 30 --years 10 --rules 1000
+"""
+import argparse
+import datetime
+import logging
+import random
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+try:
+    from data import database
+except ImportError:
+    import database
+
+DEFAULT_END_DATE = '2025-12-31' # Fixed, not today, so a seed always yields the same ledger
+INCOME_CATEGORY_SHARE = 0.2
+INCOME_TRANSACTION_SHARE = 0.08
+UNCATEGORIZED_SHARE = 0.1
+DEFAULT_RULES = 100
+RULE_REGEX_SHARE = 0.1
+RULE_CONDITIONAL_SHARE = 0.2
+_MERCHANTS = ('Grocery', 'Market', 'Coffee', 'Fuel', 'Pharmacy', 'Restaurant', 'Cinema', 'Bookstore', 'Hardware', 'Electric',
+              'Water', 'Internet', 'Mobile', 'Insurance', 'Gym', 'Bakery', 'Taxi', 'Airline', 'Hotel', 'Parking')
+_PLACES = ('Central', 'North', 'Harbor', 'Plaza', 'Station', 'Online', 'Express', 'Corner', 'City', 'Valley')
+_INCOME_SOURCES = ('Salary', 'Freelance invoice', 'Dividend', 'Interest', 'Refund', 'Transfer in')
+
+def _transactions(rng: random.Random, count: int, account_ids, expense_ids, income_ids, start: datetime.date, days: int) -> Iterator[Tuple[int, str, str, Decimal, Optional[int]]]:
+    dates = [(start + datetime.timedelta(days=offset)).isoformat() for offset in range(days)]
+    for i in range(count):
+        if rng.random() < INCOME_TRANSACTION_SHARE:
+            description = f"{rng.choice(_INCOME_SOURCES)} {i % 97}"; cents = int(rng.lognormvariate(11.0, 0.8)); category_ids = income_ids
+        else:
+            description = f"{rng.choice(_MERCHANTS)} {rng.choice(_PLACES)} #{rng.randrange(1000)}"; cents = -int(rng.lognormvariate(8.0, 1.1)) - 1; category_ids = expense_ids
+        category_id = rng.choice(category_ids) if category_ids and rng.random() >= UNCATEGORIZED_SHARE else None
+        yield rng.choice(account_ids), dates[rng.randrange(days)], description, Decimal(cents).scaleb(-2), category_id
+
+def _add_rules(rng: random.Random, count: int, account_ids, category_ids) -> int:
+    """Adds count rules shaped like the generated descriptions: mostly merchant/place/number keywords, some
+    merchant/place keywords limited to an account and amount range, and a few regexes."""
+    added = 0
+    with database.get_db_connection(): # One transaction for all rule rows
+        for _ in range(count):
+            kind = rng.random(); merchant, place, category_id = rng.choice(_MERCHANTS), rng.choice(_PLACES), rng.choice(category_ids)
+            if kind < RULE_REGEX_SHARE: rule_id = database.add_category_rule(category_id, rf"^{merchant} \w+ #{rng.randrange(100)}\d$", 'regex')
+            elif kind < RULE_REGEX_SHARE + RULE_CONDITIONAL_SHARE:
+                rule_id = database.add_category_rule(category_id, f"{merchant} {place}", account_id=rng.choice(account_ids), min_amount=Decimal(-rng.randrange(100, 50000)).scaleb(-2), max_amount=Decimal('0'), priority=50)
+            else: rule_id = database.add_category_rule(category_id, f"{merchant} {place} #{rng.randrange(1000)}")
+            added += rule_id is not None
+    return added
+
+def generate_ledger(path: str, transactions: int = 100000, accounts: int = 5, categories: int = 20, years: int = 5,
+                    budget_months: int = 24, end_date: str = DEFAULT_END_DATE, seed: int = 1, rules: int = DEFAULT_RULES) -> Dict[str, Any]:
+    """Builds a new ledger database at path (replacing any file there) and returns a summary dict.
+    Budgets are set for every expense category over the last budget_months months."""
+    rng = random.Random(seed); started = time.perf_counter()
+    target = Path(path)
+    for suffix in ('', '-wal', '-shm'): Path(f"{target}{suffix}").unlink(missing_ok=True)
+    database.set_db_file(target); database.initialize_db()
+
+    account_ids = [database.add_account(f"Account {n + 1}", Decimal(rng.randrange(0, 5000000)).scaleb(-2)) for n in range(accounts)]
+    income_count = max(1, round(categories * INCOME_CATEGORY_SHARE)) if categories > 1 else 0
+    income_ids = [database.add_category(f"Income {n + 1}", 'income') for n in range(income_count)]
+    expense_ids = [database.add_category(f"Expense {n + 1}", 'expense') for n in range(categories - income_count)]
+
+    end = datetime.date.fromisoformat(end_date); days = 365 * years
+    start = end - datetime.timedelta(days=days - 1)
+    inserted = database.bulk_insert_transactions(_transactions(rng, transactions, account_ids, expense_ids, income_ids, start, days))
+
+    month_index = end.year * 12 + end.month - 1; budgets = 0
+    with database.get_db_connection(): # One transaction for all budget rows
+        for offset in range(budget_months):
+            month = f"{(month_index - offset) // 12:04d}-{(month_index - offset) % 12 + 1:02d}"
+            for category_id in expense_ids: budgets += database.set_budget(category_id, month, Decimal(rng.randrange(5000, 200000)).scaleb(-2))
+    rule_count = _add_rules(random.Random(f"rules-{seed}"), rules, account_ids, expense_ids) if expense_ids else 0
+    summary = {'file': str(database.DB_FILE), 'seed': seed, 'accounts': len(account_ids), 'categories': len(income_ids) + len(expense_ids), 'budgets': budgets, 'rules': rule_count,
+               'transactions': inserted, 'start_date': start.isoformat(), 'end_date': end.isoformat(), 'seconds': round(time.perf_counter() - started, 3)}
+    logging.info(f"Generated ledger: {summary}")
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic ledger database.")
+    parser.add_argument('path', help="Output database file (replaced if it exists)")
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--budget-months', type=int, default=24)
+    parser.add_argument('--end-date', default=DEFAULT_END_DATE)
+    parser.add_argument('--rules', type=int, default=DEFAULT_RULES, help="Categorization rules to add")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    if args.transactions < 0 or args.accounts < 1 or args.categories < 0 or args.years < 1 or args.rules < 0: parser.error("Counts must be positive.")
+    generate_ledger(args.path, args.transactions, args.accounts, args.categories, args.years, args.budget_months, args.end_date, args.seed, args.rules)
+    database.close_db_connections()
+
+if __name__ == '__main__':
+    main()
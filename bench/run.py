@@ -0,0 +1,253 @@
+# run.py
+"""Benchmark harness for the data layer and the heavy Api methods.
+
+Every case runs against a private copy of a ledger (an existing file via --db, or one generated with
+bench.generate), so write cases never touch real data. Each case reports latency percentiles, rows/sec where the
+call returns rows, and the peak Python heap of one extra traced run (SQLite's own page cache is not included).
+Results are written as JSON; passing an earlier result file as --baseline compares p50 latencies and exits with
+status 1 when a case regressed by more than --threshold (or a query plan lost its index).
+
+    python -m bench.generate ledger.db --transactions 1000000
+    python -m bench.run --db ledger.db --out before.json
+    python -m bench.run --db ledger.db --baseline before.json --threshold 0.25
+"""
+import argparse
+import datetime
+import json
+import logging
+import math
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+from itertools import count
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from data import database, analytics, exporter, rules
+    from . import generate
+except ImportError:
+    import database, analytics, exporter, rules
+    import generate
+
+DEFAULT_REPEAT = 15
+DEFAULT_MAX_SECONDS = 10.0 # Per case; slow cases stop early once this much time was spent
+DEFAULT_THRESHOLD = 0.25 # Allowed p50 slowdown against the baseline (0.25 = 25%)
+DEFAULT_MIN_DELTA_MS = 0.05 # Slowdowns smaller than this are treated as noise
+BULK_INSERT_ROWS = 1000
+
+class Case:
+    """One benchmarked call. setup() runs untimed before every iteration and returns the call's arguments;
+    rows(result) gives the number of rows the call produced, for rows/sec."""
+    def __init__(self, name: str, func: Callable, setup: Optional[Callable[[], tuple]] = None, rows: Optional[Callable[[Any], int]] = None):
+        self.name, self.func, self.setup, self.rows = name, func, setup, rows
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(percent / 100 * len(sorted_values)) - 1))]
+
+def _drain(chunks) -> int:
+    return sum(len(chunk) for chunk in chunks)
+
+def _copy_database(source: Path, target: Path):
+    """Copies through the backup API, which also picks up pages still in source's WAL."""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst: src.backup(dst)
+    src.close(); dst.close()
+
+def _ledger_context() -> Dict[str, Any]:
+    """Picks the ids, dates and search term the cases use from the ledger being benchmarked."""
+    with database.get_db_connection() as conn:
+        first_date, last_date, transaction_count, transaction_id = conn.execute("SELECT MIN(date), MAX(date), COUNT(*), MAX(id) FROM transactions").fetchone()
+        expense_row = conn.execute("SELECT c.id FROM categories c JOIN budgets b ON b.category_id = c.id WHERE c.type = 'expense' ORDER BY b.month DESC LIMIT 1").fetchone()
+        if expense_row is None: expense_row = conn.execute("SELECT id FROM categories WHERE type = 'expense' ORDER BY id LIMIT 1").fetchone()
+        account_id = conn.execute("SELECT id FROM accounts ORDER BY id LIMIT 1").fetchone()
+        description = conn.execute("SELECT description FROM transactions WHERE id = ?", (transaction_id,)).fetchone() if transaction_id else None
+    if not transaction_count or account_id is None: raise ValueError("The ledger needs at least one account and one transaction.")
+    last_month = last_date[:7]; year_ago = (datetime.date.fromisoformat(last_date) - datetime.timedelta(days=364)).isoformat()
+    matrix_start_index = int(last_month[:4]) * 12 + int(last_month[5:]) - 1 - 11 # 12 months ending at last_month
+    return {'first_date': first_date, 'last_date': last_date, 'year_ago': year_ago, 'last_month': last_month, 'transactions': transaction_count,
+            'transaction_id': transaction_id, 'account_id': account_id[0], 'category_id': expense_row[0] if expense_row else None,
+            'search_term': (description[0].split() or ['a'])[0] if description else 'a',
+            'matrix_start': f"{matrix_start_index // 12:04d}-{matrix_start_index % 12 + 1:02d}"}
+
+def database_cases(ctx: Dict[str, Any], scratch: Path) -> List[Case]:
+    unique = count(1); acc, cat, month = ctx['account_id'], ctx['category_id'], ctx['last_month']
+    full_range, last_year = (ctx['first_date'], ctx['last_date']), (ctx['year_ago'], ctx['last_date'])
+    year_filter = {'start_date': ctx['year_ago'], 'end_date': ctx['last_date']}
+    new_row = lambda: (acc, ctx['last_date'], f"Bench row {next(unique)}", Decimal('-12.34'), cat)
+    return [
+        Case('db.initialize_db', database.initialize_db),
+        Case('db.get_accounts', database.get_accounts, rows=len),
+        Case('db.get_categories', database.get_categories, rows=len),
+        Case('db.get_account_current_balance', lambda: database.get_account_current_balance(acc)),
+        Case('db.get_account_balances_summary', database.get_account_balances_summary, rows=lambda r: len(r['accounts'])),
+        Case('db.get_all_accounts_with_balances', database.get_all_accounts_with_balances, rows=len),
+        Case('db.get_total_net_balance', database.get_total_net_balance),
+        Case('db.get_transactions[limit=500]', lambda: database.get_transactions(limit=500), rows=len),
+        Case('db.get_transactions[limit=500,columnar]', lambda: database.get_transactions(limit=500, columnar=True), rows=lambda r: r['row_count']),
+        Case('db.get_transactions[account,running_balance]', lambda: database.get_transactions(account_id=acc, limit=500, include_running_balance=True), rows=len),
+        Case('db.query_transactions[first_page]', lambda: database.query_transactions(), rows=lambda r: len(r['transactions'])),
+        Case('db.query_transactions[second_page]', lambda cursor: database.query_transactions(cursor=cursor, include_total=False),
+             setup=lambda: (database.query_transactions(include_total=False)['next_cursor'],), rows=lambda r: len(r['transactions'])),
+        Case('db.query_transactions[year,category]', lambda: database.query_transactions(dict(year_filter, category_ids=[cat])), rows=lambda r: len(r['transactions'])),
+        Case('db.query_transactions[columnar]', lambda: database.query_transactions(columnar=True), rows=lambda r: r['transactions']['row_count']),
+        Case('db.iter_transaction_chunks[last_year]', lambda: _drain(database.iter_transaction_chunks(year_filter)), rows=lambda r: r),
+        Case('db.search_transactions', lambda: database.search_transactions(ctx['search_term']), rows=len),
+        Case('db.get_transaction_by_id', lambda: database.get_transaction_by_id(ctx['transaction_id'])),
+        Case('db.get_budgets_for_month', lambda: database.get_budgets_for_month(month), rows=len),
+        Case('db.get_spending_for_category_month', lambda: database.get_spending_for_category_month(cat, month)),
+        Case('db.get_budget_vs_actual_for_month', lambda: database.get_budget_vs_actual_for_month(month), rows=len),
+        Case('db.get_budget_matrix[12_months]', lambda: database.get_budget_matrix(ctx['matrix_start'], month), rows=lambda r: len(r['categories'])),
+        Case('db.get_spending_by_category[full_range]', lambda: database.get_spending_by_category(*full_range), rows=len),
+        Case('db.get_spending_by_category[last_year]', lambda: database.get_spending_by_category(*last_year), rows=len),
+        Case('db.get_income_expense_summary_for_month', lambda: database.get_income_expense_summary_for_month(month)),
+        Case('db.get_daily_account_flows[full_range]', lambda: database.get_daily_account_flows(ctx['first_date'], ctx['last_date']), rows=lambda r: len(r[1])),
+        Case('db.get_setting', lambda: database.get_setting('theme')),
+        Case('db.set_setting', lambda: database.set_setting('bench', str(next(unique)))),
+        Case('db.get_cache_stats', database.get_cache_stats),
+        Case('db.check_query_plans', database.check_query_plans),
+        Case('db.verify_monthly_rollups', database.verify_monthly_rollups),
+        Case('db.rebuild_monthly_rollups', database.rebuild_monthly_rollups, rows=lambda r: r),
+        Case('db.find_duplicate_transaction', lambda: database.find_duplicate_transaction(*new_row()[:4])),
+        Case('db.find_duplicates[3_days]', lambda: database.find_duplicates(3), rows=lambda r: r['transaction_count']),
+        Case('db.add_transaction', lambda: database.add_transaction(*new_row())),
+        Case('db.bulk_insert_transactions', database.bulk_insert_transactions, setup=lambda: ([new_row() for _ in range(BULK_INSERT_ROWS)],), rows=lambda r: r),
+        Case('db.update_transaction', lambda: database.update_transaction(ctx['transaction_id'], *new_row())),
+        Case('db.delete_transaction', database.delete_transaction, setup=lambda: (database.add_transaction(*new_row()),)),
+        Case('db.add_category', lambda: database.add_category(f"Bench category {next(unique)}")),
+        Case('db.update_category', database.update_category, setup=lambda: (database.add_category(f"Bench category {next(unique)}"), f"Bench renamed {next(unique)}", 'expense')),
+        Case('db.delete_category', database.delete_category, setup=lambda: (database.add_category(f"Bench category {next(unique)}"),)),
+        Case('db.set_budget', lambda: database.set_budget(cat, month, Decimal(next(unique)))),
+        Case('db.add_account', lambda: database.add_account(f"Bench account {next(unique)}")),
+        Case('db.update_account', lambda: database.update_account(acc, f"Bench account {next(unique)}", Decimal('100.00'))),
+        Case('db.delete_account', database.delete_account, setup=lambda: (database.add_account(f"Bench account {next(unique)}"),)),
+        Case('analytics.get_balance_history[daily,full_range]', lambda: analytics.get_balance_history(*full_range, 'daily'), rows=lambda r: r['row_count']),
+        Case('analytics.get_balance_history[monthly,full_range]', lambda: analytics.get_balance_history(*full_range, 'monthly'), rows=lambda r: r['row_count']),
+        Case('rules.get_matcher[compile]', rules.get_matcher.uncached),
+        Case('rules.apply_rules[uncategorized]', lambda: rules.apply_rules('uncategorized'), rows=lambda r: r['rows_scanned']),
+        Case('rules.apply_rules[all,last_year]', lambda: rules.apply_rules('all', year_filter), rows=lambda r: r['rows_scanned']),
+        Case('exporter.export_transactions[csv]', lambda: exporter.export_transactions(str(scratch / 'export.csv'), 'csv'), rows=lambda r: r['rows_written']),
+        Case('exporter.export_transactions[xlsx,last_year]', lambda: exporter.export_transactions(str(scratch / 'export.xlsx'), 'xlsx', year_filter), rows=lambda r: r['rows_written']),
+    ]
+
+def api_cases(ctx: Dict[str, Any]) -> List[Case]:
+    """Api methods as the frontend calls them (string arguments, JSON string results). Needs main's dependencies."""
+    import main
+    api = main.Api()
+    return [
+        Case('api.get_dashboard_data', api.get_dashboard_data),
+        Case('api.get_budget_data_for_month', lambda: api.get_budget_data_for_month(ctx['last_month'])),
+        Case('api.get_transactions[limit=500]', lambda: api.get_transactions(None, '500'), rows=lambda r: len(json.loads(r)['data']['transactions'])),
+        Case('api.get_transactions[limit=500,columnar]', lambda: api.get_transactions(None, '500', None, 'columnar'), rows=lambda r: json.loads(r)['data']['transactions']['row_count']),
+        Case('api.query_transactions', lambda: api.query_transactions(), rows=lambda r: len(json.loads(r)['data']['transactions'])),
+        Case('api.get_spending_by_category_report', lambda: api.get_spending_by_category_report(ctx['first_date'], ctx['last_date'])),
+        Case('api.get_balance_history[daily]', lambda: api.get_balance_history(ctx['first_date'], ctx['last_date'], 'daily')),
+    ]
+
+def run_case(case: Case, repeat: int, max_seconds: float, warm: bool, trace_memory: bool) -> Dict[str, Any]:
+    """Times up to repeat runs of case (cache cleared before each unless warm) and summarizes them."""
+    timings: List[float] = []; result_info: Dict[str, Any] = {}; deadline = time.perf_counter() + max_seconds
+    for iteration in range(repeat):
+        args = case.setup() if case.setup else ()
+        if not warm or iteration == 0: database.invalidate_cache()
+        started = time.perf_counter(); result = case.func(*args); timings.append(time.perf_counter() - started)
+        if iteration == 0:
+            if case.rows: result_info['rows'] = int(case.rows(result))
+            if isinstance(result, str): result_info['response_bytes'] = len(result.encode('utf-8'))
+        if time.perf_counter() > deadline: break
+    ordered = sorted(timings); summary: Dict[str, Any] = {'runs': len(timings)}
+    for label, percent in (('p50', 50), ('p90', 90), ('p99', 99)): summary[f"{label}_ms"] = round(_percentile(ordered, percent) * 1000, 4)
+    summary.update(mean_ms=round(sum(timings) / len(timings) * 1000, 4), min_ms=round(ordered[0] * 1000, 4), max_ms=round(ordered[-1] * 1000, 4), **result_info)
+    if 'rows' in summary and summary['p50_ms'] > 0: summary['rows_per_sec'] = round(summary['rows'] / (summary['p50_ms'] / 1000))
+    if trace_memory:
+        args = case.setup() if case.setup else ()
+        if not warm: database.invalidate_cache()
+        tracemalloc.start()
+        try: case.func(*args); summary['peak_kib'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally: tracemalloc.stop()
+    return summary
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> List[Dict[str, Any]]:
+    """Returns the cases whose p50 grew by more than threshold (and min_delta_ms) against baseline."""
+    regressions = []
+    for name, result in current['cases'].items():
+        old = baseline.get('cases', {}).get(name, {})
+        if 'p50_ms' not in result or 'p50_ms' not in old: continue
+        if result['p50_ms'] > old['p50_ms'] * (1 + threshold) and result['p50_ms'] - old['p50_ms'] >= min_delta_ms:
+            regressions.append({'case': name, 'baseline_p50_ms': old['p50_ms'], 'p50_ms': result['p50_ms'], 'change': round(result['p50_ms'] / old['p50_ms'] - 1, 3) if old['p50_ms'] else None})
+    return regressions
+
+def _print_table(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    print(f"{'case':<52} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'rows/s':>12} {'peak KiB':>10} {'vs base':>8}")
+    for name, result in results['cases'].items():
+        if 'skipped' in result: print(f"{name:<52} skipped: {result['skipped']}"); continue
+        old = (baseline or {}).get('cases', {}).get(name, {}).get('p50_ms')
+        change = f"{(result['p50_ms'] / old - 1) * 100:+.0f}%" if old else ''
+        print(f"{name:<52} {result['p50_ms']:>10.3f} {result['p90_ms']:>10.3f} {result['p99_ms']:>10.3f} {result.get('rows_per_sec', ''):>12} {result.get('peak_kib', ''):>10} {change:>8}")
+
+def run_benchmarks(db_path: Path, scratch: Path, repeat: int = DEFAULT_REPEAT, max_seconds: float = DEFAULT_MAX_SECONDS, warm: bool = False,
+                   trace_memory: bool = True, include_api: bool = True, only: Optional[str] = None) -> Dict[str, Any]:
+    """Benchmarks a copy of db_path (made inside scratch) and returns the JSON-ready results."""
+    copy_path = scratch / 'bench.db'; _copy_database(db_path, copy_path)
+    database.set_db_file(copy_path); database.initialize_db(); ctx = _ledger_context()
+    cases = database_cases(ctx, scratch); skipped: Dict[str, str] = {}
+    if include_api:
+        try: cases += api_cases(ctx)
+        except ImportError as e: skipped['api.*'] = f"main could not be imported ({e})"
+    results: Dict[str, Any] = {
+        'meta': {'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'), 'source_db': str(db_path), 'transactions': ctx['transactions'],
+                 'repeat': repeat, 'warm_cache': warm, 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform()},
+        'cases': {}, 'query_plan_failures': database.check_query_plans(),
+    }
+    for case in cases:
+        if only and only not in case.name: continue
+        try: results['cases'][case.name] = run_case(case, repeat, max_seconds, warm, trace_memory)
+        except (ImportError, ValueError) as e: results['cases'][case.name] = {'skipped': str(e)} # e.g. numpy/openpyxl missing
+        logging.debug(f"{case.name}: {results['cases'][case.name]}")
+    for name, reason in skipped.items(): results['cases'][name] = {'skipped': reason}
+    database.close_db_connections()
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the data layer and Api methods.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--db', type=Path, help="Ledger to benchmark (copied first; never modified)")
+    source.add_argument('--transactions', type=int, default=100000, help="Generate a ledger of this size when --db is not given")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--max-seconds', type=float, default=DEFAULT_MAX_SECONDS, help="Time budget per case")
+    parser.add_argument('--warm', action='store_true', help="Keep the read cache between runs (default: every run is cold)")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the traced run that measures peak memory")
+    parser.add_argument('--no-api', action='store_true', help="Only benchmark the data layer")
+    parser.add_argument('--only', help="Run cases whose name contains this text")
+    parser.add_argument('--out', type=Path, help="Write results JSON here")
+    parser.add_argument('--baseline', type=Path, help="Earlier results JSON; exit 1 on p50 regressions")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    baseline = json.loads(args.baseline.read_text(encoding='utf-8')) if args.baseline else None
+
+    with tempfile.TemporaryDirectory(prefix='financxpert-bench-') as scratch_dir:
+        scratch = Path(scratch_dir)
+        if args.db: db_path = args.db
+        else: db_path = scratch / 'generated.db'; generate.generate_ledger(str(db_path), transactions=args.transactions, seed=args.seed); database.close_db_connections()
+        results = run_benchmarks(db_path, scratch, args.repeat, args.max_seconds, args.warm, not args.no_memory, not args.no_api, args.only)
+    if not args.db: results['meta']['generated'] = {'transactions': args.transactions, 'seed': args.seed}
+
+    _print_table(results, baseline)
+    for name, plan in results['query_plan_failures'].items(): print(f"Query plan check failed for {name}: {plan}")
+    status = 0
+    if baseline is not None:
+        results['regressions'] = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for regression in results['regressions']: print(f"REGRESSION {regression['case']}: {regression['baseline_p50_ms']} ms -> {regression['p50_ms']} ms")
+        status = 1 if results['regressions'] or results['query_plan_failures'] else 0
+    if args.out: args.out.write_text(json.dumps(results, indent=2), encoding='utf-8')
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+# analytics.py
+"""Balance and cash-flow time series for the reports view.
+
+A series is built from two grouped reads (opening balances, and net/income per day and account over the range),
+which NumPy then buckets into periods and accumulates with a cumulative sum seeded from the opening balances.
+No query runs per period, so a ten-year daily series costs about the same as a monthly one. NumPy is imported
+on first use, keeping it off the application's startup path."""
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from . import database
+except ImportError:
+    import database
+
+GRANULARITIES = ('daily', 'weekly', 'monthly')
+MAX_HISTORY_POINTS = 10000  # Per series; about 27 years of daily points
+
+def _numpy():
+    try: import numpy
+    except ImportError as e: raise ValueError("Balance history requires the 'numpy' package.") from e
+    return numpy
+
+def _period_buckets(np, days, start, end_exclusive, granularity: str) -> Tuple[Any, Any, int]:
+    """Maps datetime64[D] days to period indexes. Returns (bucket per day, period start per bucket, period count);
+    weeks start on Monday, and the first period starts at the range start even when it is a partial one."""
+    last = end_exclusive - np.timedelta64(1, 'D')
+    if granularity == 'daily':
+        return (days - start).astype(np.int64), start + np.arange((last - start).astype(np.int64) + 1), int((last - start).astype(np.int64)) + 1
+    if granularity == 'weekly':
+        origin = start - np.timedelta64((start.astype(np.int64) + 3) % 7, 'D') # 1970-01-01 was a Thursday
+        count = int((last - origin).astype(np.int64) // 7) + 1
+        return (days - origin).astype(np.int64) // 7, np.maximum(origin + 7 * np.arange(count), start), count
+    origin = start.astype('datetime64[M]'); count = int((last.astype('datetime64[M]') - origin).astype(np.int64)) + 1
+    return (days.astype('datetime64[M]') - origin).astype(np.int64), origin + np.arange(count), count
+
+@database.cached('accounts', 'transactions')
+def get_balance_history(start_date: str, end_date: str, granularity: str = 'monthly', account_ids: Optional[Tuple[int, ...]] = None) -> Dict[str, Any]:
+    """Returns closing balances per period for each account (all accounts, or account_ids) and their total, plus
+    income and expense flows per period, over the inclusive range. Amounts are integer cents:
+    {'granularity', 'periods', 'accounts': [{'id', 'name', 'balance_cents'}], 'total_balance_cents', 'income_cents',
+    'expense_cents', 'row_count'}. Daily/weekly periods are labelled YYYY-MM-DD, monthly ones YYYY-MM.
+    Raises ValueError for an invalid range, granularity or account."""
+    if granularity not in GRANULARITIES: raise ValueError(f"Granularity must be one of {', '.join(GRANULARITIES)}.")
+    start_str, end_exclusive_str = database._date_range_params(start_date, end_date)
+    if start_str >= end_exclusive_str: raise ValueError("Start date cannot be after end date.")
+    accounts = [acc for acc in database.get_accounts() if account_ids is None or acc['id'] in account_ids]
+    missing = set(account_ids or ()) - {acc['id'] for acc in accounts}
+    if missing: raise ValueError(f"Account ID {min(missing)} does not exist.")
+    np = _numpy()
+    start, end_exclusive = np.datetime64(start_str, 'D'), np.datetime64(end_exclusive_str, 'D')
+    _, period_starts, period_count = _period_buckets(np, start, start, end_exclusive, granularity)
+    if period_count > MAX_HISTORY_POINTS: raise ValueError(f"Range has {period_count} {granularity} periods; the maximum is {MAX_HISTORY_POINTS}.")
+
+    opening, flows = database.get_daily_account_flows(start_str, end_exclusive_str)
+    account_index = np.array([acc['id'] for acc in accounts], dtype=np.int64); order = np.argsort(account_index)
+    net = np.zeros((len(accounts), period_count), dtype=np.int64); income = np.zeros(period_count, dtype=np.int64)
+    if flows and accounts:
+        days, flow_accounts, flow_net, flow_income = zip(*flows)
+        flow_accounts = np.array(flow_accounts, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(account_index[order], flow_accounts), len(accounts) - 1)
+        selected = account_index[order][positions] == flow_accounts # Drops accounts outside account_ids
+        buckets = _period_buckets(np, np.array(days, dtype='datetime64[D]'), start, end_exclusive, granularity)[0][selected]
+        np.add.at(net, (order[positions[selected]], buckets), np.array(flow_net, dtype=np.int64)[selected])
+        np.add.at(income, buckets, np.array(flow_income, dtype=np.int64)[selected])
+    balances = np.array([opening.get(acc['id'], 0) for acc in accounts], dtype=np.int64)[:, None] + np.cumsum(net, axis=1)
+
+    unit = 'M' if granularity == 'monthly' else 'D'
+    return {
+        'granularity': granularity, 'periods': np.datetime_as_string(period_starts, unit=unit).tolist(),
+        'accounts': [{'id': acc['id'], 'name': acc['name'], 'balance_cents': series.tolist()} for acc, series in zip(accounts, balances)],
+        'total_balance_cents': balances.sum(axis=0).tolist(), 'income_cents': income.tolist(), 'expense_cents': (income - net.sum(axis=0)).tolist(),
+        'row_count': period_count,
+    }
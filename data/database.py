@@ -1,35 +1,55 @@
 # database.py
 import sqlite3
+import os
+import time
 import sys
 from pathlib import Path
 import logging
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
-from typing import List, Optional, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any, Iterable, Iterator
+from itertools import islice
+from collections import OrderedDict
+from functools import wraps
 from contextlib import contextmanager
+import datetime
+import threading
+import json
+import base64
+import binascii
+import html
+import hashlib
+
+try:
+    from . import profiling
+except ImportError:
+    import profiling
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - DB - %(message)s')
 
 # --- Decimal Adapters for SQLite ---
-def adapt_decimal(d: Decimal) -> str:
-    return str(d)
+# Monetary columns are stored as INTEGER minor units (cents). Decimals are written as cents
+# and read back through the CENTS converter (select amounts as "col [CENTS]").
+CENTS = Decimal('0.01')
+
+def adapt_decimal(d: Decimal) -> int:
+    return int((d * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
 
-def convert_decimal(s: bytes) -> Decimal:
+def convert_cents(s: bytes) -> Decimal:
     try:
         decoded = s.decode('utf-8')
         if not decoded:
-            # logging.warning("Empty string encountered converting DECIMAL. Returning 0.00") # Less noisy
             return Decimal('0.00')
-        return Decimal(decoded)
+        return Decimal(decoded).scaleb(-2).quantize(CENTS, rounding=ROUND_HALF_UP)
     except InvalidOperation:
-        logging.warning(f"Could not convert '{s.decode('utf-8')}' to Decimal. Returning 0.00")
+        logging.warning(f"Could not convert '{s.decode('utf-8')}' cents to Decimal. Returning 0.00")
         return Decimal('0.00')
     except UnicodeDecodeError:
         logging.error(f"Could not decode bytes '{s}' as utf-8. Returning 0.00")
         return Decimal('0.00')
 
 sqlite3.register_adapter(Decimal, adapt_decimal)
-sqlite3.register_converter("DECIMAL", convert_decimal)
+sqlite3.register_converter("CENTS", convert_cents)
 
 # Database file path
 if getattr(sys, 'frozen', False):
@@ -41,100 +61,577 @@ else:
 DB_FILE = base_path / "personal_finance.db"
 logging.info(f"Database file path determined as: {DB_FILE}")
 
-@contextmanager
-def get_db_connection():
-    """Yields a database connection configured for Decimal."""
-    conn = None
-    try:
-        # Ensure directory exists (useful if running from different locations)
+# --- Connection Settings ---
+STATEMENT_CACHE_SIZE = 256        # Prepared statements kept per connection (sqlite3 LRU)
+PAGE_CACHE_KIB = 32768            # PRAGMA cache_size (negative value = KiB)
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+MAX_IDLE_CONNECTIONS = 4          # Idle connections kept open for reuse
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection that remembers which database file it was opened on."""
+    db_path: str = ''
+    data_version: Optional[int] = None # Last PRAGMA data_version seen, for external change detection
+
+    # While profiling is enabled, statements run through profiling.ProfilingCursor (Connection.execute does
+    # not go through cursor(), so it is routed explicitly).
+    def cursor(self, factory=None):
+        return super().cursor(factory or (profiling.ProfilingCursor if profiling.enabled else sqlite3.Cursor))
+
+    def execute(self, sql, parameters=()):
+        if profiling.enabled: return self.cursor(profiling.ProfilingCursor).execute(sql, parameters)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if profiling.enabled: return self.cursor(profiling.ProfilingCursor).executemany(sql, seq_of_parameters)
+        return super().executemany(sql, seq_of_parameters)
+
+class ConnectionPool:
+    """Keeps long-lived, pre-configured connections for reuse across calls and threads.
+
+    A connection is checked out by one thread at a time (pywebview runs each JS call
+    on its own short-lived thread, so plain thread-locals would leak connections).
+    Nested get_db_connection() calls on the same thread reuse the checked-out connection
+    and only the outermost block commits or rolls back.
+    """
+    def __init__(self, max_idle: int = MAX_IDLE_CONNECTIONS):
+        self.max_idle = max_idle
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def _open(self) -> PooledConnection:
         DB_FILE.parent.mkdir(parents=True, exist_ok=True)
-        conn = sqlite3.connect(DB_FILE, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        conn = sqlite3.connect(DB_FILE, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE, factory=PooledConnection)
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL") # Safe with WAL, avoids an fsync per commit
+        conn.execute(f"PRAGMA cache_size = -{PAGE_CACHE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.db_path = str(DB_FILE)
+        logging.debug(f"Opened new pooled connection to {DB_FILE}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            self._closed = False
+            while self._idle:
+                conn = self._idle.pop() # LIFO keeps the warmest connection in use
+                if getattr(conn, 'db_path', None) == str(DB_FILE): return conn
+                conn.close() # DB_FILE changed since this connection was opened
+        return self._open()
+
+    def release(self, conn: sqlite3.Connection):
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle and getattr(conn, 'db_path', None) == str(DB_FILE):
+                self._idle.append(conn); return
+        conn.close()
+
+    def close_all(self):
+        """Closes every idle connection. Call once at application shutdown."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._closed = True
+        for conn in idle:
+            try: conn.close()
+            except sqlite3.Error as e: logging.warning(f"Error closing pooled connection: {e}")
+        logging.info(f"Closed {len(idle)} pooled database connection(s).")
+
+_pool = ConnectionPool()
+
+@contextmanager
+def get_db_connection():
+    """Yields a pooled database connection configured for Decimal.
+
+    The outermost block commits on success and rolls back on any exception;
+    nested blocks on the same thread share that connection and transaction.
+    """
+    local = _pool._local
+    conn = getattr(local, 'conn', None)
+    if conn is not None:
+        local.depth += 1
+        try: yield conn
+        except sqlite3.Error: local.errors = getattr(local, 'errors', 0) + 1; raise
+        finally: local.depth -= 1
+        return
+
+    global _last_activity
+    if not getattr(local, 'background', False): _last_activity = time.monotonic()
+    conn = _pool.acquire()
+    local.conn = conn; local.depth = 1; local.dirty = set()
+    try:
         yield conn
         conn.commit()
     except sqlite3.Error as e:
+        local.errors = getattr(local, 'errors', 0) + 1
         logging.error(f"Database error: {e}")
-        if conn:
-            conn.rollback()
+        conn.rollback()
+        raise
+    except BaseException:
+        conn.rollback()
         raise
     finally:
-        if conn:
-            conn.close()
+        dirty, local.dirty = local.dirty, set()
+        profiling.flush_statements()
+        local.conn = None; local.depth = 0
+        _pool.release(conn)
+        if dirty: _bump_generations(dirty) # Only once the writes are committed (or rolled back)
+
+_last_activity = time.monotonic() # When a database call last started outside background_work()
+
+def idle_seconds() -> float:
+    """Seconds since a database call last started, not counting those made inside background_work()."""
+    return time.monotonic() - _last_activity
+
+@contextmanager
+def background_work():
+    """Database calls made on this thread inside the block do not count as activity for idle_seconds()."""
+    local = _pool._local; previous = getattr(local, 'background', False); local.background = True
+    try: yield
+    finally: local.background = previous
+
+@contextmanager
+def snapshot_transaction(write: bool = False):
+    """Runs every database call in the block on one connection inside one transaction, so all reads see
+    the same snapshot of the database; writes made in the block commit together when it ends.
+    Pass write=True when the block may write: the write lock is then taken up front (BEGIN IMMEDIATE, waiting
+    out other writers). A deferred transaction that reads first cannot take it later once another connection
+    has committed (SQLITE_BUSY_SNAPSHOT, which the busy timeout does not retry), so its first write would fail."""
+    with get_db_connection() as conn:
+        if not conn.in_transaction: conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        yield conn
+
+def close_db_connections():
+    """Closes all pooled connections (explicitly called at app shutdown)."""
+    _drop_snapshot(); _pool.close_all()
+
+def set_pool_size(max_idle: int):
+    """Sets how many idle connections the pool keeps open; match it to the number of threads issuing calls
+    concurrently (e.g. the --serve concurrency) so busy periods do not open and close connections."""
+    if max_idle < 1: raise ValueError("Pool size must be at least 1.")
+    with _pool._lock: _pool.max_idle = max_idle
+
+def set_db_file(path) -> Path:
+    """Points the data layer at another database file (benchmarks, scripts). Pooled connections to the previous
+    file are closed and the read cache is cleared; call initialize_db() before using a new or older file."""
+    global DB_FILE
+    DB_FILE = Path(path).resolve(); _drop_snapshot(); _pool.close_all(); invalidate_cache()
+    logging.info(f"Database file path set to: {DB_FILE}")
+    return DB_FILE
+
+# --- Read Cache ---
+# Read functions decorated with @cached(tables...) are memoized by (function, args, generation of each table
+# they read). Writers decorated with @invalidates(tables...) bump those generations once their transaction
+# has ended, so stale entries are simply never looked up again and age out of the LRU. Commits from other
+# processes are detected through PRAGMA data_version and invalidate everything.
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_MAX_ROWS = 5000 # Larger results (e.g. an unlimited get_transactions) are not kept
+_cache_lock = threading.Lock()
+_result_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+_table_generations: Dict[str, int] = {}
+_cache_epoch = 0 # Bumped by invalidate_cache(); part of every key
+_cache_stats = {'hits': 0, 'misses': 0}
+
+def _bump_generations(tables: Iterable[str]):
+    with _cache_lock:
+        for table in tables: _table_generations[table] = _table_generations.get(table, 0) + 1
+
+def _mark_dirty(tables: Iterable[str]):
+    """Records a write to tables; deferred to the end of the enclosing transaction when there is one."""
+    local = _pool._local
+    if getattr(local, 'conn', None) is not None: local.dirty.update(tables)
+    else: _bump_generations(tables)
+
+def invalidate_cache():
+    """Drops every cached result (e.g. after the database file was changed externally or replaced)."""
+    global _cache_epoch
+    with _cache_lock: _cache_epoch += 1; _result_cache.clear()
+
+def _sync_external_changes():
+    """Invalidates the cache when another connection committed since this connection last looked. A connection
+    seen for the first time has no baseline, so it invalidates too; that only happens when the pool opens one."""
+    with get_db_connection() as conn:
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        previous = getattr(conn, 'data_version', None); conn.data_version = version
+    if previous != version: invalidate_cache()
+
+def cached(*tables: str):
+    """Memoizes a read function against the generations of the tables it reads. Results are shared between
+    callers and must be treated as read-only. Errors (sqlite3.Error seen by get_db_connection) are not cached,
+    nor are reads made inside an open transaction: it reads its own snapshot (and its own uncommitted writes),
+    which commits from other connections made since do not reach, while the generations it would be keyed on do."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            local = _pool._local
+            if getattr(local, 'conn', None) is not None and local.conn.in_transaction: return func(*args, **kwargs)
+            _sync_external_changes()
+            with _cache_lock: key = (func.__name__, args, tuple(sorted(kwargs.items())), str(DB_FILE), _cache_epoch, tuple(_table_generations.get(t, 0) for t in tables))
+            try:
+                with _cache_lock:
+                    if key in _result_cache: _result_cache.move_to_end(key); _cache_stats['hits'] += 1; return _result_cache[key]
+            except TypeError: return func(*args, **kwargs) # Unhashable arguments: not cacheable
+            errors_before = getattr(local, 'errors', 0); result = func(*args, **kwargs)
+            too_large = len(result) > RESULT_CACHE_MAX_ROWS if isinstance(result, list) else isinstance(result, dict) and result.get('row_count', 0) > RESULT_CACHE_MAX_ROWS
+            if getattr(local, 'errors', 0) == errors_before and not too_large:
+                with _cache_lock:
+                    _cache_stats['misses'] += 1; _result_cache[key] = result
+                    while len(_result_cache) > RESULT_CACHE_SIZE: _result_cache.popitem(last=False)
+            return result
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+def invalidates(*tables: str):
+    """Marks a write function: the generations of tables are bumped after it runs (even if it fails)."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try: return func(*args, **kwargs)
+            finally: _mark_dirty(tables)
+        return wrapper
+    return decorator
+
+def get_cache_stats() -> Dict[str, Any]:
+    with _cache_lock: stats = dict(_cache_stats, size=len(_result_cache), max_size=RESULT_CACHE_SIZE)
+    with _snapshot_lock: stats['snapshot'] = dict(_snapshot_stats, enabled=_snapshot_enabled, loaded=_snapshot_conn is not None)
+    return stats
+
+# --- Analytics Snapshot ---
+# Opt-in: report and query functions read through get_read_connection(), which hands out a :memory: copy of the
+# database (made with the sqlite backup API) whenever that copy is current, so hot reads are served from RAM on
+# a connection writers never touch. "Current" means the copy was taken at the present cache state (epoch and
+# table generations, so external commits count too); a read that finds it stale uses a pooled connection to the
+# file as before and schedules a background refresh, so reports are never stale and never wait for a copy.
+# Writes after a burst are folded into one refresh. The copy is replaced, never modified, and an old one is
+# freed once the last reader holding it is done.
+SNAPSHOT_MAX_BYTES = 512 * 1024 * 1024 # Larger databases are not copied into memory
+SNAPSHOT_REFRESH_DELAY_SECONDS = 0.5
+_snapshot_lock = threading.Lock()
+_snapshot_enabled = False
+_snapshot_conn: Optional[sqlite3.Connection] = None
+_snapshot_state: Optional[tuple] = None
+_snapshot_timer: Optional[threading.Timer] = None
+_snapshot_stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'last_refresh_ms': None}
+
+def _cache_state() -> tuple:
+    with _cache_lock: return (str(DB_FILE), _cache_epoch, tuple(sorted(_table_generations.items())))
+
+def _drop_snapshot():
+    global _snapshot_conn, _snapshot_state, _snapshot_timer
+    with _snapshot_lock:
+        if _snapshot_timer is not None: _snapshot_timer.cancel()
+        _snapshot_conn = None; _snapshot_state = None; _snapshot_timer = None
+
+def _refresh_snapshot():
+    """Copies the database into a new :memory: connection and publishes it with the state it was copied at."""
+    global _snapshot_conn, _snapshot_state, _snapshot_timer
+    with _snapshot_lock: _snapshot_timer = None
+    if not _snapshot_enabled: return
+    _sync_external_changes(); state = _cache_state(); started = time.perf_counter() # State first: a write landing mid-copy makes it stale, never wrongly current
+    try:
+        with get_db_connection() as source:
+            size = source.execute("PRAGMA page_count").fetchone()[0] * source.execute("PRAGMA page_size").fetchone()[0]
+            if size > SNAPSHOT_MAX_BYTES: logging.warning(f"Database is {size // 2**20} MiB; not kept in memory (limit {SNAPSHOT_MAX_BYTES // 2**20} MiB)."); return
+            snapshot = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES, check_same_thread=False,
+                                       cached_statements=STATEMENT_CACHE_SIZE, factory=PooledConnection)
+            source.backup(snapshot)
+        snapshot.row_factory = sqlite3.Row; snapshot.execute("PRAGMA query_only = ON"); snapshot.db_path = ':memory:'
+    except sqlite3.Error as e: logging.error(f"Error refreshing analytics snapshot: {e}"); return
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    with _snapshot_lock:
+        if not _snapshot_enabled or state[0] != str(DB_FILE): return
+        _snapshot_conn = snapshot; _snapshot_state = state; _snapshot_stats['refreshes'] += 1; _snapshot_stats['last_refresh_ms'] = elapsed_ms
+    logging.debug(f"Analytics snapshot refreshed in {elapsed_ms} ms ({size // 1024} KiB).")
+
+def _schedule_snapshot_refresh(delay: float = SNAPSHOT_REFRESH_DELAY_SECONDS):
+    global _snapshot_timer
+    with _snapshot_lock:
+        if _snapshot_timer is not None or not _snapshot_enabled: return
+        _snapshot_timer = threading.Timer(delay, _refresh_snapshot); _snapshot_timer.daemon = True; _snapshot_timer.start()
+
+def configure_analytics_snapshot(enabled: bool):
+    """Turns the in-memory analytics snapshot on (first copy made in the background) or off (copy freed).
+    Requires an SQLite build whose connections may be shared between threads (sqlite3.threadsafety 3)."""
+    global _snapshot_enabled
+    if enabled and sqlite3.threadsafety != 3: raise ValueError("This SQLite build cannot share a connection between threads.")
+    with _snapshot_lock: _snapshot_enabled = bool(enabled)
+    if enabled: _schedule_snapshot_refresh(0)
+    else: _drop_snapshot()
+    logging.info(f"Analytics snapshot {'enabled' if enabled else 'disabled'}.")
+
+@contextmanager
+def get_read_connection():
+    """Yields a connection for read-only queries: the analytics snapshot when it is enabled and current, else
+    (also inside a transaction, which must see its own writes) a pooled connection via get_db_connection()."""
+    if _snapshot_enabled and getattr(_pool._local, 'conn', None) is None:
+        _sync_external_changes(); state = _cache_state()
+        with _snapshot_lock:
+            snapshot = _snapshot_conn if _snapshot_state == state else None
+            _snapshot_stats['hits' if snapshot is not None else 'misses'] += 1
+        if snapshot is not None:
+            local = _pool._local
+            try: yield snapshot
+            except sqlite3.Error as e: local.errors = getattr(local, 'errors', 0) + 1; logging.error(f"Database error (analytics snapshot): {e}"); raise
+            finally: profiling.flush_statements()
+            return
+        _schedule_snapshot_refresh()
+    with get_db_connection() as conn: yield conn
+
+# --- Schema ---
+# Canonical table definitions, shared by initialize_db and the table-rebuilding migrations.
+_TABLE_DDL = {
+    'accounts': """CREATE TABLE IF NOT EXISTS "{name}" (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+        initial_balance INTEGER NOT NULL DEFAULT 0, /* Stored as cents */
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    'categories': """CREATE TABLE IF NOT EXISTS "{name}" (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+        type TEXT NOT NULL CHECK(type IN ('expense', 'income')) DEFAULT 'expense',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    'transactions': """CREATE TABLE IF NOT EXISTS "{name}" (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account_id INTEGER NOT NULL,
+        date TEXT NOT NULL, -- Store dates as ISO8601 strings (YYYY-MM-DD)
+        description TEXT NOT NULL COLLATE NOCASE,
+        amount INTEGER NOT NULL, /* Stored as cents */
+        category_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fingerprint INTEGER, -- transaction_fingerprint() of (account, date, amount, description), for duplicate checks
+        FOREIGN KEY (account_id) REFERENCES accounts (id) ON DELETE CASCADE,
+        FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE SET NULL
+    )""",
+    'budgets': """CREATE TABLE IF NOT EXISTS "{name}" (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER NOT NULL,
+        month TEXT NOT NULL, -- Store month as YYYY-MM string
+        amount INTEGER NOT NULL DEFAULT 0, /* Stored as cents */
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (category_id, month),
+        FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE CASCADE
+    )""",
+    'settings': """CREATE TABLE IF NOT EXISTS "{name}" (
+        key TEXT PRIMARY KEY NOT NULL,
+        value TEXT
+    )""",
+    # Per (month, category, account) aggregates of transactions, kept exact by the _ROLLUP_TRIGGERS below.
+    'monthly_rollups': """CREATE TABLE IF NOT EXISTS "{name}" (
+        month TEXT NOT NULL, -- YYYY-MM
+        category_key INTEGER NOT NULL, -- category_id, or 0 for uncategorized rows (NULL cannot be part of the key)
+        account_id INTEGER NOT NULL,
+        income INTEGER NOT NULL DEFAULT 0, /* Cents, sum of positive amounts */
+        expense INTEGER NOT NULL DEFAULT 0, /* Cents, sum of negative amounts as a positive number */
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (month, category_key, account_id)
+    ) WITHOUT ROWID""",
+    # Closed years moved out to per-year archive files (archive_year). Their monthly_rollups rows stay in this
+    # database, so month-based reports never need the files.
+    'archived_years': """CREATE TABLE IF NOT EXISTS "{name}" (
+        year INTEGER PRIMARY KEY,
+        file TEXT NOT NULL, -- File name inside archive_dir()
+        tx_count INTEGER NOT NULL,
+        amount_total INTEGER NOT NULL, /* Cents; checked against the file before a restore */
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    # What each archived year adds to each account's balance, so balances never read the archive files.
+    'archived_balances': """CREATE TABLE IF NOT EXISTS "{name}" (
+        account_id INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        amount INTEGER NOT NULL, /* Cents, net of the year's transactions */
+        tx_count INTEGER NOT NULL,
+        PRIMARY KEY (account_id, year),
+        FOREIGN KEY (account_id) REFERENCES accounts (id) ON DELETE CASCADE,
+        FOREIGN KEY (year) REFERENCES archived_years (year) ON DELETE CASCADE
+    ) WITHOUT ROWID""",
+    # Automatic categorization rules (see rules.py); the first enabled match in (priority, id) order wins.
+    'category_rules': """CREATE TABLE IF NOT EXISTS "{name}" (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_id INTEGER NOT NULL,
+        match_type TEXT NOT NULL CHECK(match_type IN ('keyword', 'regex')) DEFAULT 'keyword',
+        pattern TEXT NOT NULL DEFAULT '', -- Keyword (case-insensitive substring) or regex on the description; '' matches any
+        account_id INTEGER, -- NULL matches any account
+        min_amount INTEGER, /* Cents, signed and inclusive; NULL = unbounded */
+        max_amount INTEGER, /* Cents, signed and inclusive; NULL = unbounded */
+        priority INTEGER NOT NULL DEFAULT 100, -- Lower is tried first
+        enabled INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE CASCADE,
+        FOREIGN KEY (account_id) REFERENCES accounts (id) ON DELETE CASCADE
+    )""",
+    # Change feed (get_changes_since): one row per mutation of the tables in _CHANGE_LOG_TABLES, written by triggers.
+    'change_log': """CREATE TABLE IF NOT EXISTS "{name}" (
+        version INTEGER PRIMARY KEY AUTOINCREMENT, -- Never reused, so versions only grow, also across prune_change_log()
+        table_name TEXT NOT NULL,
+        row_id INTEGER, -- NULL for 'reset': the table changed wholesale (bulk load), readers behind it reload it
+        op TEXT NOT NULL CHECK(op IN ('insert', 'update', 'delete', 'reset')),
+        account_id INTEGER, -- Account whose balance the change may move (transactions: the row's account after it; accounts: itself)
+        old_account_id INTEGER -- Transaction updates: the row's account before the change
+    )""",
+}
+_TABLE_INDEXES = {
+    # Month/range reports seek a half-open date range and read amount/category straight from the index.
+    'transactions': ["CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account_id, date)",
+                     "CREATE INDEX IF NOT EXISTS idx_transactions_category_date_amount ON transactions (category_id, date, amount)",
+                     "CREATE INDEX IF NOT EXISTS idx_transactions_date_amount ON transactions (date, amount, category_id)",
+                     # Per day x account flows for balance history, grouped in index order without a sort.
+                     "CREATE INDEX IF NOT EXISTS idx_transactions_date_account_amount ON transactions (date, account_id, amount)",
+                     # (date, rowid) order matches the ledger's ORDER BY date DESC, id DESC for keyset paging.
+                     "CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date)",
+                     # Duplicate checks probe a single fingerprint.
+                     "CREATE INDEX IF NOT EXISTS idx_transactions_fingerprint ON transactions (fingerprint)"],
+    'budgets': ["CREATE INDEX IF NOT EXISTS idx_budgets_month_category ON budgets (month, category_id)"],
+}
+_OBSOLETE_INDEXES = ["idx_transactions_category_date"] # Superseded by idx_transactions_category_date_amount
+
+def _table_ddl(table: str, name: Optional[str] = None) -> str:
+    return _TABLE_DDL[table].format(name=name or table)
+
+# Full-text index over transaction descriptions (external content: the text itself stays in 'transactions').
+_FTS_DDL = "CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(description, content='transactions', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+_FTS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_ai AFTER INSERT ON transactions BEGIN INSERT INTO transactions_fts(rowid, description) VALUES (new.id, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_ad AFTER DELETE ON transactions BEGIN INSERT INTO transactions_fts(transactions_fts, rowid, description) VALUES ('delete', old.id, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_au AFTER UPDATE OF description ON transactions BEGIN INSERT INTO transactions_fts(transactions_fts, rowid, description) VALUES ('delete', old.id, old.description); INSERT INTO transactions_fts(rowid, description) VALUES (new.id, new.description); END",
+]
+_fts_available = True # Cleared when the bundled SQLite lacks FTS5; search then falls back to LIKE
+
+def _ensure_search_index(cursor: sqlite3.Cursor):
+    """Creates the FTS5 table and its sync triggers, backfilling it when it is new."""
+    global _fts_available
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'")
+    is_new = cursor.fetchone() is None
+    try:
+        cursor.execute(_FTS_DDL)
+    except sqlite3.OperationalError as e:
+        _fts_available = False; logging.warning(f"FTS5 unavailable ({e}); description search will use LIKE scans."); return
+    for trigger_sql in _FTS_TRIGGERS: cursor.execute(trigger_sql)
+    if is_new:
+        logging.info("Building full-text index over existing transaction descriptions...")
+        cursor.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')")
+
+# Monthly rollups: each trigger subtracts the old row's contribution and/or adds the new one, so moves between
+# months, accounts or categories stay exact. Keys whose last transaction is gone are deleted.
+_ROLLUP_ADD_SQL = """INSERT INTO monthly_rollups (month, category_key, account_id, income, expense, tx_count)
+    VALUES (substr(new.date, 1, 7), IFNULL(new.category_id, 0), new.account_id, MAX(new.amount, 0), MAX(-new.amount, 0), 1)
+    ON CONFLICT (month, category_key, account_id) DO UPDATE SET income = income + excluded.income, expense = expense + excluded.expense, tx_count = tx_count + 1;"""
+_ROLLUP_SUBTRACT_SQL = """UPDATE monthly_rollups SET income = income - MAX(old.amount, 0), expense = expense - MAX(-old.amount, 0), tx_count = tx_count - 1
+    WHERE month = substr(old.date, 1, 7) AND category_key = IFNULL(old.category_id, 0) AND account_id = old.account_id;
+    DELETE FROM monthly_rollups WHERE month = substr(old.date, 1, 7) AND category_key = IFNULL(old.category_id, 0) AND account_id = old.account_id AND tx_count = 0;"""
+_ROLLUP_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS monthly_rollups_ai AFTER INSERT ON transactions BEGIN {_ROLLUP_ADD_SQL} END",
+    f"CREATE TRIGGER IF NOT EXISTS monthly_rollups_ad AFTER DELETE ON transactions BEGIN {_ROLLUP_SUBTRACT_SQL} END",
+    f"CREATE TRIGGER IF NOT EXISTS monthly_rollups_au AFTER UPDATE OF date, amount, category_id, account_id ON transactions BEGIN {_ROLLUP_SUBTRACT_SQL} {_ROLLUP_ADD_SQL} END",
+]
+# Aggregates transactions into rollups; the WHERE clause lets bulk inserts fold in only their new rows.
+_ROLLUP_AGGREGATE_SQL = """INSERT INTO monthly_rollups (month, category_key, account_id, income, expense, tx_count)
+    SELECT substr(date, 1, 7), IFNULL(category_id, 0), account_id, SUM(MAX(amount, 0)), SUM(MAX(-amount, 0)), COUNT(*)
+    FROM transactions WHERE id > ? GROUP BY 1, 2, 3
+    ON CONFLICT (month, category_key, account_id) DO UPDATE SET income = income + excluded.income, expense = expense + excluded.expense, tx_count = tx_count + excluded.tx_count"""
+
+# Change log triggers: (table, row id, op) per mutated row, plus the account whose balance it affects. A transaction
+# moved to another account is logged under both accounts. Updates of columns the feed does not return (e.g. the
+# fingerprint backfill) are not logged.
+_CHANGE_LOG_TABLES = ('transactions', 'accounts', 'categories')
+_CHANGE_LOG_SQL = "INSERT INTO change_log (table_name, row_id, op, account_id) VALUES ('{table}', {row}.id, '{op}', {account});"
+_CHANGE_LOG_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS change_log_transactions_ai AFTER INSERT ON transactions BEGIN {_CHANGE_LOG_SQL.format(table='transactions', row='new', op='insert', account='new.account_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS change_log_transactions_au AFTER UPDATE OF account_id, date, description, amount, category_id ON transactions BEGIN "
+    "INSERT INTO change_log (table_name, row_id, op, account_id, old_account_id) VALUES ('transactions', new.id, 'update', new.account_id, old.account_id); END",
+    f"CREATE TRIGGER IF NOT EXISTS change_log_transactions_ad AFTER DELETE ON transactions BEGIN {_CHANGE_LOG_SQL.format(table='transactions', row='old', op='delete', account='old.account_id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS change_log_accounts_ai AFTER INSERT ON accounts BEGIN {_CHANGE_LOG_SQL.format(table='accounts', row='new', op='insert', account='new.id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS change_log_accounts_au AFTER UPDATE ON accounts BEGIN {_CHANGE_LOG_SQL.format(table='accounts', row='new', op='update', account='new.id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS change_log_accounts_ad AFTER DELETE ON accounts BEGIN {_CHANGE_LOG_SQL.format(table='accounts', row='old', op='delete', account='old.id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS change_log_categories_ai AFTER INSERT ON categories BEGIN {_CHANGE_LOG_SQL.format(table='categories', row='new', op='insert', account='NULL')} END",
+    f"CREATE TRIGGER IF NOT EXISTS change_log_categories_au AFTER UPDATE ON categories BEGIN {_CHANGE_LOG_SQL.format(table='categories', row='new', op='update', account='NULL')} END",
+    f"CREATE TRIGGER IF NOT EXISTS change_log_categories_ad AFTER DELETE ON categories BEGIN {_CHANGE_LOG_SQL.format(table='categories', row='old', op='delete', account='NULL')} END",
+]
+
+_NOT_ARCHIVED_SQL = "CAST(substr({column}, 1, 4) AS INTEGER) NOT IN (SELECT year FROM archived_years)"
+
+def _ensure_monthly_rollups(cursor: sqlite3.Cursor):
+    """Creates the rollup table and its triggers, filling it from transactions when it is new."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_rollups'")
+    is_new = cursor.fetchone() is None
+    cursor.execute(_table_ddl('monthly_rollups'))
+    for trigger_sql in _ROLLUP_TRIGGERS: cursor.execute(trigger_sql)
+    if is_new: logging.info("Building monthly rollups from existing transactions..."); cursor.execute(_ROLLUP_AGGREGATE_SQL, (0,))
+
+@invalidates('transactions')
+def rebuild_monthly_rollups() -> int:
+    """Recomputes monthly_rollups from scratch (repairs any drift). Returns the number of rollup rows.
+    Rows for archived years are kept as they are: their transactions are no longer here to recompute them from."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction: cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(f"DELETE FROM monthly_rollups WHERE {_NOT_ARCHIVED_SQL.format(column='month')}")
+        cursor.execute(_ROLLUP_AGGREGATE_SQL.replace("WHERE id > ?", f"WHERE id > ? AND {_NOT_ARCHIVED_SQL.format(column='date')}"), (0,))
+        cursor.execute("SELECT COUNT(*) FROM monthly_rollups"); rollup_rows = cursor.fetchone()[0]
+    logging.info(f"Rebuilt monthly rollups ({rollup_rows} rows)."); return rollup_rows
+
+def verify_monthly_rollups() -> int:
+    """Returns how many rollup keys differ from a fresh aggregate of transactions (0 when consistent).
+    Archived years are skipped, as their rollups are all that is left of them here."""
+    fresh = f"SELECT substr(date, 1, 7), IFNULL(category_id, 0), account_id, SUM(MAX(amount, 0)), SUM(MAX(-amount, 0)), COUNT(*) FROM transactions WHERE {_NOT_ARCHIVED_SQL.format(column='date')} GROUP BY 1, 2, 3"
+    stored = f"SELECT month, category_key, account_id, income, expense, tx_count FROM monthly_rollups WHERE {_NOT_ARCHIVED_SQL.format(column='month')}"
+    with get_db_connection() as conn:
+        return conn.execute(f"SELECT (SELECT COUNT(*) FROM ({fresh} EXCEPT {stored})) + (SELECT COUNT(*) FROM ({stored} EXCEPT {fresh}))").fetchone()[0]
+
+# PRAGMA user_version of a fully initialized/migrated database. Bump it whenever tables, indexes,
+# triggers or migrations change so existing databases run the (idempotent) full check once more.
+SCHEMA_VERSION = 9 # 2: monthly_rollups, 3: idx_transactions_date_account_amount, 4: archived_years/archived_balances, 5: sqlite_stat1, 6: category_rules, 7: transactions.fingerprint, 8: change_log, 9: change_log.old_account_id
 
 def initialize_db():
-    """Creates/updates database tables using TEXT for monetary values."""
-    logging.info("Initializing database schema...")
+    """Creates/updates database tables using INTEGER cents for monetary values.
+    A database already at SCHEMA_VERSION skips every check; only the FTS availability is looked up."""
+    global _fts_available
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute("PRAGMA user_version"); version = cursor.fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                if version > SCHEMA_VERSION: logging.warning(f"Database schema version {version} is newer than this app ({SCHEMA_VERSION}); skipping schema checks.")
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'"); _fts_available = cursor.fetchone() is not None
+                logging.info(f"Database schema is current (version {version}).")
+                return
+            logging.info(f"Initializing database schema (version {version} -> {SCHEMA_VERSION})...")
 
-            # Accounts Table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS accounts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
-                    initial_balance TEXT NOT NULL DEFAULT '0.00', /* Store as TEXT */
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-
-            # Categories Table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS categories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
-                    type TEXT NOT NULL CHECK(type IN ('expense', 'income')) DEFAULT 'expense',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master")
+            if cursor.fetchone()[0] == 0: # New file: auto_vacuum can only change before the first table, and under WAL needs a VACUUM to apply
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL"); cursor.execute("VACUUM")
+            for table in ('accounts', 'categories', 'transactions', 'budgets', 'settings', 'archived_years', 'archived_balances', 'category_rules', 'change_log'):
+                cursor.execute(_table_ddl(table))
+            _add_missing_columns(cursor)
             cursor.execute("INSERT OR IGNORE INTO categories (name, type) VALUES (?, ?)", ('Uncategorized', 'expense'))
-
-            # Transactions Table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    account_id INTEGER NOT NULL,
-                    date TEXT NOT NULL, -- Store dates as ISO8601 strings (YYYY-MM-DD)
-                    description TEXT NOT NULL COLLATE NOCASE,
-                    amount TEXT NOT NULL, /* Store as TEXT */
-                    category_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (account_id) REFERENCES accounts (id) ON DELETE CASCADE,
-                    FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE SET NULL
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account_id, date)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions (category_id, date)")
-
-            # Budgets Table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS budgets (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    category_id INTEGER NOT NULL,
-                    month TEXT NOT NULL, -- Store month as YYYY-MM string
-                    amount TEXT NOT NULL DEFAULT '0.00', /* Store as TEXT */
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE (category_id, month),
-                    FOREIGN KEY (category_id) REFERENCES categories (id) ON DELETE CASCADE
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_budgets_month_category ON budgets (month, category_id)")
-
-            # --- NEW: Settings Table ---
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS settings (
-                    key TEXT PRIMARY KEY NOT NULL,
-                    value TEXT
-                )
-            """)
             # Set default theme if not present
             cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", ('theme', 'light'))
-            # --- END NEW ---
+
+            for index_sql in _TABLE_INDEXES['transactions'] + _TABLE_INDEXES['budgets']: cursor.execute(index_sql)
+            for index_name in _OBSOLETE_INDEXES: cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
 
             # Migration logic (can be run safely multiple times)
             _migrate_real_to_text(cursor)
+            _migrate_text_to_cents(conn)
+            _backfill_fingerprints(conn)
+
+            # Triggers live on the transactions table, so (re)create them after any table rebuild above
+            _ensure_search_index(conn.cursor())
+            _ensure_monthly_rollups(cursor)
+            if version == 8: # The version 8 update trigger logged a moved row's old account as a second entry; clients reload once
+                cursor.execute("DROP TRIGGER IF EXISTS change_log_transactions_au"); cursor.execute("INSERT INTO change_log (table_name, op) VALUES ('transactions', 'reset')")
+            for trigger_sql in _CHANGE_LOG_TRIGGERS: cursor.execute(trigger_sql)
+            # The (still empty) planner statistics table: creating it later, while other connections are open, would
+            # change the schema under them. analyze_database() fills it in idle time.
+            cursor.execute("ANALYZE sqlite_master")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
+        invalidate_cache() # Migrations may have rewritten any table
         logging.info("Database schema initialization/check complete.")
     except sqlite3.Error as e:
         logging.error(f"Error initializing/migrating database schema: {e}", exc_info=True)
@@ -224,7 +721,66 @@ def _migrate_real_to_text(cursor: sqlite3.Cursor):
         logging.info("No REAL columns found needing migration.")
 
 
+# Columns added to a table after its first release: (table, column, definition), added with ALTER TABLE.
+_ADDED_COLUMNS = [('transactions', 'fingerprint', 'INTEGER'), ('change_log', 'old_account_id', 'INTEGER')]
+
+def _add_missing_columns(cursor: sqlite3.Cursor):
+    for table, column, definition in _ADDED_COLUMNS:
+        cursor.execute(f"PRAGMA table_info(\"{table}\")")
+        if any(col['name'].lower() == column for col in cursor.fetchall()): continue
+        logging.info(f"Adding column {table}.{column}..."); cursor.execute(f"ALTER TABLE \"{table}\" ADD COLUMN {column} {definition}")
+
+def _backfill_fingerprints(conn: sqlite3.Connection):
+    """Fills in the fingerprint of rows stored before the column existed (amounts must already be cents)."""
+    _register_fingerprint_function(conn)
+    backfilled = conn.execute(f"UPDATE transactions SET fingerprint = {_FINGERPRINT_SQL} WHERE fingerprint IS NULL").rowcount
+    if backfilled: logging.info(f"Computed duplicate-check fingerprints for {backfilled} existing transactions.")
+
+# Monetary columns moved from TEXT decimals to INTEGER cents.
+_CENTS_COLUMNS = {'accounts': 'initial_balance', 'transactions': 'amount', 'budgets': 'amount'}
+
+def _migrate_text_to_cents(conn: sqlite3.Connection):
+    """Rebuilds tables whose monetary column is still TEXT so it holds INTEGER cents.
+
+    Runs in its own transaction with foreign keys disabled, so dropping the old
+    'accounts' table cannot cascade-delete transactions."""
+    logging.info("Checking for necessary data type migrations (TEXT -> INTEGER cents)...")
+    pending = [table for table, column in _CENTS_COLUMNS.items() if _has_column_type(conn.cursor(), table, column, 'TEXT')]
+    if not pending:
+        logging.info("No TEXT monetary columns found needing migration."); return
+
+    conn.commit() # PRAGMA foreign_keys is a no-op inside an open transaction
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        cursor = conn.cursor(); cursor.execute("BEGIN IMMEDIATE")
+        for table in pending:
+            column = _CENTS_COLUMNS[table]; temp_table = f"{table}_cents_migrate"
+            logging.warning(f"Found TEXT column: {table}.{column}. Migrating to INTEGER cents...")
+            cursor.execute(f"PRAGMA table_info(\"{table}\")"); old_cols = [c['name'] for c in cursor.fetchall()]
+            cursor.execute(f"DROP TABLE IF EXISTS \"{temp_table}\"")
+            cursor.execute(_table_ddl(table, temp_table))
+            cursor.execute(f"PRAGMA table_info(\"{temp_table}\")"); new_cols = {c['name'] for c in cursor.fetchall()}
+            copy_cols = [c for c in old_cols if c in new_cols]
+            target_cols_str = ', '.join(f"\"{c}\"" for c in copy_cols)
+            select_cols_str = ', '.join(f"CAST(ROUND(CAST(\"{c}\" AS REAL) * 100) AS INTEGER)" if c == column else f"\"{c}\"" for c in copy_cols)
+            cursor.execute(f"INSERT INTO \"{temp_table}\" ({target_cols_str}) SELECT {select_cols_str} FROM \"{table}\"")
+            migrated_rows = cursor.rowcount
+            cursor.execute(f"DROP TABLE \"{table}\"")
+            cursor.execute(f"ALTER TABLE \"{temp_table}\" RENAME TO \"{table}\"")
+            for index_sql in _TABLE_INDEXES.get(table, []): cursor.execute(index_sql)
+            logging.info(f"Migration to cents successful for {table}.{column} ({migrated_rows} rows)")
+        violations = cursor.execute("PRAGMA foreign_key_check").fetchall()
+        if violations: logging.warning(f"{len(violations)} pre-existing foreign key violation(s) found after cents migration.")
+        conn.commit()
+    except sqlite3.Error as migrate_err:
+        logging.error(f"Cents migration FAILED: {migrate_err}. Rolling back.")
+        conn.rollback(); raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+
 # === Category Functions ===
+@invalidates('categories')
 def add_category(name: str, type: str = 'expense') -> Optional[int]:
     sql = "INSERT INTO categories (name, type) VALUES (?, ?)"; cleaned_name = name.strip()
     try:
@@ -232,6 +788,7 @@ def add_category(name: str, type: str = 'expense') -> Optional[int]:
     except sqlite3.IntegrityError: logging.warning(f"Category name '{cleaned_name}' likely exists."); return None
     except sqlite3.Error as e: logging.error(f"Error adding category '{cleaned_name}': {e}"); return None
 
+@cached('categories')
 def get_categories(category_type: Optional[str] = None) -> List[sqlite3.Row]:
     sql = "SELECT id, name, type FROM categories"; params: List[Any] = []
     if category_type in ['expense', 'income']: sql += " WHERE type = ?"; params.append(category_type)
@@ -240,6 +797,7 @@ def get_categories(category_type: Optional[str] = None) -> List[sqlite3.Row]:
         with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute(sql, params); return cursor.fetchall()
     except sqlite3.Error as e: logging.error(f"Error fetching categories (type: {category_type}): {e}"); return []
 
+@invalidates('categories')
 def update_category(category_id: int, new_name: str, new_type: str) -> bool:
     cleaned_name = new_name.strip(); cleaned_type = new_type.strip().lower()
     if not cleaned_name: logging.error("Update category failed: New name empty."); return False
@@ -264,6 +822,7 @@ def update_category(category_id: int, new_name: str, new_type: str) -> bool:
     except sqlite3.IntegrityError: logging.warning(f"Integrity error updating category {category_id}: Name '{cleaned_name}' likely exists."); return False
     except sqlite3.Error as e: logging.error(f"Error updating category {category_id}: {e}"); return False
 
+@invalidates('categories', 'transactions', 'budgets', 'category_rules')
 def delete_category(category_id: int) -> bool:
     try:
         with get_db_connection() as conn:
@@ -273,7 +832,6 @@ def delete_category(category_id: int) -> bool:
             if not cat: logging.warning(f"Delete category {category_id}: ID not found."); return False # Not found
             if cat['name'].lower() == 'uncategorized': logging.error("Cannot delete 'Uncategorized'."); return False # Is default
 
-            cursor.execute("PRAGMA foreign_keys = ON");
             sql = "DELETE FROM categories WHERE id = ?"
             cursor.execute(sql, (category_id,))
             deleted = cursor.rowcount > 0
@@ -282,7 +840,87 @@ def delete_category(category_id: int) -> bool:
     except sqlite3.Error as e: logging.error(f"Error deleting category {category_id}: {e}"); return False
 
 
+# === Categorization Rule Functions ===
+# Stored rules only; matching and applying them lives in rules.py.
+RULE_MATCH_TYPES = ('keyword', 'regex')
+_RULE_COLUMNS = ('category_id', 'match_type', 'pattern', 'account_id', 'min_amount', 'max_amount', 'priority', 'enabled')
+
+@cached('category_rules', 'categories', 'accounts')
+def get_category_rules(enabled_only: bool = False) -> List[sqlite3.Row]:
+    """Rules in the order they are tried (priority, then id), with their category and account names."""
+    sql = ("SELECT r.id, r.category_id, c.name as category_name, r.match_type, r.pattern, r.account_id, a.name as account_name, "
+           "r.min_amount as \"min_amount [CENTS]\", r.max_amount as \"max_amount [CENTS]\", r.priority, r.enabled "
+           "FROM category_rules r JOIN categories c ON r.category_id = c.id LEFT JOIN accounts a ON r.account_id = a.id")
+    if enabled_only: sql += " WHERE r.enabled = 1"
+    sql += " ORDER BY r.priority, r.id"
+    try:
+        with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute(sql); return cursor.fetchall()
+    except sqlite3.Error as e: logging.error(f"Error fetching category rules: {e}"); return []
+
+def _rule_values(category_id: int, match_type: str, pattern: str, account_id: Optional[int], min_amount: Optional[Decimal], max_amount: Optional[Decimal], priority: int, enabled: bool) -> tuple:
+    quantize = lambda amount: None if amount is None else amount.quantize(CENTS, rounding=ROUND_HALF_UP)
+    return (category_id, match_type, pattern.strip(), account_id, quantize(min_amount), quantize(max_amount), int(priority), 1 if enabled else 0)
+
+@invalidates('category_rules')
+def add_category_rule(category_id: int, pattern: str, match_type: str = 'keyword', account_id: Optional[int] = None, min_amount: Optional[Decimal] = None,
+                      max_amount: Optional[Decimal] = None, priority: int = 100, enabled: bool = True) -> Optional[int]:
+    sql = f"INSERT INTO category_rules ({', '.join(_RULE_COLUMNS)}) VALUES ({', '.join('?' * len(_RULE_COLUMNS))})"
+    try:
+        with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute(sql, _rule_values(category_id, match_type, pattern, account_id, min_amount, max_amount, priority, enabled)); return cursor.lastrowid
+    except sqlite3.IntegrityError as e: logging.error(f"Integrity error adding rule (CatID:{category_id}, AccID:{account_id}?): {e}"); return None
+    except sqlite3.Error as e: logging.error(f"Error adding category rule: {e}"); return None
+
+@invalidates('category_rules')
+def update_category_rule(rule_id: int, category_id: int, pattern: str, match_type: str = 'keyword', account_id: Optional[int] = None, min_amount: Optional[Decimal] = None,
+                         max_amount: Optional[Decimal] = None, priority: int = 100, enabled: bool = True) -> bool:
+    sql = f"UPDATE category_rules SET {', '.join(f'{column} = ?' for column in _RULE_COLUMNS)} WHERE id = ?"
+    try:
+        with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute(sql, _rule_values(category_id, match_type, pattern, account_id, min_amount, max_amount, priority, enabled) + (rule_id,)); return cursor.rowcount > 0
+    except sqlite3.IntegrityError as e: logging.error(f"Integrity error updating rule {rule_id} (CatID:{category_id}, AccID:{account_id}?): {e}"); return False
+    except sqlite3.Error as e: logging.error(f"Error updating category rule {rule_id}: {e}"); return False
+
+@invalidates('category_rules')
+def delete_category_rule(rule_id: int) -> bool:
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor(); cursor.execute("DELETE FROM category_rules WHERE id = ?", (rule_id,)); deleted = cursor.rowcount > 0
+            if not deleted: logging.warning(f"Rule ID {rule_id} not found for deletion.")
+            return deleted
+    except sqlite3.Error as e: logging.error(f"Error deleting category rule {rule_id}: {e}"); return False
+
+_UNCATEGORIZED_SQL = "(t.category_id IS NULL OR t.category_id IN (SELECT id FROM categories WHERE name = 'Uncategorized'))"
+
+def iter_categorization_rows(filters: Optional[Dict[str, Any]] = None, uncategorized_only: bool = True, chunk_size: int = 5000) -> Iterator[List[tuple]]:
+    """Yields (id, account_id, description, amount cents, category_id) tuples of this database's transactions that
+    match filters, in id order. Every chunk is its own keyset query, fetched in full before it is yielded, so the
+    caller may recategorize the rows it was given on the same connection. The chunks walk the table by rowid
+    (NOT INDEXED), so together they read it once; through a filter's index each chunk would sort every remaining
+    match again. sqlite3.Error propagates."""
+    conditions, params = _transaction_filter_clause(filters)
+    if uncategorized_only: conditions.append(_UNCATEGORIZED_SQL)
+    sql = f"SELECT t.id, t.account_id, t.description, t.amount, t.category_id FROM transactions t NOT INDEXED WHERE t.id > ?{''.join(' AND ' + c for c in conditions)} ORDER BY t.id LIMIT ?"
+    last_id = 0
+    with get_db_connection() as conn:
+        while True:
+            cursor = conn.cursor(); cursor.row_factory = None; chunk = cursor.execute(sql, [last_id] + params + [chunk_size]).fetchall()
+            if not chunk: return
+            last_id = chunk[-1][0]; yield chunk
+
+def count_categorization_rows(filters: Optional[Dict[str, Any]] = None, uncategorized_only: bool = True) -> int:
+    conditions, params = _transaction_filter_clause(filters)
+    if uncategorized_only: conditions.append(_UNCATEGORIZED_SQL)
+    with get_db_connection() as conn: return conn.execute(f"SELECT COUNT(*) FROM transactions t{' WHERE ' + ' AND '.join(conditions) if conditions else ''}", params).fetchone()[0]
+
+@invalidates('transactions')
+def set_transactions_category(category_id: Optional[int], transaction_ids: List[int]) -> int:
+    """Moves the given transactions into category_id with one set-based UPDATE (ids passed as a JSON array).
+    Rows already in that category are not touched. Returns the number of rows changed."""
+    sql = "UPDATE transactions SET category_id = ? WHERE id IN (SELECT value FROM json_each(?)) AND category_id IS NOT ?"
+    with get_db_connection() as conn: return conn.execute(sql, (category_id, json.dumps(transaction_ids), category_id)).rowcount
+
+
 # === Budget Functions ===
+@invalidates('budgets')
 def set_budget(category_id: int, month_str: str, amount: Decimal) -> bool:
     budget_amount = max(Decimal('0.00'), amount).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     sql = "INSERT INTO budgets (category_id, month, amount) VALUES (?, ?, ?) ON CONFLICT(category_id, month) DO UPDATE SET amount = excluded.amount"
@@ -299,72 +937,492 @@ def set_budget(category_id: int, month_str: str, amount: Decimal) -> bool:
             return True
     except sqlite3.Error as e: logging.error(f"Error setting budget C:{category_id} M:{month_str}: {e}"); return False
 
+@cached('budgets', 'categories')
 def get_budgets_for_month(month_str: str) -> List[sqlite3.Row]:
-    sql = "SELECT b.id, b.category_id, c.name as category_name, c.type as category_type, b.month, b.amount as \"amount [DECIMAL]\" FROM budgets b JOIN categories c ON b.category_id = c.id WHERE b.month = ? AND c.type = 'expense' ORDER BY c.name COLLATE NOCASE"
+    sql = "SELECT b.id, b.category_id, c.name as category_name, c.type as category_type, b.month, b.amount as \"amount [CENTS]\" FROM budgets b JOIN categories c ON b.category_id = c.id WHERE b.month = ? AND c.type = 'expense' ORDER BY c.name COLLATE NOCASE"
     try:
         with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute(sql, (month_str,)); return cursor.fetchall()
     except sqlite3.Error as e: logging.error(f"Error getting budgets for {month_str}: {e}"); return []
 
+_SPENDING_FOR_CATEGORY_MONTH_SQL = "SELECT SUM(expense) as \"total [CENTS]\" FROM monthly_rollups WHERE month = ? AND category_key = ?"
+
+@cached('transactions')
 def get_spending_for_category_month(category_id: int, month_str: str) -> Decimal:
-    date_pattern = f"{month_str}-%"; sql = "SELECT SUM(amount) as \"total [DECIMAL]\" FROM transactions WHERE category_id = ? AND date LIKE ? AND CAST(amount AS REAL) < 0"; total_spending = Decimal('0.00')
+    total_spending = Decimal('0.00')
     try:
-        with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute(sql, (category_id, date_pattern)); result = cursor.fetchone();
+        with get_read_connection() as conn: cursor = conn.cursor(); cursor.execute(_SPENDING_FOR_CATEGORY_MONTH_SQL, (month_str, category_id)); result = cursor.fetchone();
         if result and result['total'] is not None: total_spending = abs(result['total'])
     except sqlite3.Error as e: logging.error(f"Error getting spending C:{category_id} M:{month_str}: {e}")
     return total_spending.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
+def _month_bounds(month_str: str) -> Tuple[str, str]:
+    """Returns the half-open date range ['YYYY-MM-01', first day of the next month) for a YYYY-MM string."""
+    return f"{month_str}-01", f"{_next_month(month_str)}-01"
+
+def _next_month(month_str: str) -> str:
+    """Returns the YYYY-MM string following month_str."""
+    year, month = int(month_str[:4]), int(month_str[5:7])
+    return f"{year + 1:04d}-01" if month == 12 else f"{year:04d}-{month + 1:02d}"
+
+def _month_range(start_month: str, end_month: str) -> List[str]:
+    """Lists YYYY-MM strings from start_month to end_month inclusive."""
+    months = []; month = start_month
+    while month <= end_month: months.append(month); month = _next_month(month)
+    return months
+
+# Expense categories with their budget and actual spending for a month, in a single grouped query.
+_BUDGET_VS_ACTUAL_SQL = """
+    SELECT c.id AS category_id, c.name AS category_name,
+           IFNULL(b.amount, 0) AS "budgeted_amount [CENTS]", IFNULL(s.total, 0) AS "spent_amount [CENTS]"
+    FROM categories c
+    LEFT JOIN budgets b ON b.category_id = c.id AND b.month = ?
+    LEFT JOIN (SELECT category_key, SUM(expense) AS total FROM monthly_rollups WHERE month = ? GROUP BY category_key) s ON s.category_key = c.id
+    WHERE c.type = 'expense' AND c.name <> 'Uncategorized'
+    ORDER BY c.name COLLATE NOCASE
+"""
+
+@cached('budgets', 'categories', 'transactions')
+def get_budget_vs_actual_for_month(month_str: str) -> List[Dict[str, Any]]:
+    """Returns budgeted, spent and remaining amounts for every expense category (except 'Uncategorized') in a month."""
+    budget_data = []
+    try:
+        with get_read_connection() as conn:
+            cursor = conn.cursor(); cursor.execute(_BUDGET_VS_ACTUAL_SQL, (month_str, month_str))
+            for row in cursor:
+                budget_data.append({"category_id": row['category_id'], "category_name": row['category_name'], "budgeted_amount": row['budgeted_amount'],
+                                    "spent_amount": row['spent_amount'], "remaining_amount": row['budgeted_amount'] - row['spent_amount']})
+    except sqlite3.Error as e: logging.error(f"Error getting budget vs actual M:{month_str}: {e}"); return []
+    return budget_data
+
+_BUDGET_MATRIX_SPENDING_SQL = "SELECT category_key AS category_id, month, SUM(expense) as \"spent [CENTS]\" FROM monthly_rollups WHERE month >= ? AND month <= ? GROUP BY category_key, month"
+
+@cached('budgets', 'categories', 'transactions')
+def get_budget_matrix(start_month: str, end_month: str) -> Dict[str, Any]:
+    """Returns a categories x months matrix of budgeted/spent/remaining amounts for an inclusive month range.
+
+    Budgets and spending (from monthly_rollups) are each fetched with one grouped query over the whole range,
+    so the cost grows with months x categories, not with the number of transactions."""
+    months = _month_range(start_month, end_month)
+    if not months: return {"months": [], "categories": []}
+    month_index = {m: i for i, m in enumerate(months)}; zero = Decimal('0.00')
+    sql_categories = "SELECT id, name FROM categories WHERE type = 'expense' AND name <> 'Uncategorized' ORDER BY name COLLATE NOCASE"
+    sql_budgets = "SELECT category_id, month, amount as \"amount [CENTS]\" FROM budgets WHERE month >= ? AND month <= ?"
+    try:
+        with get_read_connection() as conn:
+            cursor = conn.cursor(); cursor.execute(sql_categories)
+            rows = {cat['id']: {"category_id": cat['id'], "category_name": cat['name'], "budgeted": [zero] * len(months), "spent": [zero] * len(months)} for cat in cursor.fetchall()}
+            cursor.execute(sql_budgets, (months[0], months[-1]))
+            for b in cursor:
+                if b['category_id'] in rows: rows[b['category_id']]['budgeted'][month_index[b['month']]] = b['amount']
+            cursor.execute(_BUDGET_MATRIX_SPENDING_SQL, (months[0], months[-1]))
+            for sp in cursor:
+                if sp['category_id'] in rows: rows[sp['category_id']]['spent'][month_index[sp['month']]] = sp['spent']
+    except sqlite3.Error as e: logging.error(f"Error getting budget matrix {start_month}..{end_month}: {e}"); return {"months": months, "categories": []}
+    for row in rows.values(): row['remaining'] = [b - sp for b, sp in zip(row['budgeted'], row['spent'])]
+    return {"months": months, "categories": list(rows.values())}
+
+# === Duplicate Detection ===
+# Each transaction stores a 64-bit fingerprint of (account, date, amount in cents, normalized description) with an
+# index on it, so checking a new or edited transaction for an exact duplicate is one index probe, however large the
+# ledger. A fingerprint hit is confirmed field by field, so a hash collision is never reported. Archived years are
+# not checked. Near-duplicates (same account and amount a few days apart) are found by find_duplicates().
+DUPLICATE_POLICIES = ('warn', 'reject') # 'warn' logs and stores the transaction anyway; 'reject' refuses it
+DEFAULT_DUPLICATE_POLICY = 'warn'
+MAX_DUPLICATE_WINDOW_DAYS = 366
+_FINGERPRINT_SQL = "transaction_fingerprint(account_id, date, amount, description)" # Needs _register_fingerprint_function()
+_DUPLICATE_PROBE_SQL = "SELECT id, account_id, date, amount, description FROM transactions WHERE fingerprint = ? ORDER BY id"
+
+class DuplicateTransactionError(ValueError):
+    """Raised under the 'reject' policy; duplicate_id is the stored transaction it duplicates."""
+    def __init__(self, duplicate_id: int):
+        super().__init__(f"Duplicate of transaction {duplicate_id} (same account, date, amount and description).")
+        self.duplicate_id = duplicate_id
+
+def normalize_description(description: str) -> str:
+    """Lower-cases a description and collapses whitespace runs, the form fingerprints compare."""
+    return ' '.join(str(description).lower().split())
+
+def transaction_fingerprint(account_id: int, date_str: str, amount_cents: int, description: str) -> int:
+    """Signed 64-bit hash of a transaction's duplicate-check key (an SQLite INTEGER)."""
+    key = f"{account_id}\x1f{date_str}\x1f{amount_cents}\x1f{normalize_description(description)}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big', signed=True)
+
+def _register_fingerprint_function(conn: sqlite3.Connection):
+    """Makes transaction_fingerprint() callable from SQL on conn, for statements that fingerprint rows set-wise."""
+    conn.create_function('transaction_fingerprint', 4, transaction_fingerprint, deterministic=True)
+
+def get_duplicate_policy() -> str:
+    """The saved duplicate policy ('duplicate_policy' setting), DEFAULT_DUPLICATE_POLICY when unset or unknown."""
+    policy = get_setting('duplicate_policy', DEFAULT_DUPLICATE_POLICY)
+    return policy if policy in DUPLICATE_POLICIES else DEFAULT_DUPLICATE_POLICY
+
+def _find_duplicate(cursor: sqlite3.Cursor, fingerprint: int, account_id: int, date_str: str, amount_cents: int, description: str, exclude_id: Optional[int] = None) -> Optional[int]:
+    key = normalize_description(description)
+    cursor.execute(_DUPLICATE_PROBE_SQL, (fingerprint,))
+    for row in cursor.fetchall():
+        if row[0] != exclude_id and (row[1], row[2], row[3]) == (account_id, date_str, amount_cents) and normalize_description(row[4]) == key: return row[0]
+    return None
+
+def find_duplicate_transaction(account_id: int, date_str: str, description: str, amount: Decimal, exclude_id: Optional[int] = None) -> Optional[int]:
+    """ID of the oldest stored transaction with the same account, date, amount and (normalized) description, other
+    than exclude_id; None when there is none."""
+    amount_cents = adapt_decimal(amount); fingerprint = transaction_fingerprint(account_id, date_str, amount_cents, description)
+    try:
+        with get_db_connection() as conn: return _find_duplicate(conn.cursor(), fingerprint, account_id, date_str, amount_cents, description, exclude_id)
+    except sqlite3.Error as e: logging.error(f"Error checking for a duplicate transaction: {e}"); return None
+
+def _check_duplicate(cursor: sqlite3.Cursor, fingerprint: int, account_id: int, date_str: str, amount_cents: int, description: str, exclude_id: Optional[int], policy: Optional[str]):
+    """Applies the duplicate policy (None = the saved one) to a transaction about to be written."""
+    duplicate_id = _find_duplicate(cursor, fingerprint, account_id, date_str, amount_cents, description, exclude_id)
+    if duplicate_id is None: return
+    if (policy or get_duplicate_policy()) == 'reject': raise DuplicateTransactionError(duplicate_id)
+    logging.warning(f"Transaction ({account_id}, {date_str}, {amount_cents}, {description!r}) duplicates transaction {duplicate_id}; stored anyway (policy 'warn').")
+
+@cached('transactions', 'accounts')
+def find_duplicates(window_days: int = 3, filters: Optional[Dict[str, Any]] = None, limit: int = 500) -> Dict[str, Any]:
+    """Groups of likely duplicates in this database (archived years are not searched): transactions of the same
+    account and amount dated at most window_days apart, among those matching filters (_transaction_filter_clause
+    keys). Members are chained, so a group can span more than the window when each is within it of the next.
+
+    One sort-based sweep, never a comparison of every pair: (account, amount, day, id) is read from the covering
+    date/account/amount index, sorted by SQLite, and each row is compared with the previous one only; the details
+    of the grouped rows are then fetched by ID. 'exact' marks groups holding two rows with the same date and
+    normalized description. Returns {'window_days', 'groups': [{'account_id', 'account_name', 'amount', 'exact',
+    'transactions': [{'id', 'date', 'description', 'category_id'}]}], 'group_count', 'transaction_count',
+    'truncated'}; at most limit groups, latest first. Raises ValueError for a window outside 0..MAX_DUPLICATE_WINDOW_DAYS."""
+    window_days = int(window_days)
+    if not 0 <= window_days <= MAX_DUPLICATE_WINDOW_DAYS: raise ValueError(f"Window must be 0 to {MAX_DUPLICATE_WINDOW_DAYS} days.")
+    conditions, params = _transaction_filter_clause(filters)
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    # The unary + keeps the planner from walking idx_transactions_account_date (not covering) to order by account
+    sweep_sql = f"SELECT t.account_id, t.amount, CAST(julianday(t.date) AS INTEGER), t.id FROM transactions t {where_sql} ORDER BY +t.account_id, t.amount, t.date, t.id"
+    detail_sql = "SELECT t.id, t.account_id, a.name, t.date, t.description, t.amount as \"amount [CENTS]\", t.category_id FROM transactions t JOIN accounts a ON t.account_id = a.id WHERE t.id IN (SELECT value FROM json_each(?))"
+    groups: List[List[int]] = []; details: Dict[int, Tuple[Any, ...]] = {}
+    try:
+        with get_read_connection() as conn:
+            cursor = conn.cursor(); cursor.row_factory = None; cursor.execute(sweep_sql, params)
+            group: Optional[List[int]] = None; previous: Tuple[Any, ...] = (None, None, None, None)
+            for row in cursor:
+                if row[1] == previous[1] and row[0] == previous[0] and row[2] - previous[2] <= window_days:
+                    if group is None: group = [previous[3]]; groups.append(group)
+                    group.append(row[3])
+                else: group = None
+                previous = row
+            if groups:
+                cursor.execute(detail_sql, (json.dumps([transaction_id for group in groups for transaction_id in group]),))
+                details = {row[0]: row for row in cursor}
+    except sqlite3.Error as e: logging.error(f"Error finding duplicate transactions: {e}"); groups = []
+    groups.sort(key=lambda group: (details[group[-1]][3], group[-1]), reverse=True)
+    result_groups = []
+    for group in groups[:limit]:
+        rows = [details[transaction_id] for transaction_id in group]
+        result_groups.append({'account_id': rows[0][1], 'account_name': rows[0][2], 'amount': rows[0][5],
+                              'exact': len({(row[3], normalize_description(row[4])) for row in rows}) < len(rows),
+                              'transactions': [{'id': row[0], 'date': row[3], 'description': row[4], 'category_id': row[6]} for row in rows]})
+    return {'window_days': window_days, 'group_count': len(groups), 'transaction_count': sum(len(group) for group in groups), 'truncated': len(groups) > limit, 'groups': result_groups}
+
 # === Transaction Functions ===
-def add_transaction(account_id: int, date_str: str, description: str, amount: Decimal, category_id: Optional[int] = None) -> Optional[int]:
-    sql = "INSERT INTO transactions (account_id, date, description, amount, category_id) VALUES (?, ?, ?, ?, ?)"; cleaned_desc = description.strip()
+@invalidates('transactions')
+def add_transaction(account_id: int, date_str: str, description: str, amount: Decimal, category_id: Optional[int] = None, duplicate_policy: Optional[str] = None) -> Optional[int]:
+    """Returns the new transaction's ID, or None on a database error. An exact duplicate of a stored transaction is
+    handled by duplicate_policy (None = the saved policy): logged, or refused with DuplicateTransactionError."""
+    sql = "INSERT INTO transactions (account_id, date, description, amount, category_id, fingerprint) VALUES (?, ?, ?, ?, ?, ?)"; cleaned_desc = description.strip()
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor(); amount_quantized = amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
             if category_id is not None:
                 cursor.execute("SELECT 1 FROM categories WHERE id = ?", (category_id,))
                 if not cursor.fetchone(): logging.warning(f"Add Tx: CatID {category_id} not found, setting NULL."); category_id = None
-            cursor.execute(sql, (account_id, date_str, cleaned_desc, amount_quantized, category_id)); return cursor.lastrowid
+            amount_cents = adapt_decimal(amount_quantized); fingerprint = transaction_fingerprint(account_id, date_str, amount_cents, cleaned_desc)
+            _check_duplicate(cursor, fingerprint, account_id, date_str, amount_cents, cleaned_desc, None, duplicate_policy)
+            cursor.execute(sql, (account_id, date_str, cleaned_desc, amount_cents, category_id, fingerprint)); return cursor.lastrowid
     except sqlite3.IntegrityError as e: logging.error(f"Integrity error adding tx (AccID:{account_id}?): {e}"); return None
     except sqlite3.Error as e: logging.error(f"Error adding transaction: {e}"); return None
 
-def get_transactions(account_id: Optional[int] = None, limit: Optional[int] = None) -> List[sqlite3.Row]:
-    sql = "SELECT t.id, t.account_id, a.name as account_name, t.date, t.description, t.amount as \"amount [DECIMAL]\", t.category_id, IFNULL(c.name, 'Uncategorized') as category_name, IFNULL(c.type, 'expense') as category_type FROM transactions t JOIN accounts a ON t.account_id = a.id LEFT JOIN categories c ON t.category_id = c.id"; params: List[Any] = []
-    if account_id is not None: sql += " WHERE t.account_id = ?"; params.append(account_id)
-    sql += " ORDER BY t.date DESC, t.id DESC"
-    if limit is not None and limit > 0: sql += " LIMIT ?"; params.append(limit)
+IMPORT_BATCH_SIZE = 5000
+
+@invalidates('transactions')
+def bulk_insert_transactions(rows: Iterable[Tuple[int, str, str, Decimal, Optional[int]]], batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """Inserts (account_id, date, description, amount, category_id) rows with executemany in batches of batch_size.
+    The rows iterable is consumed lazily, so a generator over a large file is never materialized; all batches share
+    one transaction, so either every row is stored or (on error, which propagates) none are. Returns rows inserted.
+    The per-row FTS and monthly rollup insert triggers are suspended for the load and the new rows are indexed and
+    aggregated in set-based statements, which is several times cheaper; the DDL is part of the same transaction,
+    so a rollback restores the triggers. The change log gets one entry per row, or a single 'reset' for a load
+    larger than CHANGE_FEED_MAX_CHANGES. Rows are fingerprinted but not checked for duplicates."""
+    sql = "INSERT INTO transactions (account_id, date, description, amount, category_id, fingerprint) VALUES (?, ?, ?, ?, ?, ?)"; inserted = 0
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        rows_iter = ((account_id, date_str, description, amount, category_id, transaction_fingerprint(account_id, date_str, adapt_decimal(amount), description))
+                     for account_id, date_str, description, amount, category_id in rows)
+        if not conn.in_transaction: cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT IFNULL(MAX(id), 0) FROM transactions"); last_id = cursor.fetchone()[0]
+        cursor.execute("DROP TRIGGER IF EXISTS monthly_rollups_ai"); cursor.execute("DROP TRIGGER IF EXISTS change_log_transactions_ai")
+        if _fts_available: cursor.execute("DROP TRIGGER IF EXISTS transactions_fts_ai")
+        while True:
+            batch = list(islice(rows_iter, batch_size))
+            if not batch: break
+            cursor.executemany(sql, batch); inserted += len(batch)
+        cursor.execute(_ROLLUP_AGGREGATE_SQL, (last_id,)); cursor.execute(_ROLLUP_TRIGGERS[0])
+        if inserted > CHANGE_FEED_MAX_CHANGES: cursor.execute("INSERT INTO change_log (table_name, op) VALUES ('transactions', 'reset')")
+        elif inserted: cursor.execute("INSERT INTO change_log (table_name, row_id, op, account_id) SELECT 'transactions', id, 'insert', account_id FROM transactions WHERE id > ? ORDER BY id", (last_id,))
+        cursor.execute(_CHANGE_LOG_TRIGGERS[0])
+        if _fts_available:
+            cursor.execute("INSERT INTO transactions_fts(rowid, description) SELECT id, description FROM transactions WHERE id > ?", (last_id,))
+            cursor.execute(_FTS_TRIGGERS[0])
+    return inserted
+
+_TRANSACTION_COLUMNS_SQL = "t.id, t.account_id, a.name as account_name, t.date, t.description, t.amount as \"amount [CENTS]\", t.category_id, IFNULL(c.name, 'Uncategorized') as category_name, IFNULL(c.type, 'expense') as category_type"
+# Columnar variant: amounts stay raw INTEGER cents (suffix _cents) so no Decimal is ever built for them
+_TRANSACTION_COLUMNS_CENTS_SQL = _TRANSACTION_COLUMNS_SQL.replace('t.amount as "amount [CENTS]"', 't.amount as amount_cents')
+_TRANSACTION_JOINS_SQL = "FROM transactions t JOIN accounts a ON t.account_id = a.id LEFT JOIN categories c ON t.category_id = c.id"
+
+def fetch_columnar(cursor: sqlite3.Cursor, chunk_size: int = 2000) -> Dict[str, Any]:
+    """Drains an executed cursor into {'columns': [name...], 'values': [[column values]...], 'row_count': n}.
+    Rows are transposed chunk by chunk straight into per-column lists; no per-row dict or Row is kept.
+    The cursor must have row_factory None so fetchmany returns plain tuples."""
+    columns = [description[0] for description in cursor.description]; values: List[List[Any]] = [[] for _ in columns]
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk: break
+        for column_values, chunk_column in zip(values, zip(*chunk)): column_values.extend(chunk_column)
+    return {'columns': columns, 'values': values, 'row_count': len(values[0]) if values else 0}
+
+def _empty_columnar() -> Dict[str, Any]:
+    return {'columns': [], 'values': [], 'row_count': 0}
+
+@cached('transactions', 'accounts', 'categories')
+def get_transactions(account_id: Optional[int] = None, limit: Optional[int] = None, include_running_balance: bool = False, columnar: bool = False) -> Any:
+    """Fetches transactions newest first from this database (archived years are read through query_transactions,
+    search_transactions and the export). With include_running_balance, each row also carries the account balance
+    after that transaction: the account's current balance (from monthly_rollups, see _ACCOUNT_BALANCES_SQL) less
+    what the newer rows of the page added. The page holds every row newer than its last one, so the window only
+    runs over the rows returned and the cost does not grow with the history before them.
+    With columnar, returns a fetch_columnar() dict instead of Rows, with amounts as integer cents
+    (amount_cents, running_balance_cents)."""
+    columns = _TRANSACTION_COLUMNS_CENTS_SQL if columnar else _TRANSACTION_COLUMNS_SQL; params: List[Any] = []
+    where_sql = " WHERE t.account_id = ?" if account_id is not None else ""
+    if account_id is not None: params.append(account_id)
+    limit_sql = " LIMIT ?" if limit is not None and limit > 0 else ""
+    if limit_sql: params.append(limit)
+    if include_running_balance:
+        # Page first (index order, no sort; CROSS JOIN keeps it the outer loop), then balances walking back from the newest row of each account
+        source_sql = f"WITH page AS (SELECT t.id FROM transactions t{where_sql} ORDER BY t.date DESC, t.id DESC{limit_sql}) SELECT {{}} FROM page p CROSS JOIN transactions t ON t.id = p.id" if limit_sql else f"SELECT {{}} FROM transactions t"
+        running_sql = "a.initial_balance + IFNULL(r.total, 0) + t.amount - SUM(t.amount) OVER (PARTITION BY t.account_id ORDER BY t.date DESC, t.id DESC ROWS UNBOUNDED PRECEDING) as " + ("running_balance_cents" if columnar else "\"running_balance [CENTS]\"")
+        sql = (source_sql.format(f"{columns}, {running_sql}") + f" JOIN accounts a ON t.account_id = a.id LEFT JOIN categories c ON t.category_id = c.id"
+               f" LEFT JOIN ({_ROLLUP_ACCOUNT_TOTALS_SQL}) r ON r.account_id = t.account_id{'' if limit_sql else where_sql} ORDER BY t.date DESC, t.id DESC")
+    else: sql = f"SELECT {columns} {_TRANSACTION_JOINS_SQL}{where_sql} ORDER BY t.date DESC, t.id DESC{limit_sql}"
     try:
-        with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute(sql, params); return cursor.fetchall()
-    except sqlite3.Error as e: logging.error(f"Error fetching transactions (Acc:{account_id}, Lim:{limit}): {e}"); return []
+        with get_read_connection() as conn:
+            cursor = conn.cursor()
+            if columnar: cursor.row_factory = None; cursor.execute(sql, params); return fetch_columnar(cursor)
+            cursor.execute(sql, params); return cursor.fetchall()
+    except sqlite3.Error as e: logging.error(f"Error fetching transactions (Acc:{account_id}, Lim:{limit}): {e}"); return _empty_columnar() if columnar else []
+
+# --- Filtered, keyset-paginated ledger queries ---
+MAX_PAGE_SIZE = 1000
+
+def _transaction_filter_clause(filters: Optional[Dict[str, Any]]) -> Tuple[List[str], List[Any]]:
+    """Builds WHERE conditions on transactions 't' from a filter dict.
+
+    Supported keys: start_date / end_date (inclusive YYYY-MM-DD), min_amount / max_amount (signed Decimal),
+    account_ids / category_ids (lists; None inside category_ids matches uncategorized rows) and
+    type ('income' or 'expense')."""
+    conditions: List[str] = []; params: List[Any] = []
+    if not filters: return conditions, params
+    if filters.get('start_date'): conditions.append("t.date >= ?"); params.append(filters['start_date'])
+    if filters.get('end_date'): conditions.append("t.date < ?"); params.append(_date_range_params(filters['end_date'], filters['end_date'])[1])
+    if filters.get('min_amount') is not None: conditions.append("t.amount >= ?"); params.append(filters['min_amount'])
+    if filters.get('max_amount') is not None: conditions.append("t.amount <= ?"); params.append(filters['max_amount'])
+    if filters.get('type') == 'income': conditions.append("t.amount > 0")
+    elif filters.get('type') == 'expense': conditions.append("t.amount < 0")
+    account_ids = filters.get('account_ids')
+    if account_ids:
+        conditions.append(f"t.account_id IN ({', '.join('?' * len(account_ids))})"); params.extend(account_ids)
+    category_ids = filters.get('category_ids')
+    if category_ids:
+        real_ids = [cid for cid in category_ids if cid is not None]; parts = []
+        if real_ids: parts.append(f"t.category_id IN ({', '.join('?' * len(real_ids))})"); params.extend(real_ids)
+        if len(real_ids) < len(category_ids): parts.append("t.category_id IS NULL")
+        conditions.append(f"({' OR '.join(parts)})")
+    return conditions, params
+
+def encode_page_cursor(date_str: str, transaction_id: int) -> str:
+    """Opaque keyset cursor for the (date, id) position of the last row on a page."""
+    return base64.urlsafe_b64encode(json.dumps([date_str, transaction_id]).encode('utf-8')).decode('ascii')
+
+def decode_page_cursor(cursor_str: str) -> Tuple[str, int]:
+    """Inverse of encode_page_cursor. Raises ValueError for malformed cursors."""
+    try:
+        date_str, transaction_id = json.loads(base64.urlsafe_b64decode(cursor_str.encode('ascii')))
+        return str(date_str), int(transaction_id)
+    except (TypeError, ValueError, binascii.Error) as e: raise ValueError(f"Invalid page cursor: {cursor_str!r}") from e
+
+def _filter_date_bounds(filters: Optional[Dict[str, Any]]) -> Tuple[Optional[str], Optional[str]]:
+    """The half-open date range a filter dict covers (None = unbounded), as _transaction_filter_clause applies it."""
+    if not filters: return None, None
+    return filters.get('start_date') or None, _date_range_params(filters['end_date'], filters['end_date'])[1] if filters.get('end_date') else None
+
+def _concat_columnar(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+    if not first['columns']: return second
+    if not second['row_count']: return first
+    return {'columns': first['columns'], 'values': [a + b for a, b in zip(first['values'], second['values'])], 'row_count': first['row_count'] + second['row_count']}
+
+def query_transactions(filters: Optional[Dict[str, Any]] = None, cursor: Optional[str] = None, page_size: int = 100, include_total: bool = True, columnar: bool = False) -> Dict[str, Any]:
+    """Returns one page of the filtered ledger, newest first, using keyset pagination on (date, id).
+
+    Result: {'transactions': [Row...], 'next_cursor': str | None, 'total_count': int | None}.
+    Pass the returned next_cursor back to get the following page; each page costs the same
+    regardless of its position because it seeks past the cursor instead of using OFFSET.
+    With columnar, 'transactions' is a fetch_columnar() dict with amounts as integer cents (amount_cents).
+    Archived years are read only once a page reaches them; the total counts them from their recorded
+    per-account totals when only dates are filtered."""
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    conditions, params = _transaction_filter_clause(filters)
+    start_date, end_exclusive = _filter_date_bounds(filters)
+    page_conditions = list(conditions); page_params = list(params); after_date = None
+    if cursor:
+        after_date, after_id = decode_page_cursor(cursor)
+        page_conditions.append("(t.date, t.id) < (?, ?)"); page_params.extend([after_date, after_id])
+    dates_only = not filters or all(key in ('start_date', 'end_date') or value in (None, '', []) for key, value in filters.items())
+    result: Dict[str, Any] = {'transactions': _empty_columnar() if columnar else [], 'next_cursor': None, 'total_count': 0 if include_total else None}
+    wanted = page_size + 1; page = result['transactions']
+    try:
+        for year, segment_start, segment_end in _ledger_segments(start_date, end_exclusive):
+            needs_rows = wanted > 0 and not (after_date is not None and segment_start is not None and segment_start > after_date)
+            whole_year = year is not None and dates_only and (segment_start, segment_end) == (f"{year:04d}-01-01", f"{year + 1:04d}-01-01")
+            if not needs_rows and not include_total: continue
+            extra, extra_params = _segment_conditions(segment_start, segment_end, start_date, end_exclusive)
+            with _ledger_connection([year] if year is not None and (needs_rows or not whole_year) else []) as (conn, source):
+                joins_sql = _TRANSACTION_JOINS_SQL.replace('FROM transactions t', f'FROM {source} t')
+                if needs_rows:
+                    where_sql = f" WHERE {' AND '.join(page_conditions + extra)}" if page_conditions or extra else ""
+                    sql = f"SELECT {_TRANSACTION_COLUMNS_CENTS_SQL if columnar else _TRANSACTION_COLUMNS_SQL} {joins_sql}{where_sql} ORDER BY t.date DESC, t.id DESC LIMIT ?"
+                    page_cursor = conn.cursor()
+                    if columnar: page_cursor.row_factory = None; page_cursor.execute(sql, page_params + extra_params + [wanted]); rows = fetch_columnar(page_cursor); page = _concat_columnar(page, rows); wanted -= rows['row_count']
+                    else: page_cursor.execute(sql, page_params + extra_params + [wanted]); rows = page_cursor.fetchall(); page = page + rows; wanted -= len(rows)
+                if include_total:
+                    where_sql = f" WHERE {' AND '.join(conditions + extra)}" if conditions or extra else ""
+                    if whole_year: count_sql = f"SELECT (SELECT COUNT(*) FROM main.transactions t{where_sql}) + (SELECT IFNULL(SUM(tx_count), 0) FROM archived_balances WHERE year = ?)"; count_params = params + extra_params + [year]
+                    elif year is not None: count_sql = f"SELECT COUNT(*) FROM {source} t JOIN accounts a ON t.account_id = a.id{where_sql}"; count_params = params + extra_params # Archived rows outlive deleted accounts
+                    else: count_sql = f"SELECT COUNT(*) FROM transactions t{where_sql}"; count_params = params + extra_params
+                    result['total_count'] += conn.execute(count_sql, count_params).fetchone()[0]
+        if columnar:
+            if page['row_count'] > page_size:
+                page['values'] = [column_values[:page_size] for column_values in page['values']]; page['row_count'] = page_size
+                result['next_cursor'] = encode_page_cursor(page['values'][page['columns'].index('date')][-1], page['values'][page['columns'].index('id')][-1])
+        elif len(page) > page_size: page = page[:page_size]; result['next_cursor'] = encode_page_cursor(page[-1]['date'], page[-1]['id'])
+        result['transactions'] = page
+    except sqlite3.Error as e: logging.error(f"Error querying transactions (Filters:{filters}, Cursor:{cursor}): {e}"); result['total_count'] = None
+    return result
+
+EXPORT_COLUMNS = ('id', 'date', 'account_name', 'description', 'category_name', 'amount')
+
+def iter_transaction_chunks(filters: Optional[Dict[str, Any]] = None, chunk_size: int = 5000) -> Iterator[List[tuple]]:
+    """Yields the filtered ledger (newest first) as lists of plain tuples in EXPORT_COLUMNS order, fetchmany()
+    chunk_size rows at a time, so callers can stream any ledger size. This database is read on one connection
+    (one consistent snapshot) and each archived year the filters reach on a connection of its own, in turn.
+    sqlite3.Error propagates."""
+    conditions, params = _transaction_filter_clause(filters)
+    start_date, end_exclusive = _filter_date_bounds(filters)
+    for year, segment_start, segment_end in _ledger_segments(start_date, end_exclusive):
+        extra, extra_params = _segment_conditions(segment_start, segment_end, start_date, end_exclusive)
+        with _ledger_connection([year] if year is not None else []) as (conn, source):
+            sql = ("SELECT t.id, t.date, a.name, t.description, IFNULL(c.name, 'Uncategorized'), t.amount as \"amount [CENTS]\" "
+                   f"{_TRANSACTION_JOINS_SQL.replace('FROM transactions t', f'FROM {source} t')}{' WHERE ' + ' AND '.join(conditions + extra) if conditions or extra else ''} ORDER BY t.date DESC, t.id DESC")
+            cursor = conn.cursor(); cursor.row_factory = None; cursor.execute(sql, params + extra_params)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk: break
+                yield chunk
+
+# --- Full-text description search ---
+SEARCH_SNIPPET_TOKENS = 12
+
+def _fts_match_query(text: str) -> Optional[str]:
+    """Turns free text into an FTS5 query: every word must match as a prefix (quoted, so FTS syntax in the input is inert)."""
+    terms = [term.replace('"', '') for term in str(text).split()]
+    terms = [term for term in terms if term]
+    return ' '.join(f'"{term}"*' for term in terms) if terms else None
+
+def _snippet_to_html(snippet: str) -> str:
+    return html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def search_transactions(query: str, filters: Optional[Dict[str, Any]] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """Full-text search over descriptions, best BM25 match first, combinable with query_transactions filters.
+
+    Each result row carries 'rank' and 'snippet_html' (escaped description excerpt with <mark> highlights).
+    When this database has fewer than limit matches, archived years in the filtered range are searched too,
+    newest first, by substring (their files have no full-text index); those rows follow with rank 0."""
+    match_query = _fts_match_query(query)
+    if not match_query: return []
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    conditions, params = _transaction_filter_clause(filters)
+    filter_sql = ''.join(f" AND {condition}" for condition in conditions)
+    terms = [term.replace('"', '') for term in str(query).split() if term.replace('"', '')]
+    like_sql = ''.join(" AND t.description LIKE ? ESCAPE '\\'" for _ in terms)
+    like_params = ['%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%' for term in terms]
+    if _fts_available:
+        sql = (f"SELECT {_TRANSACTION_COLUMNS_SQL}, bm25(transactions_fts) AS rank, snippet(transactions_fts, 0, char(2), char(3), '…', {SEARCH_SNIPPET_TOKENS}) AS snippet "
+               f"FROM transactions_fts JOIN transactions t ON t.id = transactions_fts.rowid JOIN accounts a ON t.account_id = a.id LEFT JOIN categories c ON t.category_id = c.id "
+               f"WHERE transactions_fts MATCH ?{filter_sql} ORDER BY rank LIMIT ?")
+        sql_params = [match_query] + params + [limit]
+    else:
+        sql = f"SELECT {_TRANSACTION_COLUMNS_SQL}, 0 AS rank, t.description AS snippet {_TRANSACTION_JOINS_SQL} WHERE 1 = 1{like_sql}{filter_sql} ORDER BY t.date DESC, t.id DESC LIMIT ?"
+        sql_params = like_params + params + [limit]
+    results = []
+    try:
+        with get_read_connection() as conn:
+            cursor = conn.cursor(); cursor.execute(sql, sql_params)
+            for row in cursor:
+                result = dict(row); result['snippet_html'] = _snippet_to_html(result.pop('snippet') or ''); results.append(result)
+        for year in [year for year, _, _ in _ledger_segments(*_filter_date_bounds(filters)) if year is not None]:
+            if len(results) >= limit: break
+            with _ledger_connection([year]) as (conn, _):
+                archive_sql = f"SELECT {_TRANSACTION_COLUMNS_SQL}, 0 AS rank {_TRANSACTION_JOINS_SQL.replace('FROM transactions t', f'FROM archive_{year}.transactions t')} WHERE 1 = 1{like_sql}{filter_sql} ORDER BY t.date DESC, t.id DESC LIMIT ?"
+                for row in conn.execute(archive_sql, like_params + params + [limit - len(results)]):
+                    result = dict(row); result['snippet_html'] = html.escape(result['description']); results.append(result)
+    except sqlite3.Error as e: logging.error(f"Error searching transactions (Query:{query!r}, Filters:{filters}): {e}")
+    return results
 
 def get_transaction_by_id(transaction_id: int) -> Optional[sqlite3.Row]:
-    sql = "SELECT t.id, t.account_id, t.date, t.description, t.amount as \"amount [DECIMAL]\", t.category_id, IFNULL(c.name, 'Uncategorized') as category_name FROM transactions t LEFT JOIN categories c ON t.category_id = c.id WHERE t.id = ?"
+    sql = "SELECT t.id, t.account_id, t.date, t.description, t.amount as \"amount [CENTS]\", t.category_id, IFNULL(c.name, 'Uncategorized') as category_name FROM transactions t LEFT JOIN categories c ON t.category_id = c.id WHERE t.id = ?"
     try:
         with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute(sql, (transaction_id,)); return cursor.fetchone()
     except sqlite3.Error as e: logging.error(f"Error fetching transaction {transaction_id}: {e}"); return None
 
-def update_transaction(transaction_id: int, account_id: int, date_str: str, description: str, amount: Decimal, category_id: Optional[int] = None) -> bool:
-    sql = "UPDATE transactions SET account_id = ?, date = ?, description = ?, amount = ?, category_id = ? WHERE id = ?"; cleaned_desc = description.strip()
+@invalidates('transactions')
+def update_transaction(transaction_id: int, account_id: int, date_str: str, description: str, amount: Decimal, category_id: Optional[int] = None, duplicate_policy: Optional[str] = None) -> bool:
+    """Returns whether the transaction was updated. Only an edit that changes the fingerprinted fields is checked
+    for duplicates, under duplicate_policy as in add_transaction (DuplicateTransactionError when refused)."""
+    sql = "UPDATE transactions SET account_id = ?, date = ?, description = ?, amount = ?, category_id = ?, fingerprint = ? WHERE id = ?"; cleaned_desc = description.strip()
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor(); amount_quantized = amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
             if category_id is not None:
                 cursor.execute("SELECT 1 FROM categories WHERE id = ?", (category_id,))
                 if not cursor.fetchone(): logging.warning(f"Update Tx {transaction_id}: CatID {category_id} not found, setting NULL."); category_id = None
-            cursor.execute(sql, (account_id, date_str, cleaned_desc, amount_quantized, category_id, transaction_id)); updated = cursor.rowcount > 0;
+            amount_cents = adapt_decimal(amount_quantized); fingerprint = transaction_fingerprint(account_id, date_str, amount_cents, cleaned_desc)
+            cursor.execute("SELECT fingerprint FROM transactions WHERE id = ?", (transaction_id,)); current = cursor.fetchone()
+            if current is not None and current[0] != fingerprint: _check_duplicate(cursor, fingerprint, account_id, date_str, amount_cents, cleaned_desc, transaction_id, duplicate_policy)
+            cursor.execute(sql, (account_id, date_str, cleaned_desc, amount_cents, category_id, fingerprint, transaction_id)); updated = cursor.rowcount > 0;
             # Optional logging can go here based on 'updated'
             return updated
     except sqlite3.IntegrityError as e: logging.error(f"Integrity error updating tx {transaction_id} (AccID:{account_id}?): {e}"); return False
     except sqlite3.Error as e: logging.error(f"Error updating transaction {transaction_id}: {e}"); return False
 
+@invalidates('transactions')
 def delete_transaction(transaction_id: int) -> bool:
     sql = "DELETE FROM transactions WHERE id = ?"
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor(); cursor.execute("PRAGMA foreign_keys = ON"); cursor.execute(sql, (transaction_id,)); deleted = cursor.rowcount > 0;
+            cursor = conn.cursor(); cursor.execute(sql, (transaction_id,)); deleted = cursor.rowcount > 0;
             if not deleted: logging.warning(f"Tx ID {transaction_id} not found for deletion.");
             return deleted
     except sqlite3.Error as e: logging.error(f"Error deleting transaction {transaction_id}: {e}"); return False
 
 # === Account Functions ===
+@invalidates('accounts')
 def add_account(name: str, initial_balance: Decimal = Decimal('0.00')) -> Optional[int]:
     sql = "INSERT INTO accounts (name, initial_balance) VALUES (?, ?)"; cleaned_name = name.strip()
     try:
@@ -372,21 +1430,26 @@ def add_account(name: str, initial_balance: Decimal = Decimal('0.00')) -> Option
     except sqlite3.IntegrityError: logging.warning(f"Account name '{cleaned_name}' likely exists."); return None
     except sqlite3.Error as e: logging.error(f"Error adding account '{cleaned_name}': {e}"); return None
 
+@cached('accounts')
 def get_accounts() -> List[sqlite3.Row]:
-    sql = "SELECT id, name, initial_balance as \"initial_balance [DECIMAL]\" FROM accounts ORDER BY name COLLATE NOCASE"
+    sql = "SELECT id, name, initial_balance as \"initial_balance [CENTS]\" FROM accounts ORDER BY name COLLATE NOCASE"
     try:
         with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute(sql); return cursor.fetchall()
     except sqlite3.Error as e: logging.error(f"Error fetching accounts: {e}"); return []
 
+@invalidates('accounts', 'transactions', 'category_rules')
 def delete_account(account_id: int) -> bool:
     sql = "DELETE FROM accounts WHERE id = ?"
     try:
-        with get_db_connection() as conn: cursor = conn.cursor(); cursor.execute("PRAGMA foreign_keys = ON"); cursor.execute(sql, (account_id,)); deleted = cursor.rowcount > 0;
+        with get_db_connection() as conn:
+            cursor = conn.cursor(); cursor.execute(sql, (account_id,)); deleted = cursor.rowcount > 0
+            cursor.execute("DELETE FROM monthly_rollups WHERE account_id = ?", (account_id,)) # Archived months are not cleared by the cascade's triggers
         if not deleted: logging.warning(f"Account ID {account_id} not found for deletion.");
         # else: logging.info(f"Deleted account {account_id} and transactions."); # Optional log
         return deleted
     except sqlite3.Error as e: logging.error(f"Error deleting account {account_id}: {e}"); return False
 
+@invalidates('accounts')
 def update_account(account_id: int, new_name: str, new_initial_balance: Decimal) -> bool:
     sql = "UPDATE accounts SET name = ?, initial_balance = ? WHERE id = ?"; cleaned_name = new_name.strip()
     try:
@@ -397,61 +1460,434 @@ def update_account(account_id: int, new_name: str, new_initial_balance: Decimal)
     except sqlite3.Error as e: logging.error(f"Error updating account {account_id}: {e}"); return False
 
 # === Balance Calculation Functions ===
+# Balances are the initial balance plus the net of the account's monthly_rollups (archived years included), one
+# grouped pass over the rollups joined back to accounts: the cost follows months x categories, not transactions.
+# Every balance (accounts list, dashboard, change feed, running balances) is read through this one query.
+_ROLLUP_ACCOUNT_TOTALS_SQL = "SELECT account_id, SUM(income - expense) AS total FROM monthly_rollups GROUP BY account_id"
+_ACCOUNT_BALANCES_SQL = f"""
+    SELECT a.id, a.name, a.initial_balance as "initial_balance [CENTS]", a.initial_balance + IFNULL(r.total, 0) as "current_balance [CENTS]"
+    FROM accounts a LEFT JOIN ({_ROLLUP_ACCOUNT_TOTALS_SQL}) r ON r.account_id = a.id
+"""
+
+@cached('accounts', 'transactions')
 def get_account_current_balance(account_id: int) -> Decimal:
     """Calculates the current balance for a single account."""
-    current_balance = Decimal('0.00')
     try:
         with get_db_connection() as conn:
-             cursor = conn.cursor(); cursor.execute("SELECT initial_balance as \"initial_balance [DECIMAL]\" FROM accounts WHERE id = ?", (account_id,)); result_initial = cursor.fetchone();
-             if not result_initial: logging.warning(f"AccID {account_id} not found for balance calc."); return Decimal('0.00')
-             initial_balance = result_initial['initial_balance']; current_balance = initial_balance if isinstance(initial_balance, Decimal) else Decimal('0.00')
-             cursor.execute("SELECT SUM(amount) as \"total_transactions [DECIMAL]\" FROM transactions WHERE account_id = ?", (account_id,)); result_sum = cursor.fetchone(); transaction_sum = result_sum['total_transactions']
-             if isinstance(transaction_sum, Decimal): current_balance += transaction_sum
-             return current_balance.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            cursor = conn.cursor(); cursor.execute(_ACCOUNT_BALANCES_SQL + " WHERE a.id = ?", (account_id,)); result = cursor.fetchone()
+            if not result: logging.warning(f"AccID {account_id} not found for balance calc."); return Decimal('0.00')
+            return result['current_balance'].quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     except sqlite3.Error as e: logging.error(f"Error calculating balance AccID {account_id}: {e}"); return Decimal('0.00')
 
+@cached('accounts', 'transactions')
+def get_account_balances_summary() -> Dict[str, Any]:
+    """Returns every account with its current balance plus the net total, from a single query."""
+    accounts: List[Dict[str, Any]] = []; total_balance = Decimal('0.00')
+    try:
+        with get_read_connection() as conn:
+            cursor = conn.cursor(); cursor.execute(_ACCOUNT_BALANCES_SQL + " ORDER BY a.name COLLATE NOCASE")
+            for row in cursor:
+                current_balance = row['current_balance'].quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+                accounts.append({'id': row['id'], 'name': row['name'], 'initial_balance': row['initial_balance'], 'current_balance': current_balance})
+                total_balance += current_balance
+    except sqlite3.Error as e: logging.error(f"Error getting account balances summary: {e}"); return {'accounts': [], 'total_balance': Decimal('0.00')}
+    return {'accounts': accounts, 'total_balance': total_balance.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)}
+
 def get_all_accounts_with_balances() -> List[Dict[str, Any]]:
     """Fetches all accounts and calculates their current balances."""
-    accounts = []
-    try:
-        base_accounts = get_accounts();
-        for acc_row in base_accounts: acc_dict = dict(acc_row); acc_dict['current_balance'] = get_account_current_balance(acc_dict['id']); accounts.append(acc_dict)
-        return accounts
-    except Exception as e: logging.error(f"Error getting all accounts with balances: {e}"); return []
+    return get_account_balances_summary()['accounts']
 
 def get_total_net_balance() -> Decimal:
     """Calculates the sum of current balances across all accounts."""
-    total_balance = sum(acc.get('current_balance', Decimal('0.00')) for acc in get_all_accounts_with_balances())
-    return total_balance.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return get_account_balances_summary()['total_balance']
 
 # === Reporting Functions ===
+# Whole months are read from monthly_rollups; only the partial months at either edge of a range touch raw
+# transactions, as half-open ([start, end)) date ranges that map onto a single index range seek.
+_SPENDING_BY_CATEGORY_SQL = """
+    SELECT IFNULL(c.name, 'Uncategorized') as category_name, SUM(s.spent) as "total_amount [CENTS]"
+    FROM (SELECT category_key AS category_id, expense AS spent FROM monthly_rollups WHERE month >= ? AND month < ?
+          UNION ALL SELECT category_id, -amount FROM transactions WHERE date >= ? AND date < ? AND amount < 0
+          UNION ALL SELECT category_id, -amount FROM transactions WHERE date >= ? AND date < ? AND amount < 0) s
+    LEFT JOIN categories c ON s.category_id = c.id
+    GROUP BY category_name HAVING SUM(s.spent) > 0 ORDER BY SUM(s.spent) DESC
+"""
+_MONTH_FLOW_SQL = "SELECT SUM(income) as \"total_income [CENTS]\", SUM(expense) as \"total_expense [CENTS]\" FROM monthly_rollups WHERE month = ?"
+
+def _date_range_params(start_date: str, end_date: str) -> Tuple[str, str]:
+    """Converts an inclusive YYYY-MM-DD range to half-open (start_date, day_after_end_date) bounds."""
+    return start_date, (datetime.date.fromisoformat(end_date) + datetime.timedelta(days=1)).isoformat()
+
+def _split_month_aligned(start_date: str, end_exclusive: str) -> Tuple[str, str, str, str, str, str]:
+    """Splits a half-open date range into (first_month, end_month) of whole months for monthly_rollups plus the
+    leading and trailing partial-month date ranges for raw rows. Empty parts come back as ('', '')."""
+    first_full = start_date if start_date.endswith('-01') else _month_bounds(start_date[:7])[1]
+    last_full_end = end_exclusive[:7] + '-01'
+    if first_full >= last_full_end: return '', '', start_date, end_exclusive, '', ''
+    return first_full[:7], last_full_end[:7], start_date, first_full, last_full_end, end_exclusive
+
+@cached('transactions', 'categories')
 def get_spending_by_category(start_date: str, end_date: str) -> List[Dict[str, Any]]:
-    sql = "SELECT IFNULL(c.name, 'Uncategorized') as category_name, SUM(t.amount) as \"total_amount [DECIMAL]\" FROM transactions t LEFT JOIN categories c ON t.category_id = c.id WHERE CAST(t.amount AS REAL) < 0 AND t.date BETWEEN ? AND ? GROUP BY category_name HAVING SUM(t.amount) < '0' ORDER BY ABS(SUM(t.amount)) DESC"
     spending_data = []
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor(); cursor.execute(sql, (start_date, end_date)); results = cursor.fetchall();
+        bounds = _split_month_aligned(*_date_range_params(start_date, end_date))
+        with _ledger_connection(_archived_years_in(bounds[2:4], bounds[4:6])) as (conn, source):
+            cursor = conn.cursor(); cursor.execute(_SPENDING_BY_CATEGORY_SQL.replace('FROM transactions', f'FROM {source}'), bounds); results = cursor.fetchall();
             for row in results:
                 spending_amount = abs(row['total_amount'] or Decimal('0.00')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
                 if spending_amount > 0: spending_data.append({"category_name": row['category_name'],"spent_amount": spending_amount})
     except Exception as e: logging.error(f"Error getting spending by category ({start_date} to {end_date}): {e}"); return []
     return spending_data
 
+@cached('transactions')
 def get_income_expense_summary_for_month(month_str: str) -> Dict[str, Decimal]:
     """Calculates total income and total expenses for a given month (YYYY-MM)."""
-    income = Decimal('0.00'); expense = Decimal('0.00'); date_pattern = f"{month_str}-%"
-    sql_income = "SELECT SUM(amount) as \"total [DECIMAL]\" FROM transactions WHERE date LIKE ? AND CAST(amount AS REAL) > 0"
-    sql_expense = "SELECT SUM(amount) as \"total [DECIMAL]\" FROM transactions WHERE date LIKE ? AND CAST(amount AS REAL) < 0"
+    income = Decimal('0.00'); expense = Decimal('0.00')
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor(); cursor.execute(sql_income, (date_pattern,)); result_income = cursor.fetchone();
-            if result_income and result_income['total'] is not None: income = result_income['total']
-            cursor.execute(sql_expense, (date_pattern,)); result_expense = cursor.fetchone();
-            if result_expense and result_expense['total'] is not None: expense = abs(result_expense['total'])
+        with get_read_connection() as conn:
+            cursor = conn.cursor(); cursor.execute(_MONTH_FLOW_SQL, (month_str,)); result = cursor.fetchone();
+            if result and result['total_income'] is not None: income = result['total_income']
+            if result and result['total_expense'] is not None: expense = result['total_expense']
     except sqlite3.Error as e: logging.error(f"Error getting income/expense summary M:{month_str}: {e}"); return {'total_income': Decimal('0.00'), 'total_expense': Decimal('0.00')}
     return {'total_income': income.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP), 'total_expense': expense.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)}
 
+# === Balance History ===
+# Opening balances take whole months from monthly_rollups and only the start date's own month from raw rows.
+_OPENING_BALANCES_SQL = """
+    SELECT a.id, a.initial_balance + IFNULL(r.total, 0) + IFNULL(t.total, 0)
+    FROM accounts a
+    LEFT JOIN (SELECT account_id, SUM(income - expense) AS total FROM monthly_rollups WHERE month < ? GROUP BY account_id) r ON r.account_id = a.id
+    LEFT JOIN (SELECT account_id, SUM(amount) AS total FROM transactions WHERE date >= ? AND date < ? GROUP BY +account_id) t ON t.account_id = a.id
+"""
+_DAILY_ACCOUNT_FLOWS_SQL = "SELECT date, account_id, SUM(amount), SUM(MAX(amount, 0)) FROM transactions WHERE date >= ? AND date < ? GROUP BY date, account_id"
+
+def get_daily_account_flows(start_date: str, end_exclusive: str) -> Tuple[Dict[int, int], List[tuple]]:
+    """Returns ({account_id: balance before start_date}, [(date, account_id, net, income), ...] per day and account
+    in [start_date, end_exclusive)), all in integer cents. Without archived years in the range everything is read
+    from one snapshot; otherwise each archived year's flows are read in turn. sqlite3.Error propagates."""
+    with _ledger_connection(_archived_years_in((start_date[:7] + '-01', start_date))) as (conn, source):
+        cursor = conn.cursor(); cursor.row_factory = None
+        cursor.execute(_OPENING_BALANCES_SQL.replace('FROM transactions', f'FROM {source}'), (start_date[:7], start_date[:7] + '-01', start_date)); opening = dict(cursor.fetchall())
+        segments = _ledger_segments(start_date, end_exclusive)
+        if len(segments) == 1 and segments[0][0] is None: cursor.execute(_DAILY_ACCOUNT_FLOWS_SQL, (start_date, end_exclusive)); return opening, cursor.fetchall()
+    flows: List[tuple] = []
+    for year, segment_start, segment_end in segments:
+        with _ledger_connection([year] if year is not None else []) as (conn, source):
+            cursor = conn.cursor(); cursor.row_factory = None
+            cursor.execute(_DAILY_ACCOUNT_FLOWS_SQL.replace('FROM transactions', f'FROM {source}'), (segment_start, segment_end)); flows.extend(cursor.fetchall())
+    return opening, flows
+
+# === Archived Years ===
+# archive_year() moves a closed year's transactions into their own file, <db name>_archive/<year>.db, keeping
+# their monthly rollups and per-account balance contributions here, so balances, budgets and month-based reports
+# never open the files. Queries over raw rows (the ledger pages, search, export, report edges, balance history)
+# split their date range with _ledger_segments() and read each archived year through _ledger_connection(), which
+# attaches only that year's file. Years are archived oldest first and restored newest first, so the archive is
+# always the start of the ledger's history; transactions added later with an archived date simply stay here.
+_LEDGER_COLUMNS = "id, account_id, date, description, amount, category_id"
+_ARCHIVE_SCHEMA = [
+    "CREATE TABLE transactions (id INTEGER PRIMARY KEY, account_id INTEGER NOT NULL, date TEXT NOT NULL, description TEXT NOT NULL COLLATE NOCASE, "
+    "amount INTEGER NOT NULL, category_id INTEGER, created_at TIMESTAMP)",
+    "CREATE INDEX idx_transactions_date ON transactions (date)",
+    "CREATE INDEX idx_transactions_date_account_amount ON transactions (date, account_id, amount)",
+]
+
+def archive_dir() -> Path:
+    return DB_FILE.parent / f"{DB_FILE.stem}_archive"
+
+@cached('archived_years')
+def get_archived_years() -> List[Dict[str, Any]]:
+    """Archived years, oldest first: {'year', 'file', 'tx_count', 'amount_total', 'archived_at'}."""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor(); cursor.execute("SELECT year, file, tx_count, amount_total as \"amount_total [CENTS]\", CAST(archived_at AS TEXT) AS archived_at FROM archived_years ORDER BY year")
+            return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e: logging.error(f"Error reading archived years: {e}"); return []
+
+def _ledger_segments(start_date: Optional[str], end_exclusive: Optional[str]) -> List[Tuple[Optional[int], Optional[str], Optional[str]]]:
+    """Splits the half-open range [start_date, end_exclusive) (None = unbounded) into (archived year or None, start,
+    end) pieces, newest first. A None piece is read from this database alone; a year's piece from this database
+    and that year's file together. Without archived years in range it is just [(None, start_date, end_exclusive)]."""
+    years = [row['year'] for row in get_archived_years() if (start_date is None or f"{row['year'] + 1:04d}-01-01" > start_date) and (end_exclusive is None or f"{row['year']:04d}-01-01" < end_exclusive)]
+    segments: List[Tuple[Optional[int], Optional[str], Optional[str]]] = []; upper = end_exclusive
+    for year in reversed(years):
+        year_start, year_end = f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+        if upper is None or upper > year_end: segments.append((None, year_end if start_date is None or start_date < year_end else start_date, upper))
+        segments.append((year, year_start if start_date is None or start_date < year_start else start_date, year_end if upper is None or upper > year_end else upper))
+        upper = year_start
+    if start_date is None or upper is None or start_date < upper: segments.append((None, start_date, upper))
+    return segments
+
+def _archived_years_in(*ranges: Tuple[str, str]) -> List[int]:
+    """Archived years overlapping any of the half-open date ranges (empty ranges are skipped)."""
+    return sorted({year for start, end in ranges if start < end for year, _, _ in _ledger_segments(start, end) if year is not None})
+
+@contextmanager
+def _ledger_connection(years: Iterable[int] = ()):
+    """Yields (connection, transactions source SQL). With no years: a read connection and 'transactions'.
+    Otherwise a short-lived connection with those years' files attached as archive_<year> and a UNION ALL of
+    this database's transactions and theirs (a pooled connection could be inside a transaction, where ATTACH
+    is not allowed). Raises sqlite3.OperationalError if an archive file is missing."""
+    years = sorted(set(years))
+    if not years:
+        with get_read_connection() as conn: yield conn, 'transactions'
+        return
+    files = {row['year']: archive_dir() / row['file'] for row in get_archived_years()}; local = _pool._local
+    conn = _pool._open()
+    try:
+        for year in years:
+            if year not in files or not files[year].is_file(): raise sqlite3.OperationalError(f"Archive file for {year} is missing ({files.get(year)}).")
+            conn.execute(f"ATTACH DATABASE ? AS archive_{int(year)}", (str(files[year]),))
+        yield conn, "(" + " UNION ALL ".join([f"SELECT {_LEDGER_COLUMNS} FROM main.transactions"] + [f"SELECT {_LEDGER_COLUMNS} FROM archive_{int(year)}.transactions" for year in years]) + ")"
+    except sqlite3.Error as e: local.errors = getattr(local, 'errors', 0) + 1; logging.error(f"Database error (archived years {years}): {e}"); raise
+    finally: profiling.flush_statements(); conn.close()
+
+def _segment_conditions(segment_start: Optional[str], segment_end: Optional[str], start_date: Optional[str], end_exclusive: Optional[str]) -> Tuple[List[str], List[Any]]:
+    """Date conditions on 't' for a segment, beyond those the caller's own range already applies."""
+    conditions: List[str] = []; params: List[Any] = []
+    if segment_start is not None and segment_start != start_date: conditions.append("t.date >= ?"); params.append(segment_start)
+    if segment_end is not None and segment_end != end_exclusive: conditions.append("t.date < ?"); params.append(segment_end)
+    return conditions, params
+
+@invalidates('transactions', 'archived_years')
+def archive_year(year: int) -> Dict[str, Any]:
+    """Moves the transactions dated in year into archive_dir()/<year>.db and returns
+    {'year', 'file', 'tx_count', 'amount_total', 'seconds'}. year must be a closed year with no unarchived
+    transactions dated before it. Raises ValueError when it cannot be archived; sqlite3.Error and OSError propagate.
+
+    Two phases, with writers held off throughout: the rows are copied into a new file that is committed, checked
+    against the source and renamed into place; then one transaction records the year and its per-account totals
+    and deletes the rows here. Until that commit the ledger is unchanged, and a file left by an interrupted run is
+    unregistered and replaced by the next attempt. The freed pages are reused by later writes."""
+    year = int(year); start, end = f"{year:04d}-01-01", f"{year + 1:04d}-01-01"; started = time.perf_counter()
+    if year >= datetime.date.today().year: raise ValueError("Only years before the current one can be archived.")
+    if any(row['year'] == year for row in get_archived_years()): raise ValueError(f"{year} is already archived.")
+    target = archive_dir() / f"{year:04d}.db"; partial = target.with_name(target.name + '.partial'); renamed = False
+    conn = _pool._open()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        earlier = conn.execute(f"SELECT COUNT(*) FROM transactions WHERE date < ? AND {_NOT_ARCHIVED_SQL.format(column='date')}", (start,)).fetchone()[0]
+        if earlier: raise ValueError(f"Archive older years first: {earlier} transactions are dated before {year}.")
+        tx_count, amount_total = conn.execute("SELECT COUNT(*), IFNULL(SUM(amount), 0) FROM transactions WHERE date >= ? AND date < ?", (start, end)).fetchone()
+        if not tx_count: raise ValueError(f"There are no transactions dated in {year}.")
+        # Phase 1: the archive file
+        target.parent.mkdir(parents=True, exist_ok=True)
+        for leftover in (partial, Path(f"{partial}-journal")): leftover.unlink(missing_ok=True)
+        archive = sqlite3.connect(partial)
+        try:
+            for statement in _ARCHIVE_SCHEMA: archive.execute(statement)
+            archive.execute("ATTACH DATABASE ? AS ledger", (str(DB_FILE),))
+            archive.execute(f"INSERT INTO main.transactions SELECT {_LEDGER_COLUMNS}, created_at FROM ledger.transactions WHERE date >= ? AND date < ?", (start, end))
+            archive.execute(f"PRAGMA user_version = {year}"); archive.commit(); archive.execute("DETACH DATABASE ledger")
+            if archive.execute("SELECT COUNT(*), IFNULL(SUM(amount), 0) FROM transactions").fetchone() != (tx_count, amount_total): raise sqlite3.DatabaseError(f"Archive file for {year} does not match the ledger.")
+        finally: archive.close()
+        os.replace(partial, target); renamed = True
+        # Phase 2: switch the ledger over
+        conn.execute("INSERT INTO archived_years (year, file, tx_count, amount_total) VALUES (?, ?, ?, ?)", (year, target.name, tx_count, amount_total))
+        conn.execute("INSERT INTO archived_balances (account_id, year, amount, tx_count) SELECT account_id, ?, SUM(amount), COUNT(*) FROM transactions WHERE date >= ? AND date < ? GROUP BY account_id", (year, start, end))
+        # The year's rollups stay: the delete trigger clears them row by row, so they are put back afterwards
+        # (no trigger is dropped, as schema changes here make other open connections reload the FTS table)
+        rollups = [tuple(row) for row in conn.execute("SELECT month, category_key, account_id, income, expense, tx_count FROM monthly_rollups WHERE month >= ? AND month < ?", (start[:7], end[:7]))]
+        conn.execute("DELETE FROM transactions WHERE date >= ? AND date < ?", (start, end))
+        conn.executemany("INSERT OR REPLACE INTO monthly_rollups (month, category_key, account_id, income, expense, tx_count) VALUES (?, ?, ?, ?, ?, ?)", rollups); conn.commit()
+    except BaseException:
+        conn.rollback()
+        if renamed: target.unlink(missing_ok=True)
+        raise
+    finally: conn.close(); partial.unlink(missing_ok=True)
+    report = {'year': year, 'file': str(target), 'tx_count': tx_count, 'amount_total': Decimal(amount_total).scaleb(-2), 'seconds': round(time.perf_counter() - started, 3)}
+    logging.info(f"Archived {tx_count} transactions of {year} to '{target}' in {report['seconds']}s.")
+    return report
+
+@invalidates('transactions', 'archived_years')
+def restore_year(year: int) -> Dict[str, Any]:
+    """Moves the newest archived year back into the ledger and deletes its file; returns {'year', 'tx_count', 'seconds'}.
+    Rows of accounts deleted since are dropped, as the delete would have cascaded to them, and categories deleted
+    since become uncategorized. One transaction re-inserts the rows, recomputes that year's monthly rollups and
+    unregisters the year; the file is removed only after it commits. Raises ValueError; sqlite3.Error propagates."""
+    year = int(year); start, end = f"{year:04d}-01-01", f"{year + 1:04d}-01-01"; started = time.perf_counter()
+    archived = {row['year']: row for row in get_archived_years()}
+    if year not in archived: raise ValueError(f"{year} is not archived.")
+    if year != max(archived): raise ValueError(f"Restore newer archived years first ({max(archived)} is the newest).")
+    path = archive_dir() / archived[year]['file']
+    if not path.is_file(): raise ValueError(f"Archive file for {year} is missing ({path}).")
+    conn = _pool._open()
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (str(path),)); _register_fingerprint_function(conn); conn.execute("BEGIN IMMEDIATE")
+        expected = (archived[year]['tx_count'], int(archived[year]['amount_total'].scaleb(2)))
+        if tuple(conn.execute("SELECT COUNT(*), IFNULL(SUM(amount), 0) FROM archive.transactions").fetchone()) != expected: raise ValueError(f"Archive file for {year} does not match its record; not restored.")
+        restored = conn.execute(f"INSERT INTO main.transactions ({_LEDGER_COLUMNS}, created_at, fingerprint) SELECT id, account_id, date, description, amount, "
+                                f"CASE WHEN category_id IN (SELECT id FROM main.categories) THEN category_id END, created_at, {_FINGERPRINT_SQL} FROM archive.transactions "
+                                "WHERE account_id IN (SELECT id FROM main.accounts)").rowcount
+        # The insert trigger added the rows to the frozen rollups again; recompute the year from its rows instead
+        conn.execute("DELETE FROM monthly_rollups WHERE month >= ? AND month < ?", (start[:7], end[:7]))
+        conn.execute(_ROLLUP_AGGREGATE_SQL.replace("WHERE id > ?", "WHERE date >= ? AND date < ?"), (start, end))
+        conn.execute("DELETE FROM archived_years WHERE year = ?", (year,)); conn.commit() # archived_balances rows cascade
+    except BaseException: conn.rollback(); raise
+    finally: conn.close()
+    path.unlink(missing_ok=True)
+    report = {'year': year, 'tx_count': restored, 'seconds': round(time.perf_counter() - started, 3)}
+    logging.info(f"Restored {restored} transactions of {year} from '{path}' in {report['seconds']}s.")
+    return report
+
+# === Query Plan Checks ===
+# Month/range queries and the access paths each is expected to use. check_query_plans() runs
+# EXPLAIN QUERY PLAN on them so a schema or query change that falls back to a table scan is caught.
+_ROLLUP_SEARCH = 'PRIMARY KEY' # monthly_rollups is WITHOUT ROWID: its primary key is the covering index
+_EXPECTED_QUERY_PLANS = {
+    'spending_for_category_month': (_SPENDING_FOR_CATEGORY_MONTH_SQL, ('2000-01', 1), (_ROLLUP_SEARCH,)),
+    'month_flow': (_MONTH_FLOW_SQL, ('2000-01',), (_ROLLUP_SEARCH,)),
+    'budget_vs_actual': (_BUDGET_VS_ACTUAL_SQL, ('2000-01', '2000-01'), (_ROLLUP_SEARCH,)),
+    'budget_matrix_spending': (_BUDGET_MATRIX_SPENDING_SQL, ('2000-01', '2000-12'), (_ROLLUP_SEARCH,)),
+    'spending_by_category': (_SPENDING_BY_CATEGORY_SQL, ('2000-02', '2000-12', '2000-01-15', '2000-02-01', '2000-12-01', '2000-12-10'),
+                             (_ROLLUP_SEARCH, 'COVERING INDEX idx_transactions_date_amount')),
+    'opening_balances': (_OPENING_BALANCES_SQL, ('2000-01', '2000-01-01', '2000-01-15'), (_ROLLUP_SEARCH, 'COVERING INDEX idx_transactions_date_account_amount')),
+    'daily_account_flows': (_DAILY_ACCOUNT_FLOWS_SQL, ('2000-01-01', '2010-01-01'), ('COVERING INDEX idx_transactions_date_account_amount',)),
+    'duplicate_probe': (_DUPLICATE_PROBE_SQL, (0,), ('INDEX idx_transactions_fingerprint',)),
+}
+
+def explain_query_plan(sql: str, params: Any = ()) -> List[str]:
+    """Returns the EXPLAIN QUERY PLAN detail lines for a statement."""
+    with get_db_connection() as conn:
+        return [row['detail'] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+def check_query_plans() -> Dict[str, List[str]]:
+    """Returns {query_name: plan_lines} for every month/range query whose plan does not seek
+    every one of its expected access paths (empty dict when all plans are as expected)."""
+    failures: Dict[str, List[str]] = {}
+    for name, (sql, params, access_paths) in _EXPECTED_QUERY_PLANS.items():
+        plan = explain_query_plan(sql, params)
+        if not all(any(line.startswith('SEARCH') and f"USING {path}" in line for line in plan) for path in access_paths):
+            failures[name] = plan; logging.warning(f"Unexpected query plan for '{name}' (expected {', '.join(access_paths)}): {plan}")
+    return failures
+
+# === Maintenance ===
+# Housekeeping run by maintenance.MaintenanceScheduler while the app is idle (or on demand as a 'maintenance'
+# job). Each returns a small result dict; sqlite3.Error propagates. None of them changes the schema, which would
+# make other open connections reload it mid-statement, except the one-off conversion VACUUM in reclaim_free_pages().
+INCREMENTAL_VACUUM_MIN_FREE_PAGES = 256     # Fewer free pages than this are left for new rows to reuse
+INCREMENTAL_VACUUM_MAX_PAGES = 16384        # Pages released per run, so one run stays short
+CONVERSION_VACUUM_FREE_FRACTION = 0.25      # Free share of a non-incremental file that justifies a full VACUUM
+
+def get_storage_stats() -> Dict[str, Any]:
+    """Page and file sizes: {'page_size', 'page_count', 'free_pages', 'auto_vacuum', 'file_bytes', 'wal_bytes'}."""
+    with get_db_connection() as conn:
+        stats = {name: conn.execute(f"PRAGMA {pragma}").fetchone()[0] for name, pragma in (('page_size', 'page_size'), ('page_count', 'page_count'), ('free_pages', 'freelist_count'), ('auto_vacuum', 'auto_vacuum'))}
+    stats['auto_vacuum'] = {0: 'none', 1: 'full', 2: 'incremental'}.get(stats['auto_vacuum'], str(stats['auto_vacuum']))
+    wal_file = DB_FILE.with_name(DB_FILE.name + '-wal')
+    stats['file_bytes'] = DB_FILE.stat().st_size if DB_FILE.exists() else 0; stats['wal_bytes'] = wal_file.stat().st_size if wal_file.exists() else 0
+    return stats
+
+def analyze_database() -> Dict[str, Any]:
+    """Refreshes the planner statistics and checks the month/range query plans against them: {'tables', 'plan_failures'}.
+    ANALYZE reads every index in full; sampled statistics (PRAGMA analysis_limit) misjudge how many rows share an
+    account and send the ledger queries down the wrong index."""
+    with get_db_connection() as conn:
+        conn.execute("ANALYZE")
+        tables = conn.execute("SELECT COUNT(DISTINCT tbl) FROM sqlite_stat1").fetchone()[0]
+    return {'tables': tables, 'plan_failures': sorted(check_query_plans())}
+
+def reclaim_free_pages(max_pages: int = INCREMENTAL_VACUUM_MAX_PAGES) -> Dict[str, Any]:
+    """Returns free pages left by deletes to the file system: up to max_pages per call with PRAGMA incremental_vacuum,
+    then a WAL checkpoint so the file actually shrinks. Files created before auto_vacuum=INCREMENTAL was set on new
+    databases are converted by one full VACUUM once CONVERSION_VACUUM_FREE_FRACTION of them is free; the idle pooled
+    connections are then reopened, as VACUUM rewrites the schema they have loaded.
+    Returns {'auto_vacuum', 'freed_pages', 'free_pages', 'full_vacuum'}."""
+    before = get_storage_stats(); full_vacuum = False
+    if before['free_pages'] < INCREMENTAL_VACUUM_MIN_FREE_PAGES: return {'auto_vacuum': before['auto_vacuum'], 'freed_pages': 0, 'free_pages': before['free_pages'], 'full_vacuum': False}
+    with get_db_connection() as conn:
+        if before['auto_vacuum'] == 'incremental': conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+        elif before['free_pages'] >= before['page_count'] * CONVERSION_VACUUM_FREE_FRACTION:
+            logging.info(f"Converting '{DB_FILE.name}' to incremental auto-vacuum ({before['free_pages']} of {before['page_count']} pages free)...")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL"); conn.execute("VACUUM"); full_vacuum = True
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    if full_vacuum: _pool.close_all()
+    after = get_storage_stats()
+    return {'auto_vacuum': after['auto_vacuum'], 'freed_pages': before['page_count'] - after['page_count'], 'free_pages': after['free_pages'], 'full_vacuum': full_vacuum}
+
+def checkpoint_wal() -> Dict[str, Any]:
+    """Copies the write-ahead log into the database and truncates it (PRAGMA wal_checkpoint(TRUNCATE)).
+    Returns {'busy', 'wal_pages', 'checkpointed_pages'}; busy is true when readers or writers kept it from finishing."""
+    with get_db_connection() as conn: busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    return {'busy': bool(busy), 'wal_pages': wal_pages, 'checkpointed_pages': checkpointed}
+
+def quick_check(max_errors: int = 20) -> Dict[str, Any]:
+    """Runs PRAGMA quick_check: {'ok', 'problems'} with at most max_errors problem descriptions."""
+    with get_db_connection() as conn: lines = [row[0] for row in conn.execute(f"PRAGMA quick_check({int(max_errors)})").fetchall()]
+    ok = lines == ['ok']
+    if not ok: logging.error(f"Database quick_check found problems: {lines}")
+    return {'ok': ok, 'problems': [] if ok else lines}
+
+# === Change Feed ===
+# Clients remember the version they last saw and ask what changed since (get_changes_since), so an edit is shown by
+# re-reading the rows it touched instead of reloading every table. The _CHANGE_LOG_TRIGGERS fill change_log;
+# prune_change_log() keeps it bounded, and a client behind what is left is told to reload (reset).
+CHANGE_FEED_MAX_CHANGES = 1000 # Log entries a client is sent at most; with more it reloads instead
+CHANGE_LOG_KEEP = 20000        # Newest entries kept by prune_change_log()
+_CHANGE_VERSION_SQL = "SELECT IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)"
+_CHANGED_ACCOUNTS_SQL = _ACCOUNT_BALANCES_SQL + " WHERE a.id IN (SELECT value FROM json_each(?)) ORDER BY a.name COLLATE NOCASE"
+
+def get_change_version() -> int:
+    """The newest change_log version (0 before the first change)."""
+    with get_db_connection() as conn: return conn.execute(_CHANGE_VERSION_SQL).fetchone()[0]
+
+def get_changes_since(version: Optional[int], limit: int = CHANGE_FEED_MAX_CHANGES) -> Dict[str, Any]:
+    """What changed after version: {'version' (the newest), 'reset': False, 'transactions': {'inserted': [rows],
+    'updated': [rows], 'deleted': [{'id', 'account_id'}]}, 'accounts': {'changed': [rows], 'deleted': [ids]},
+    'categories': {'changed': [rows], 'deleted': [ids]}}. Several changes to a row collapse into one entry with the
+    row as it is now, and a row both added and deleted since is left out. Updated rows also carry previous_account_id
+    and deleted ones the account_id the row had at version, so a client can tell whether it was in its filtered view.
+    accounts.changed also holds every account whose balance a transaction change moved. Rows have the columns of get_transactions, get_account_balances_summary
+    and get_categories. Only {'version', 'reset': True} is returned, and the client reloads what it shows, for
+    version None, a version the log no longer covers (pruned, or another database file), a bulk 'reset' entry or
+    more than limit entries. All reads see one snapshot."""
+    with snapshot_transaction() as conn:
+        cursor = conn.cursor()
+        current = cursor.execute(_CHANGE_VERSION_SQL).fetchone()[0]; reset = {'version': current, 'reset': True}
+        if version is None or version > current: return reset
+        result: Dict[str, Any] = {'version': current, 'reset': False, 'transactions': {'inserted': [], 'updated': [], 'deleted': []},
+                                  'accounts': {'changed': [], 'deleted': []}, 'categories': {'changed': [], 'deleted': []}}
+        if version == current: return result
+        oldest = cursor.execute("SELECT MIN(version) FROM change_log").fetchone()[0]
+        if oldest is None or oldest > version + 1: return reset
+        cursor.execute("SELECT table_name, row_id, op, account_id, old_account_id FROM change_log WHERE version > ? ORDER BY version LIMIT ?", (version, limit + 1)); entries = cursor.fetchall()
+        if len(entries) > limit or any(entry[2] == 'reset' for entry in entries): return reset
+        ops: Dict[Tuple[str, int], List[str]] = {}; previous_account: Dict[int, Optional[int]] = {}; account_ids = set()
+        for table, row_id, op, account_id, old_account_id in entries:
+            ops.setdefault((table, row_id), [op, op])[1] = op
+            account_ids.update(acc_id for acc_id in (account_id, old_account_id) if acc_id is not None)
+            if table == 'transactions' and row_id not in previous_account: previous_account[row_id] = old_account_id if op == 'update' else account_id # The row's account at version
+        changed: Dict[str, List[int]] = {table: [] for table in _CHANGE_LOG_TABLES}; inserted = set()
+        for (table, row_id), (first, last) in ops.items():
+            if last != 'delete':
+                changed[table].append(row_id)
+                if first == 'insert' and table == 'transactions': inserted.add(row_id)
+            elif first == 'insert': continue
+            elif table == 'transactions': result['transactions']['deleted'].append({'id': row_id, 'account_id': previous_account[row_id]})
+            else: result[table]['deleted'].append(row_id)
+        if changed['transactions']:
+            cursor.execute(f"SELECT {_TRANSACTION_COLUMNS_SQL} {_TRANSACTION_JOINS_SQL} WHERE t.id IN (SELECT value FROM json_each(?)) ORDER BY t.date DESC, t.id DESC", (json.dumps(changed['transactions']),))
+            for row in cursor:
+                if row['id'] in inserted: result['transactions']['inserted'].append(dict(row))
+                else: result['transactions']['updated'].append(dict(row, previous_account_id=previous_account[row['id']]))
+        account_ids = account_ids.union(changed['accounts']).difference(result['accounts']['deleted'])
+        if account_ids:
+            cursor.execute(_CHANGED_ACCOUNTS_SQL, (json.dumps(sorted(account_ids)),)); result['accounts']['changed'] = [dict(row) for row in cursor]
+        if changed['categories']:
+            cursor.execute("SELECT id, name, type FROM categories WHERE id IN (SELECT value FROM json_each(?)) ORDER BY name COLLATE NOCASE", (json.dumps(changed['categories']),))
+            result['categories']['changed'] = [dict(row) for row in cursor]
+    return result
+
+def prune_change_log(keep: int = CHANGE_LOG_KEEP) -> Dict[str, Any]:
+    """Deletes all but the newest keep change_log entries. Returns {'pruned', 'kept'}."""
+    with get_db_connection() as conn:
+        pruned = conn.execute("DELETE FROM change_log WHERE version <= (SELECT IFNULL(MAX(version), 0) FROM change_log) - ?", (int(keep),)).rowcount
+        kept = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+    if pruned: logging.info(f"Pruned {pruned} change log entries ({kept} kept).")
+    return {'pruned': pruned, 'kept': kept}
+
 # === Settings Functions ===
+@cached('settings')
 def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
     """Retrieves a setting value from the database."""
     sql = "SELECT value FROM settings WHERE key = ?"
@@ -468,6 +1904,7 @@ def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
         logging.error(f"Error getting setting '{key}': {e}")
         return default # Return default on error
 
+@invalidates('settings')
 def set_setting(key: str, value: str) -> bool:
     """Saves or updates a setting value in the database."""
     sql = "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)"
@@ -0,0 +1,86 @@
+# exporter.py
+"""Constant-memory export of the ledger to XLSX, CSV or Parquet.
+
+Transactions are streamed from database.iter_transaction_chunks and written chunk by chunk: XLSX through
+openpyxl's write-only workbook, CSV through csv.writer and Parquet through a pyarrow ParquetWriter (one row
+group per chunk). Nothing holds more than one chunk of the ledger in memory. Output goes to a temporary file
+next to the target that replaces it only once writing has finished, so a failed export never leaves a
+truncated file behind."""
+import csv
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    from . import database
+except ImportError:
+    import database
+
+EXPORT_FORMATS = ('xlsx', 'csv', 'parquet')
+EXPORT_CHUNK_ROWS = 10000
+_HEADERS = {'id': 'ID', 'date': 'Date', 'account_name': 'Account', 'description': 'Description', 'category_name': 'Category', 'amount': 'Amount'}
+
+def _write_xlsx(path: str, chunks: Iterator[List[tuple]]) -> int:
+    from openpyxl import Workbook  # Deferred: only needed for this format
+    workbook = Workbook(write_only=True); rows_written = 0
+    sheet = workbook.create_sheet('Transactions'); sheet.append([_HEADERS[col] for col in database.EXPORT_COLUMNS])
+    for chunk in chunks:
+        for row in chunk: sheet.append(row)
+        rows_written += len(chunk)
+    accounts_sheet = workbook.create_sheet('Accounts'); accounts_sheet.append(['ID', 'Name', 'Initial Balance'])
+    for acc in database.get_accounts(): accounts_sheet.append([acc['id'], acc['name'], acc['initial_balance']])
+    categories_sheet = workbook.create_sheet('Categories'); categories_sheet.append(['ID', 'Name', 'Type'])
+    for cat in database.get_categories(): categories_sheet.append([cat['id'], cat['name'], cat['type']])
+    workbook.save(path)
+    return rows_written
+
+def _write_csv(path: str, chunks: Iterator[List[tuple]]) -> int:
+    rows_written = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as stream: # BOM so Excel detects UTF-8
+        writer = csv.writer(stream); writer.writerow([_HEADERS[col] for col in database.EXPORT_COLUMNS])
+        for chunk in chunks: writer.writerows(chunk); rows_written += len(chunk)
+    return rows_written
+
+def _write_parquet(path: str, chunks: Iterator[List[tuple]]) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e: raise ValueError("Parquet export requires the 'pyarrow' package.") from e
+    schema = pa.schema([('id', pa.int64()), ('date', pa.string()), ('account_name', pa.string()), ('description', pa.string()),
+                        ('category_name', pa.string()), ('amount', pa.decimal128(18, 2))])
+    rows_written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays([pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+            rows_written += len(chunk)
+    return rows_written
+
+_WRITERS = {'xlsx': _write_xlsx, 'csv': _write_csv, 'parquet': _write_parquet}
+
+def _reporting_progress(chunks: Iterator[List[tuple]], progress: Callable[[int, Optional[int]], None], total: Optional[int]) -> Iterator[List[tuple]]:
+    done = 0; progress(0, total)
+    for chunk in chunks:
+        yield chunk; done += len(chunk); progress(done, total) # Once the writer has taken the chunk
+
+def export_transactions(path: str, file_format: Optional[str] = None, filters: Optional[Dict[str, Any]] = None,
+                        chunk_size: int = EXPORT_CHUNK_ROWS, progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Dict[str, Any]:
+    """Writes the filtered ledger (database._transaction_filter_clause keys) to path and returns
+    {'file', 'format', 'rows_written', 'seconds'}. XLSX also gets Accounts and Categories sheets.
+    The format defaults to the file extension. Raises ValueError for an unsupported format.
+    progress(rows_written, total_rows) is called after every chunk; an exception it raises aborts the export."""
+    file_format = (file_format or Path(path).suffix.lstrip('.')).lower()
+    if file_format not in EXPORT_FORMATS: raise ValueError(f"Unsupported export format '{file_format}'.")
+    started = time.perf_counter(); partial_path = f"{path}.partial"
+    try:
+        chunks = database.iter_transaction_chunks(filters, chunk_size)
+        if progress: chunks = _reporting_progress(chunks, progress, database.query_transactions(filters, page_size=1)['total_count'])
+        rows_written = _WRITERS[file_format](partial_path, chunks)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path): os.remove(partial_path)
+    report = {'file': str(path), 'format': file_format, 'rows_written': rows_written, 'seconds': round(time.perf_counter() - started, 3)}
+    logging.info(f"Exported {rows_written} transactions to '{path}' in {report['seconds']}s.")
+    return report
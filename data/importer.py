@@ -0,0 +1,187 @@
+# importer.py
+"""Streaming bulk import of bank export files (CSV with a configurable column mapping, OFX and QIF).
+
+Files are parsed record by record and fed straight into database.bulk_insert_transactions, so memory use does
+not grow with file size. Every record is validated with the same rules the Api uses for single transactions;
+records that fail are skipped and listed in the per-file report instead of aborting the import. Records the file
+gives no known category are categorized by the stored rules (rules.py)."""
+import csv
+import datetime
+import logging
+import os
+import re
+import time
+from functools import lru_cache
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from . import database, rules, validation
+except ImportError:
+    import database, rules, validation
+
+IMPORT_FORMATS = ('csv', 'ofx', 'qif')
+_FORMAT_BY_SUFFIX = {'.csv': 'csv', '.txt': 'csv', '.ofx': 'ofx', '.qfx': 'ofx', '.qif': 'qif'}
+MAX_REPORTED_REJECTIONS = 1000  # Rejections beyond this are still counted, just not listed
+READ_CHUNK_CHARS = 64 * 1024
+PROGRESS_EVERY_ROWS = 5000
+
+# Column references are header names (matched case-insensitively) or 0-based indexes (required without a header).
+# Use 'amount' for a signed amount column, or 'debit'/'credit' for split columns (amount = credit - debit).
+# decimal_comma None detects the decimal point per amount (see _parse_amount); True/False force ',' or '.'.
+DEFAULT_CSV_MAPPING: Dict[str, Any] = {
+    'date': 'date', 'description': 'description', 'amount': 'amount', 'debit': None, 'credit': None, 'category': None,
+    'date_format': validation.DATE_FORMAT, 'delimiter': ',', 'has_header': True, 'decimal_comma': None, 'negate': False, 'encoding': 'utf-8-sig',
+}
+_CSV_FIELDS = ('date', 'description', 'amount', 'debit', 'credit', 'category')
+QIF_DATE_FORMATS = ('%m/%d/%Y', '%m/%d/%y', '%d/%m/%Y', '%d/%m/%y', '%Y/%m/%d')  # Separators are normalized to '/'
+_QIF_TRANSACTION_TYPES = ('type:bank', 'type:cash', 'type:ccard', 'type:oth a', 'type:oth l')
+
+_OFX_TRANSACTION_RE = re.compile(r'<STMTTRN>(.*?)</STMTTRN>', re.IGNORECASE | re.DOTALL)
+_OFX_FIELD_RE = re.compile(r'<(\w+)>([^<\r\n]*)')
+_AMOUNT_JUNK_RE = re.compile(r'[^\d,.()+\-]')
+_DECIMAL_POINT_RE = re.compile(r'[,.](?=\d{1,2}$)')  # The last separator, when one or two digits follow it
+
+class ImportRowError(ValueError):
+    """A single record failed validation; the import continues without it."""
+
+# --- Field Normalization ---
+def _parse_amount(text: Optional[str], decimal_comma: Optional[bool] = None) -> Decimal:
+    """Parses bank-style amounts: currency symbols, spaces, thousands separators and (parenthesised) negatives.
+    With decimal_comma None, a ',' or '.' followed by one or two final digits is the decimal point and the other
+    separator groups thousands ('12,50', '1.234,56', '1,234.56'); without such a separator both group thousands
+    ('1,234', '1.234'). OFX and QIF allow either decimal point, so this is also how their amounts are read."""
+    cleaned = _AMOUNT_JUNK_RE.sub('', text or '')
+    if cleaned.startswith('(') and cleaned.endswith(')'): cleaned = '-' + cleaned[1:-1]
+    if decimal_comma is None: match = _DECIMAL_POINT_RE.search(cleaned); point = match.group() if match else None
+    else: point = ',' if decimal_comma else '.'
+    whole, _, fraction = cleaned.rpartition(point) if point and point in cleaned else (cleaned, '', '')
+    cleaned = whole.replace(',', '').replace('.', '') + ('.' + fraction if fraction else '')
+    amount = validation.parse_decimal_from_str(cleaned, default=None)
+    if amount is None or not amount.is_finite(): raise ImportRowError(f"Invalid amount '{text}'.")
+    return amount
+
+@lru_cache(maxsize=4096)  # Statements repeat the same few hundred dates; strptime dominates parsing otherwise
+def _parse_date(text: Optional[str], formats: Tuple[str, ...]) -> str:
+    value = (text or '').strip()
+    for date_format in formats:
+        try: return datetime.datetime.strptime(value, date_format).strftime(validation.DATE_FORMAT)
+        except ValueError: continue
+    raise ImportRowError(f"Invalid date '{text}'.")
+
+def _normalize_record(record: Dict[str, Optional[str]], date_formats: Tuple[str, ...], decimal_comma: Optional[bool], negate: bool,
+                      category_ids: Dict[str, int]) -> Tuple[str, str, Decimal, Optional[int]]:
+    """Validates one raw record into (date, description, amount, category_id). Raises ImportRowError."""
+    date_str = _parse_date(record.get('date'), date_formats)
+    description = validation.clean_description(record.get('description'))
+    if description is None: raise ImportRowError(f"Description is empty or longer than {validation.MAX_DESC_LENGTH} characters.")
+    if record.get('amount') not in (None, ''): amount = _parse_amount(record['amount'], decimal_comma)
+    elif record.get('debit') not in (None, '') or record.get('credit') not in (None, ''):
+        amount = (_parse_amount(record['credit'], decimal_comma) if record.get('credit') else Decimal('0')) - (abs(_parse_amount(record['debit'], decimal_comma)) if record.get('debit') else Decimal('0'))
+    else: raise ImportRowError("Missing amount.")
+    if negate: amount = -amount
+    category_name = (record.get('category') or '').strip().lower()
+    return date_str, description, amount.quantize(database.CENTS, rounding=ROUND_HALF_UP), category_ids.get(category_name)
+
+# --- Streaming Parsers: each yields (line number, raw record) ---
+def _resolve_csv_columns(mapping: Dict[str, Any], header: Optional[List[str]]) -> Dict[str, int]:
+    columns: Dict[str, int] = {}; lookup = {name.strip().lower(): i for i, name in enumerate(header or [])}
+    for field in _CSV_FIELDS:
+        ref = mapping.get(field)
+        if ref is None or ref == '': continue
+        if isinstance(ref, int) or (isinstance(ref, str) and ref.isdigit() and ref.strip().lower() not in lookup): columns[field] = int(ref)
+        elif str(ref).strip().lower() in lookup: columns[field] = lookup[str(ref).strip().lower()]
+        elif field in ('date', 'description') or (field == 'amount' and not (mapping.get('debit') or mapping.get('credit'))):
+            raise ValueError(f"CSV column '{ref}' for {field} not found in header.")
+    return columns
+
+def parse_csv(stream, mapping: Dict[str, Any]) -> Iterator[Tuple[int, Dict[str, Optional[str]]]]:
+    reader = csv.reader(stream, delimiter=mapping['delimiter'])
+    header = next(reader, None) if mapping['has_header'] else None
+    columns = _resolve_csv_columns(mapping, header)
+    for row in reader:
+        if not any(cell.strip() for cell in row): continue
+        yield reader.line_num, {field: (row[i] if i < len(row) else None) for field, i in columns.items()}
+
+def parse_ofx(stream) -> Iterator[Tuple[int, Dict[str, Optional[str]]]]:
+    """Scans <STMTTRN> blocks chunk by chunk; works for both SGML (OFX 1.x, unclosed field tags) and XML OFX."""
+    buffer = ''; lines_before_buffer = 0
+    while True:
+        chunk = stream.read(READ_CHUNK_CHARS)
+        if not chunk: break
+        buffer += chunk; consumed = 0
+        for match in _OFX_TRANSACTION_RE.finditer(buffer):
+            fields = {name.upper(): value.strip() for name, value in _OFX_FIELD_RE.findall(match.group(1))}
+            line_no = lines_before_buffer + buffer.count('\n', 0, match.start()) + 1
+            yield line_no, {'date': (fields.get('DTPOSTED') or '')[:8], 'description': fields.get('NAME') or fields.get('MEMO'), 'amount': fields.get('TRNAMT')}
+            consumed = match.end()
+        open_tag = buffer.upper().rfind('<STMTTRN>', consumed)
+        keep_from = open_tag if open_tag != -1 else max(consumed, len(buffer) - len('<STMTTRN>'))
+        lines_before_buffer += buffer.count('\n', 0, keep_from); buffer = buffer[keep_from:]
+
+def parse_qif(stream) -> Iterator[Tuple[int, Dict[str, Optional[str]]]]:
+    """Reads bank/cash/card QIF sections line by line; records end with '^'. Split lines are ignored."""
+    in_transactions = True; record: Dict[str, Optional[str]] = {}; record_line = 0
+    for line_no, line in enumerate(stream, 1):
+        line = line.rstrip('\r\n')
+        if not line: continue
+        code, value = line[0], line[1:].strip()
+        if code == '!':
+            if not value.lower().startswith('option'): in_transactions = value.lower() in _QIF_TRANSACTION_TYPES
+            continue
+        if code == '^':
+            if record and in_transactions: yield record_line, record
+            record = {}; continue
+        if not record: record_line = line_no
+        if code == 'D': record['date'] = value.replace("'", '/').replace('-', '/').replace(' ', '0')
+        elif code == 'T' or (code == 'U' and 'amount' not in record): record['amount'] = value
+        elif code == 'P': record['description'] = value
+        elif code == 'M': record['memo'] = value
+        elif code == 'L' and not value.startswith('['): record['category'] = value.split(':')[0]  # [Account] = transfer
+        if 'description' not in record and record.get('memo'): record['description'] = record['memo']
+    if record and in_transactions: yield record_line, record
+
+# --- Import Entry Point ---
+def detect_format(path: str) -> Optional[str]:
+    return _FORMAT_BY_SUFFIX.get(Path(path).suffix.lower())
+
+def import_file(path: str, account_id: int, file_format: Optional[str] = None, mapping: Optional[Dict[str, Any]] = None,
+                batch_size: int = database.IMPORT_BATCH_SIZE, progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Dict[str, Any]:
+    """Imports one file into account_id in a single transaction and returns the report:
+    {'file', 'format', 'rows_read', 'rows_imported', 'rows_rejected', 'rejected': [{'line', 'reason'}], 'seconds'}.
+    Raises ValueError for an unusable request (unknown account/format, bad CSV mapping); database errors propagate
+    after the whole file has been rolled back. progress(bytes_read, file_size) is called every PROGRESS_EVERY_ROWS
+    records; an exception it raises rolls the import back the same way."""
+    file_format = (file_format or detect_format(path) or '').lower()
+    if file_format not in IMPORT_FORMATS: raise ValueError(f"Unsupported import format for '{Path(path).name}'.")
+    if not any(acc['id'] == account_id for acc in database.get_accounts()): raise ValueError(f"Account ID {account_id} does not exist.")
+    options = dict(DEFAULT_CSV_MAPPING, **(mapping or {}))
+    if file_format == 'csv': date_formats: Tuple[str, ...] = (options['date_format'],)
+    elif file_format == 'ofx': date_formats = ('%Y%m%d',)
+    else: date_formats = (options['date_format'].replace('-', '/'),) + QIF_DATE_FORMATS if mapping and mapping.get('date_format') else QIF_DATE_FORMATS
+    category_ids = {row['name'].strip().lower(): row['id'] for row in database.get_categories()}
+    matcher = rules.get_matcher()
+    report: Dict[str, Any] = {'file': str(path), 'format': file_format, 'rows_read': 0, 'rows_imported': 0, 'rows_rejected': 0, 'rejected': []}
+    started = time.perf_counter(); file_size = os.path.getsize(path) if progress else None
+
+    def valid_rows(records):
+        for line_no, record in records:
+            report['rows_read'] += 1
+            if progress and report['rows_read'] % PROGRESS_EVERY_ROWS == 0: progress(stream.buffer.tell(), file_size)
+            try: date_str, description, amount, category_id = _normalize_record(record, date_formats, None if options['decimal_comma'] is None else bool(options['decimal_comma']), bool(options['negate']), category_ids)
+            except ImportRowError as e:
+                report['rows_rejected'] += 1
+                if len(report['rejected']) < MAX_REPORTED_REJECTIONS: report['rejected'].append({'line': line_no, 'reason': str(e)})
+                continue
+            if category_id is None and matcher.rule_count: category_id = matcher.category_for(account_id, description, database.adapt_decimal(amount))
+            yield account_id, date_str, description, amount, category_id
+
+    with open(path, 'r', encoding=options['encoding'], errors='replace', newline='') as stream:
+        if file_format == 'csv': records = parse_csv(stream, options)
+        elif file_format == 'ofx': records = parse_ofx(stream)
+        else: records = parse_qif(stream)
+        report['rows_imported'] = database.bulk_insert_transactions(valid_rows(records), batch_size)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    logging.info(f"Imported {report['rows_imported']} of {report['rows_read']} rows from '{path}' ({report['rows_rejected']} rejected) in {report['seconds']}s.")
+    return report
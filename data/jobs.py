@@ -0,0 +1,212 @@
+# jobs.py
+"""Background jobs for work too slow to run inside a pywebview bridge call (imports, exports, rebuilds, archiving,
+maintenance, applying categorization rules).
+
+JobManager.start() returns at once with a job id; the work runs on a small thread pool, so bridge calls such as
+get_transactions are never queued behind it. Kinds whose work is CPU-bound Python (parsing an import file,
+formatting export rows) run in a separate spawned process supervised by that pool thread, so they do not hold
+the GIL the interactive calls need; SQLite-bound kinds run on the pool thread itself, as sqlite3 releases the GIL
+while it works. A process job opens its own connection to the same database file; WAL lets interactive reads
+proceed meanwhile, and the app's pooled connections see its commits through PRAGMA data_version.
+
+Progress and cancellation share one hook: the job's work calls progress(done, total) now and then, and that
+call raises JobCancelled once cancel() has been requested, unwinding the work the way any error would (the
+import rolls back, the partial export file is removed). A process that ignores the request is terminated
+after CANCEL_GRACE_SECONDS."""
+import importlib
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from . import database
+except ImportError:
+    import database
+
+MAX_CONCURRENT_JOBS = 2 # Further jobs wait in the queue
+MAX_FINISHED_JOBS = 50 # Finished jobs kept for get_job_status; the oldest are dropped first
+PROGRESS_INTERVAL_SECONDS = 0.25 # Minimum gap between progress messages from a job process
+CANCEL_GRACE_SECONDS = 5.0
+_POLL_SECONDS = 0.1
+FINISHED_STATES = ('succeeded', 'failed', 'cancelled')
+
+class JobCancelled(Exception):
+    """Raised from a job's progress hook once the job has been cancelled."""
+
+def _data_module(name: str):
+    return importlib.import_module(f"{__package__}.{name}" if __package__ else name)
+
+# --- Job Kinds: each takes (params, progress) and returns a picklable result dict ---
+def _run_export(params: Dict[str, Any], progress: Callable[[int, Optional[int]], None]) -> Dict[str, Any]:
+    report = _data_module('exporter').export_transactions(params['path'], params.get('format'), params.get('filters'), progress=progress)
+    return {'report': report, 'message': f"Exported {report['rows_written']} transactions to {report['file'].replace(chr(92), '/')}"}
+
+def _run_import(params: Dict[str, Any], progress: Callable[[int, Optional[int]], None]) -> Dict[str, Any]:
+    report = _data_module('importer').import_file(params['path'], params['account_id'], params.get('format'), params.get('mapping'), progress=progress)
+    return {'report': report, 'message': f"Imported {report['rows_imported']} transactions ({report['rows_rejected']} rejected)."}
+
+def _run_rebuild_rollups(params: Dict[str, Any], progress: Callable[[int, Optional[int]], None]) -> Dict[str, Any]:
+    rows = database.rebuild_monthly_rollups()
+    return {'rollup_rows': rows, 'message': f"Rebuilt {rows} monthly rollup rows."}
+
+def _run_archive_year(params: Dict[str, Any], progress: Callable[[int, Optional[int]], None]) -> Dict[str, Any]:
+    progress(0, None) # Last chance to cancel: the archive itself is all-or-nothing
+    report = database.archive_year(params['year'])
+    return {'report': report, 'message': f"Archived {report['tx_count']} transactions of {report['year']}."}
+
+def _run_restore_year(params: Dict[str, Any], progress: Callable[[int, Optional[int]], None]) -> Dict[str, Any]:
+    progress(0, None)
+    report = database.restore_year(params['year'])
+    return {'report': report, 'message': f"Restored {report['tx_count']} transactions of {report['year']}."}
+
+def _run_maintenance(params: Dict[str, Any], progress: Callable[[int, Optional[int]], None]) -> Dict[str, Any]:
+    records = _data_module('maintenance').run_tasks(params.get('tasks'), progress)
+    failed = [name for name, record in records.items() if 'error' in record]
+    return {'tasks': records, 'message': f"Maintenance: {len(records) - len(failed)} task(s) done" + (f", failed: {', '.join(failed)}." if failed else ".")}
+
+def _run_apply_rules(params: Dict[str, Any], progress: Callable[[int, Optional[int]], None]) -> Dict[str, Any]:
+    report = _data_module('rules').apply_rules(params.get('scope', 'uncategorized'), params.get('filters'), progress=progress)
+    return {'report': report, 'message': f"Recategorized {report['rows_updated']} of {report['rows_scanned']} transactions."}
+
+# kind -> (runner, runs in its own process, required params)
+JOB_KINDS: Dict[str, tuple] = {
+    'export': (_run_export, True, ('path',)),
+    'import': (_run_import, True, ('path', 'account_id')),
+    'rebuild_rollups': (_run_rebuild_rollups, False, ()),
+    'archive_year': (_run_archive_year, False, ('year',)),
+    'restore_year': (_run_restore_year, False, ('year',)),
+    'maintenance': (_run_maintenance, False, ()),
+    'apply_rules': (_run_apply_rules, False, ()),
+}
+
+def _error_message(kind: str, error: Exception) -> str:
+    if isinstance(error, PermissionError): return f"Permission denied: {error.filename or error}"
+    if isinstance(error, ValueError): return str(error)
+    return f"{kind.replace('_', ' ').capitalize()} failed: {error}"
+
+def _process_main(db_file: str, kind: str, params: Dict[str, Any], messages, cancel_event):
+    """Entry point of a job process: runs one job against db_file and reports through the messages queue as
+    ('progress', done, total) tuples followed by one ('succeeded', result), ('failed', error) or ('cancelled', None)."""
+    database.set_db_file(db_file); last_sent = 0.0
+    def progress(done: int, total: Optional[int]):
+        nonlocal last_sent
+        if cancel_event.is_set(): raise JobCancelled()
+        now = time.monotonic()
+        if now - last_sent >= PROGRESS_INTERVAL_SECONDS: messages.put(('progress', done, total)); last_sent = now
+    try: messages.put(('succeeded', JOB_KINDS[kind][0](params, progress)))
+    except JobCancelled: messages.put(('cancelled', None))
+    except Exception as e: logging.exception(f"Job process for '{kind}' failed"); messages.put(('failed', _error_message(kind, e)))
+    finally: database.close_db_connections()
+
+class Job:
+    __slots__ = ('id', 'kind', 'params', 'state', 'done', 'total', 'result', 'error', 'created', 'started', 'finished', 'cancel_event')
+    def __init__(self, job_id: int, kind: str, params: Dict[str, Any], cancel_event):
+        self.id = job_id; self.kind = kind; self.params = params; self.state = 'queued'; self.done = 0; self.total: Optional[int] = None
+        self.result: Optional[Dict[str, Any]] = None; self.error: Optional[str] = None; self.cancel_event = cancel_event
+        self.created = time.time(); self.started: Optional[float] = None; self.finished: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        fraction = 1.0 if self.state == 'succeeded' else round(min(self.done / self.total, 1.0), 4) if self.total else None
+        elapsed = round((self.finished or time.time()) - self.started, 3) if self.started else None
+        return {'id': self.id, 'kind': self.kind, 'state': self.state, 'done': self.done, 'total': self.total, 'progress': fraction,
+                'result': self.result, 'error': self.error, 'cancel_requested': self.cancel_event.is_set(), 'seconds': elapsed}
+
+class JobManager:
+    """Runs jobs in the background and tracks their state: queued -> running -> succeeded | failed | cancelled."""
+    def __init__(self, max_workers: int = MAX_CONCURRENT_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._context = multiprocessing.get_context('spawn') # fork is unsafe with threads and open SQLite handles
+        self._jobs: 'OrderedDict[int, Job]' = OrderedDict(); self._lock = threading.Lock(); self._ids = itertools.count(1)
+
+    def start(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Queues a job and returns its status dict. Raises ValueError for an unknown kind or missing params."""
+        if kind not in JOB_KINDS: raise ValueError(f"Unknown job kind '{kind}'.")
+        params = dict(params or {}); missing = [name for name in JOB_KINDS[kind][2] if params.get(name) in (None, '')]
+        if missing: raise ValueError(f"Job '{kind}' requires {', '.join(missing)}.")
+        in_process = JOB_KINDS[kind][1]
+        with self._lock:
+            job = Job(next(self._ids), kind, params, self._context.Event() if in_process else threading.Event())
+            self._jobs[job.id] = job; self._prune()
+        self._executor.submit(self._run, job)
+        logging.info(f"Job {job.id} ({kind}) queued.")
+        return job.as_dict()
+
+    def status(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock: job = self._jobs.get(job_id)
+        return job.as_dict() if job else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock: jobs = list(self._jobs.values())
+        return [job.as_dict() for job in reversed(jobs)]
+
+    def cancel(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Requests cancellation; a queued job is cancelled at once, a running one at its next progress check.
+        Returns the job's status dict, or None for an unknown id."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None: return None
+            if job.state not in FINISHED_STATES: job.cancel_event.set()
+            if job.state == 'queued': job.state = 'cancelled'; job.finished = time.time()
+        logging.info(f"Job {job_id} cancellation requested.")
+        return job.as_dict()
+
+    def shutdown(self):
+        """Cancels every unfinished job and waits for the workers to stop."""
+        with self._lock: jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.state not in FINISHED_STATES: self.cancel(job.id)
+        self._executor.shutdown(wait=True)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]: del self._jobs[job_id]
+
+    def _finish(self, job: Job, state: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self._lock: job.state = state; job.result = result; job.error = error; job.finished = time.time()
+        logging.info(f"Job {job.id} ({job.kind}) {state} after {job.finished - job.started:.3f}s{': ' + error if error else ''}.")
+
+    def _run(self, job: Job):
+        with self._lock:
+            if job.state != 'queued': return # Cancelled while queued
+            job.state = 'running'; job.started = time.time()
+        runner, in_process, _ = JOB_KINDS[job.kind]
+        if in_process: self._finish(job, *self._run_in_process(job)); return
+        def progress(done: int, total: Optional[int]):
+            if job.cancel_event.is_set(): raise JobCancelled()
+            job.done = done; job.total = total
+        try: self._finish(job, 'succeeded', runner(job.params, progress))
+        except JobCancelled: self._finish(job, 'cancelled')
+        except Exception as e: logging.exception(f"Job {job.id} ({job.kind}) failed"); self._finish(job, 'failed', error=_error_message(job.kind, e))
+
+    def _run_in_process(self, job: Job) -> tuple:
+        """Runs job in a child process, relaying its progress; returns (state, result, error)."""
+        messages = self._context.Queue(); cancel_deadline: Optional[float] = None
+        process = self._context.Process(target=_process_main, args=(str(database.DB_FILE), job.kind, job.params, messages, job.cancel_event), name=f"job-{job.id}", daemon=True)
+        try: process.start()
+        except OSError as e: logging.exception(f"Job {job.id}: could not start a process"); return 'failed', None, f"Could not start job process: {e}"
+        try:
+            while True:
+                try: message = messages.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    if not process.is_alive():
+                        try: message = messages.get(timeout=_POLL_SECONDS) # A final message may still be in the pipe
+                        except queue.Empty: return 'failed', None, f"Job process exited unexpectedly (code {process.exitcode})."
+                    elif job.cancel_event.is_set():
+                        cancel_deadline = cancel_deadline or time.monotonic() + CANCEL_GRACE_SECONDS
+                        if time.monotonic() >= cancel_deadline: logging.warning(f"Job {job.id} ignored cancellation; terminating its process."); process.terminate(); return 'cancelled', None, None
+                        continue
+                    else: continue
+                if message[0] == 'progress': job.done, job.total = message[1], message[2]
+                elif message[0] == 'succeeded': return 'succeeded', message[1], None
+                elif message[0] == 'failed': return 'failed', None, message[1]
+                else: return 'cancelled', None, None
+        finally:
+            process.join(CANCEL_GRACE_SECONDS)
+            if process.is_alive(): process.kill(); process.join()
+            messages.close()
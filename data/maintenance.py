@@ -0,0 +1,104 @@
+# maintenance.py
+"""Background database maintenance: planner statistics, change log pruning, free-page reclaim, WAL checkpoints and
+integrity checks.
+
+MaintenanceScheduler runs on a daemon thread and only does work while the app is idle, i.e. no database call has
+started for IDLE_SECONDS (database.idle_seconds()) and no background job is running. Each task then runs when its
+interval has passed since its last run, one task at a time and re-checking idleness in between, so a user coming
+back waits for at most one short task. Every run is recorded in the settings table under 'maintenance_<task>' as
+JSON {"last_run", "started" (epoch seconds), "seconds", "result" | "error"}. The same tasks can be run at once as a
+'maintenance' job."""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    from . import database
+except ImportError:
+    import database
+
+IDLE_SECONDS = 60.0 # Quiet time required before any task runs
+POLL_SECONDS = 30.0
+SETTING_PREFIX = 'maintenance_'
+
+# task -> (function returning a result dict, interval in seconds). Run in this order: the change log is pruned before
+# free pages are reclaimed, reclaiming checkpoints the WAL itself, and quick_check reads the file last.
+TASKS: Dict[str, tuple] = {
+    'analyze': (database.analyze_database, 6 * 3600),
+    'prune_changes': (database.prune_change_log, 3600),
+    'reclaim': (database.reclaim_free_pages, 3600),
+    'checkpoint': (database.checkpoint_wal, 15 * 60),
+    'quick_check': (database.quick_check, 24 * 3600),
+}
+
+def get_last_runs() -> Dict[str, Optional[Dict[str, Any]]]:
+    """The recorded last run of each task ({'last_run', 'started', 'seconds', 'result' | 'error'}), or None if it never ran."""
+    runs: Dict[str, Optional[Dict[str, Any]]] = {}
+    for name in TASKS:
+        raw = database.get_setting(SETTING_PREFIX + name)
+        try: runs[name] = json.loads(raw) if raw else None
+        except ValueError: logging.warning(f"Ignoring unreadable maintenance record for '{name}': {raw!r}"); runs[name] = None
+    return runs
+
+def due_tasks(now: Optional[float] = None) -> List[str]:
+    """Tasks whose interval has passed since their last recorded run (or that never ran), in run order."""
+    now = time.time() if now is None else now; runs = get_last_runs()
+    return [name for name, (_, interval) in TASKS.items() if runs[name] is None or now - runs[name].get('started', 0) >= interval]
+
+def run_task(name: str) -> Dict[str, Any]:
+    """Runs one task now and records it. Returns the record; a failed task has 'error' instead of 'result'."""
+    if name not in TASKS: raise ValueError(f"Unknown maintenance task '{name}'.")
+    started = time.time(); timer = time.perf_counter()
+    record: Dict[str, Any] = {'last_run': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)), 'started': started}
+    with database.background_work():
+        try: record['result'] = TASKS[name][0]()
+        except (sqlite3.Error, OSError) as e: logging.warning(f"Maintenance task '{name}' failed: {e}"); record['error'] = str(e)
+        record['seconds'] = round(time.perf_counter() - timer, 3)
+        database.set_setting(SETTING_PREFIX + name, json.dumps(record))
+    logging.info(f"Maintenance task '{name}' {'failed' if 'error' in record else 'done'} in {record['seconds']}s: {record.get('result', record.get('error'))}")
+    return record
+
+def run_tasks(names: Optional[Iterable[str]] = None, progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Dict[str, Dict[str, Any]]:
+    """Runs the given tasks (default: all) in run order, regardless of their intervals."""
+    names = list(TASKS) if names is None else [name for name in TASKS if name in set(names)]
+    records = {}
+    for done, name in enumerate(names):
+        if progress: progress(done, len(names))
+        records[name] = run_task(name)
+    return records
+
+class MaintenanceScheduler:
+    """Runs due TASKS on a daemon thread whenever the app is idle. busy() may veto a run (e.g. while jobs run)."""
+    def __init__(self, busy: Optional[Callable[[], bool]] = None, idle_seconds: float = IDLE_SECONDS, poll_seconds: float = POLL_SECONDS):
+        self._busy = busy or (lambda: False); self.idle_seconds = idle_seconds; self.poll_seconds = poll_seconds
+        self._stop = threading.Event(); self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running: return
+        self._stop.clear(); self._thread = threading.Thread(target=self._loop, name='maintenance', daemon=True); self._thread.start()
+        logging.info(f"Maintenance scheduler started (idle threshold {self.idle_seconds}s).")
+
+    def stop(self, timeout: float = 10.0):
+        """Stops the thread after the task in progress, if any."""
+        self._stop.set()
+        if self._thread is not None: self._thread.join(timeout)
+
+    def _idle(self) -> bool:
+        return database.idle_seconds() >= self.idle_seconds and not self._busy()
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                with database.background_work(): # Its own lookups must not reset the idle clock
+                    if not self._idle(): continue
+                    for name in due_tasks():
+                        if self._stop.is_set() or not self._idle(): break
+                        run_task(name)
+            except Exception: logging.exception("Maintenance scheduler error")
@@ -0,0 +1,195 @@
+# profiling.py
+"""Opt-in timing of Api calls and SQL statements, collected into in-memory histograms.
+
+Disabled (the default), it costs one flag check per Api call, cursor and Connection.execute. Enabled, every
+profiled Api method is timed along with the bytes api_response serialized for it. Every statement run on a pooled
+connection is timed across execute() and the fetches that follow, with its row count, and is attributed to the
+Api method that issued it. Statements slower than the slow-query threshold are logged with their EXPLAIN QUERY PLAN.
+
+Python's sqlite3 has no per-statement profile callback, so statements are timed by ProfilingCursor, which the
+pooled connections hand out while profiling is enabled."""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from typing import Any, Dict, List, Optional
+
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500) # Bucket upper bounds; one more bucket above
+DEFAULT_SLOW_QUERY_MS = 100.0
+MAX_SLOW_QUERIES = 100 # Most recent slow statements kept for get_stats()
+MAX_SQL_KEY_CHARS = 300
+NO_API_CALL = '(no api call)' # Attribution for statements run outside a profiled Api method (e.g. startup)
+
+enabled = False
+slow_query_ms = DEFAULT_SLOW_QUERY_MS
+_lock = threading.Lock()
+_local = threading.local()
+_api_stats: Dict[str, '_Histogram'] = {}
+_sql_stats: Dict[str, '_Histogram'] = {}
+_slow_queries: deque = deque(maxlen=MAX_SLOW_QUERIES)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+class _Histogram:
+    """Latency histogram over HISTOGRAM_BOUNDS_MS plus named counters (bytes, rows, ...) and per-caller counts."""
+    __slots__ = ('count', 'total_ms', 'max_ms', 'buckets', 'counters', 'callers')
+    def __init__(self):
+        self.count = 0; self.total_ms = 0.0; self.max_ms = 0.0; self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.counters: Dict[str, float] = {}; self.callers: Dict[str, int] = {}
+
+    def add(self, ms: float, caller: Optional[str] = None, **counters: float):
+        self.count += 1; self.total_ms += ms; self.max_ms = max(self.max_ms, ms); self.buckets[bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        for name, value in counters.items(): self.counters[name] = self.counters.get(name, 0) + value
+        if caller is not None: self.callers[caller] = self.callers.get(caller, 0) + 1
+
+    def percentile_ms(self, percent: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given percentile (max_ms for the open-ended last bucket)."""
+        rank = percent / 100 * self.count; seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if bucket_count and seen >= rank: return round(min(HISTOGRAM_BOUNDS_MS[index], self.max_ms) if index < len(HISTOGRAM_BOUNDS_MS) else self.max_ms, 3)
+        return None
+
+    def as_dict(self) -> Dict[str, Any]:
+        stats = {'count': self.count, 'total_ms': round(self.total_ms, 3), 'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+                 'max_ms': round(self.max_ms, 3), 'p50_ms': self.percentile_ms(50), 'p95_ms': self.percentile_ms(95), 'buckets': list(self.buckets)}
+        stats.update({name: round(value, 3) if isinstance(value, float) else value for name, value in self.counters.items()})
+        if self.callers: stats['callers'] = dict(self.callers)
+        return stats
+
+class _CallFrame:
+    __slots__ = ('name', 'response_bytes', 'sql_count', 'sql_ms')
+    def __init__(self, name: str): self.name = name; self.response_bytes = 0; self.sql_count = 0; self.sql_ms = 0.0
+
+# --- Configuration ---
+def configure(enable: Optional[bool] = None, slow_ms: Optional[float] = None):
+    """Turns profiling on/off and/or sets the slow-query threshold in milliseconds."""
+    global enabled, slow_query_ms
+    if slow_ms is not None:
+        if slow_ms < 0: raise ValueError("Slow-query threshold cannot be negative.")
+        slow_query_ms = float(slow_ms)
+    if enable is not None: enabled = bool(enable)
+    logging.info(f"Profiling {'enabled' if enabled else 'disabled'} (slow-query threshold {slow_query_ms} ms).")
+
+def reset():
+    with _lock: _api_stats.clear(); _sql_stats.clear(); _slow_queries.clear()
+
+def get_stats() -> Dict[str, Any]:
+    """Snapshot of everything collected so far; API and SQL entries are sorted by total time, slowest first."""
+    with _lock:
+        by_total = lambda stats: dict(sorted(((key, hist.as_dict()) for key, hist in stats.items()), key=lambda item: -item[1]['total_ms']))
+        return {'enabled': enabled, 'slow_query_ms': slow_query_ms, 'bucket_bounds_ms': list(HISTOGRAM_BOUNDS_MS),
+                'api': by_total(_api_stats), 'sql': by_total(_sql_stats), 'slow_queries': list(_slow_queries)}
+
+# --- Api Calls ---
+def profiled(name: str):
+    """Times calls to an Api method under name. Nested profiled calls (e.g. inside Api.batch) are timed separately."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled: return func(*args, **kwargs)
+            frame = _CallFrame(name); parent = getattr(_local, 'call', None); _local.call = frame
+            started = time.perf_counter(); failed = True
+            try: result = func(*args, **kwargs); failed = False; return result
+            finally:
+                _finish_open_statements(frame); _local.call = parent; elapsed_ms = (time.perf_counter() - started) * 1000
+                with _lock: _api_stats.setdefault(name, _Histogram()).add(elapsed_ms, response_bytes=frame.response_bytes, sql_count=frame.sql_count, sql_ms=frame.sql_ms, errors=int(failed))
+        return wrapper
+    return decorator
+
+def profile_methods(exclude=()):
+    """Class decorator applying profiled() to every public method not listed in exclude."""
+    def decorator(cls):
+        for name, member in list(vars(cls).items()):
+            if callable(member) and not name.startswith('_') and name not in exclude: setattr(cls, name, profiled(name)(member))
+        return cls
+    return decorator
+
+def record_response_bytes(size: int):
+    """Called by api_response with the size of each serialized response."""
+    frame = getattr(_local, 'call', None)
+    if frame is not None: frame.response_bytes += size
+
+# --- SQL Statements ---
+def _record_statement(connection: sqlite3.Connection, frame: Optional[_CallFrame], sql: str, parameters: Any, seconds: float, rows: int):
+    elapsed_ms = seconds * 1000; caller = frame.name if frame else NO_API_CALL
+    if frame is not None: frame.sql_count += 1; frame.sql_ms += elapsed_ms
+    key = _WHITESPACE_RE.sub(' ', sql).strip()[:MAX_SQL_KEY_CHARS]
+    with _lock: _sql_stats.setdefault(key, _Histogram()).add(elapsed_ms, caller, rows=rows)
+    if elapsed_ms < slow_query_ms: return
+    plan: List[str] = []
+    if parameters is not None and key.split(' ', 1)[0].upper() in ('SELECT', 'WITH'):
+        try: plan = [row[3] for row in connection.cursor(sqlite3.Cursor).execute(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+        except sqlite3.Error as e: plan = [f"(EXPLAIN failed: {e})"]
+    entry = {'sql': key, 'ms': round(elapsed_ms, 3), 'rows': rows, 'api': caller, 'plan': plan, 'at': time.strftime('%Y-%m-%d %H:%M:%S')}
+    with _lock: _slow_queries.append(entry)
+    logging.warning(f"Slow query ({entry['ms']} ms, {rows} rows, from {caller}): {key} | plan: {' / '.join(plan) or 'n/a'}")
+
+def _finish_open_statements(frame: _CallFrame):
+    """Records the statements started during frame's Api call that were not read to the end."""
+    cursors = getattr(_local, 'open_cursors', None)
+    if cursors:
+        _local.open_cursors = [cursor for cursor in cursors if cursor._statement is not None and cursor._statement[4] is not frame]
+        for cursor in cursors:
+            if cursor._statement is not None and cursor._statement[4] is frame: cursor._finish()
+
+def flush_statements():
+    """Records statements whose cursors were not read to the end. Called when a pooled connection is released."""
+    cursors = getattr(_local, 'open_cursors', None)
+    if cursors:
+        _local.open_cursors = []
+        for cursor in cursors: cursor._finish()
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Cursor that times its current statement across execute() and the fetches that follow, counting rows.
+    A statement is recorded when its rows run out, when the cursor runs another statement, or at flush_statements()."""
+    _statement: Optional[list] = None # [sql, parameters, seconds, rows, Api call frame that started it]
+
+    def _start(self, sql: str, parameters: Any) -> list:
+        self._finish(); self._statement = statement = [sql, parameters, 0.0, 0, getattr(_local, 'call', None)]
+        if not hasattr(_local, 'open_cursors'): _local.open_cursors = []
+        _local.open_cursors.append(self)
+        return statement
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is not None: _record_statement(self.connection, statement[4], statement[0], statement[1], statement[2], statement[3] or max(self.rowcount, 0))
+
+    def _fetched(self, started: float, rows: int, exhausted: bool):
+        if self._statement is not None: self._statement[2] += time.perf_counter() - started; self._statement[3] += rows
+        if exhausted: self._finish()
+
+    def execute(self, sql, parameters=()):
+        statement = self._start(sql, parameters); started = time.perf_counter()
+        try: return super().execute(sql, parameters)
+        finally: statement[2] += time.perf_counter() - started
+
+    def executemany(self, sql, seq_of_parameters):
+        statement = self._start(sql, None); started = time.perf_counter() # No single parameter set to EXPLAIN with
+        try: return super().executemany(sql, seq_of_parameters)
+        finally: statement[2] += time.perf_counter() - started; self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter(); row = super().fetchone()
+        self._fetched(started, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size; started = time.perf_counter(); rows = super().fetchmany(size)
+        self._fetched(started, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter(); rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try: row = super().__next__()
+        except StopIteration: self._fetched(started, 0, True); raise
+        self._fetched(started, 1, False)
+        return row
@@ -0,0 +1,141 @@
+# rules.py
+"""Automatic transaction categorization from the rules stored in category_rules.
+
+A rule matches on the description (a keyword, i.e. a case-insensitive substring, or a regular expression), an
+optional account and an optional signed amount range, and names a category; for each transaction the first
+enabled rule in (priority, id) order that matches wins.
+
+All enabled rules compile into one RuleMatcher, cached against the category_rules generation, so it is rebuilt
+only after a rule changes. Keywords are folded into a single trie-shaped regex: one scan of a description reports
+the longest keyword starting at each position, and the shorter keywords that are prefixes of it are known in
+advance, so every keyword hit is found without trying keywords one by one. Regex rules are joined into one
+combined pattern that filters descriptions before the individual rules are tried. Descriptions repeat heavily in
+bank data, so the candidate rules are memoized per distinct description; per transaction only the account and
+amount conditions of those candidates are checked."""
+import logging
+import re
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from . import database
+except ImportError:
+    import database
+
+SCOPES = ('uncategorized', 'all')
+APPLY_BATCH_SIZE = 5000
+MAX_MEMOIZED_DESCRIPTIONS = 200000 # The per-description memo is cleared when it grows past this
+_BACKREFERENCE_RE = re.compile(r'\\[1-9]|\(\?P=') # Patterns that cannot be joined into the combined regex
+
+def normalize_keyword(text: str) -> str:
+    """Lower-cases text and collapses whitespace runs; keywords and descriptions are compared in this form."""
+    return ' '.join(text.lower().split())
+
+def validate_rule(match_type: str, pattern: str):
+    """Raises ValueError for an unknown match type or a regex that does not compile."""
+    if match_type not in database.RULE_MATCH_TYPES: raise ValueError(f"Match type must be one of {', '.join(database.RULE_MATCH_TYPES)}.")
+    if match_type == 'regex':
+        try: re.compile(pattern, re.IGNORECASE)
+        except re.error as e: raise ValueError(f"Invalid regular expression: {e}") from e
+
+def _trie_pattern(words: List[str]) -> str:
+    """A regex matching any of words, shaped like their trie so each position costs one branch per character.
+    Terminal nodes make the rest optional and greedy, so the longest word at a position is the one matched."""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word: node = node.setdefault(char, {})
+        node[''] = {}
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches: return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if '' in node else body
+    return build(trie)
+
+class RuleMatcher:
+    """The compiled form of a list of rules (rows of database.get_category_rules, in the order they are tried)."""
+    def __init__(self, rules: List[Any]):
+        self.rule_count = len(rules)
+        # Per rule, in order: (account_id, min cents, max cents, category_id)
+        self._conditions: List[Tuple[Optional[int], Optional[int], Optional[int], int]] = [
+            (rule['account_id'], None if rule['min_amount'] is None else database.adapt_decimal(rule['min_amount']),
+             None if rule['max_amount'] is None else database.adapt_decimal(rule['max_amount']), rule['category_id']) for rule in rules]
+        keyword_rules: Dict[str, List[int]] = {}; self._regex_rules: List[Tuple[int, Any]] = []; self._match_any: List[int] = []
+        for index, rule in enumerate(rules):
+            pattern = rule['pattern'] or ''
+            if rule['match_type'] == 'regex' and pattern: self._regex_rules.append((index, re.compile(pattern, re.IGNORECASE)))
+            elif normalize_keyword(pattern): keyword_rules.setdefault(normalize_keyword(pattern), []).append(index)
+            else: self._match_any.append(index)
+        # Rules hit when a keyword is the longest match at a position: its own, and those of its prefixes
+        self._keyword_hits = {keyword: [index for length in range(1, len(keyword) + 1) for index in keyword_rules.get(keyword[:length], ())] for keyword in keyword_rules}
+        self._keyword_re = re.compile(f"(?=({_trie_pattern(list(keyword_rules))}))") if keyword_rules else None
+        joinable = [regex.pattern for _, regex in self._regex_rules if not _BACKREFERENCE_RE.search(regex.pattern)]
+        self._regex_filter = None
+        if joinable and len(joinable) == len(self._regex_rules):
+            try: self._regex_filter = re.compile('|'.join(f"(?:{pattern})" for pattern in joinable), re.IGNORECASE)
+            except re.error: pass # E.g. inline global flags inside a pattern; every regex rule is tried instead
+        self._candidates: Dict[str, Tuple[int, ...]] = {}
+
+    def _match_description(self, description: str) -> Tuple[int, ...]:
+        hits = set(self._match_any)
+        if self._keyword_re is not None:
+            for keyword in self._keyword_re.findall(normalize_keyword(description)): hits.update(self._keyword_hits[keyword])
+        if self._regex_rules and (self._regex_filter is None or self._regex_filter.search(description)):
+            hits.update(index for index, regex in self._regex_rules if regex.search(description))
+        candidates = tuple(sorted(hits))
+        if len(self._candidates) >= MAX_MEMOIZED_DESCRIPTIONS: self._candidates.clear()
+        self._candidates[description] = candidates
+        return candidates
+
+    def category_for(self, account_id: int, description: str, amount_cents: int) -> Optional[int]:
+        """The category of the first rule matching the transaction, or None when no rule does."""
+        candidates = self._candidates.get(description)
+        if candidates is None: candidates = self._match_description(description)
+        for index in candidates:
+            rule_account, low, high, category_id = self._conditions[index]
+            if (rule_account is None or rule_account == account_id) and (low is None or amount_cents >= low) and (high is None or amount_cents <= high): return category_id
+        return None
+
+@database.cached('category_rules')
+def get_matcher() -> RuleMatcher:
+    """The matcher for the enabled rules; compiled once per change to category_rules and shared between callers."""
+    started = time.perf_counter(); matcher = RuleMatcher(database.get_category_rules(enabled_only=True))
+    logging.info(f"Compiled {matcher.rule_count} categorization rule(s) in {(time.perf_counter() - started) * 1000:.1f} ms.")
+    return matcher
+
+def categorize(account_id: int, description: str, amount: Decimal) -> Optional[int]:
+    """The category the rules give a single transaction, or None."""
+    matcher = get_matcher()
+    return matcher.category_for(account_id, description, database.adapt_decimal(amount)) if matcher.rule_count else None
+
+def apply_rules(scope: str = 'uncategorized', filters: Optional[Dict[str, Any]] = None, batch_size: int = APPLY_BATCH_SIZE,
+                progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Dict[str, Any]:
+    """Recategorizes this database's transactions (archived years are left as they are) that match filters
+    (database._transaction_filter_clause keys): only uncategorized ones with scope 'uncategorized', or all of
+    them with scope 'all', where a row no rule matches keeps its category. Rows are read batch_size at a time and
+    the changes of each batch are written with one UPDATE per target category; everything is one transaction,
+    so an error (or an exception raised by progress(done, total)) leaves no change behind.
+    Returns {'scope', 'rules', 'rows_scanned', 'rows_matched', 'rows_updated', 'seconds'}. Raises ValueError for an unknown scope."""
+    if scope not in SCOPES: raise ValueError(f"Scope must be one of {', '.join(SCOPES)}.")
+    started = time.perf_counter(); matcher = get_matcher(); uncategorized_only = scope == 'uncategorized'
+    report: Dict[str, Any] = {'scope': scope, 'rules': matcher.rule_count, 'rows_scanned': 0, 'rows_matched': 0, 'rows_updated': 0}
+    if matcher.rule_count:
+        category_for = matcher.category_for
+        with database.get_db_connection() as conn:
+            if not conn.in_transaction: conn.execute("BEGIN IMMEDIATE")
+            total = database.count_categorization_rows(filters, uncategorized_only) if progress else None
+            for chunk in database.iter_categorization_rows(filters, uncategorized_only, batch_size):
+                changes: Dict[int, List[int]] = {}
+                for transaction_id, account_id, description, amount, category_id in chunk:
+                    new_category = category_for(account_id, description, amount)
+                    if new_category is None: continue
+                    report['rows_matched'] += 1
+                    if new_category != category_id: changes.setdefault(new_category, []).append(transaction_id)
+                for new_category, transaction_ids in changes.items(): report['rows_updated'] += database.set_transactions_category(new_category, transaction_ids)
+                report['rows_scanned'] += len(chunk)
+                if progress: progress(report['rows_scanned'], total)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    logging.info(f"Applied {report['rules']} rule(s) to {report['rows_scanned']} transactions ({scope}): {report['rows_updated']} recategorized in {report['seconds']}s.")
+    return report
@@ -0,0 +1,27 @@
+# validation.py
+"""Input validation rules shared by the Api layer (main.py) and the bulk importer."""
+import datetime
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+# --- Input Validation Constants ---
+MAX_NAME_LENGTH = 100; MAX_DESC_LENGTH = 255; DATE_FORMAT = '%Y-%m-%d'; MONTH_FORMAT = '%Y-%m'
+
+# --- Safe String to Decimal Conversion ---
+def parse_decimal_from_str(value_str: Optional[str], default: Optional[Decimal] = Decimal('0.00')) -> Optional[Decimal]:
+    if value_str is None: return default
+    cleaned_str = str(value_str).strip()
+    if not cleaned_str: return default
+    try: return Decimal(cleaned_str.replace(',', '.'))
+    except InvalidOperation: logging.warning(f"Could not parse '{value_str}' as Decimal."); return default
+
+def is_valid_date(date_str: str) -> bool:
+    """True when date_str is a real calendar date in DATE_FORMAT (YYYY-MM-DD)."""
+    try: datetime.datetime.strptime(date_str, DATE_FORMAT); return True
+    except (TypeError, ValueError): return False
+
+def clean_description(description: Optional[str]) -> Optional[str]:
+    """Strips a description; returns None when it is empty or longer than MAX_DESC_LENGTH."""
+    cleaned = str(description or '').strip()
+    return cleaned if cleaned and len(cleaned) <= MAX_DESC_LENGTH else None
@@ -1,28 +1,43 @@
 # main.py
-import webview
+import time
+_STARTUP_T0 = time.perf_counter() # Startup timing baseline, taken before the heavier imports
+import importlib
 import os
 import sys
 import json
 import datetime
 import logging
-from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import threading
+from decimal import Decimal, ROUND_HALF_UP
 from typing import Optional, Dict, Any, List
 from pathlib import Path
-import pandas as pd # Make sure pandas is imported
 
 # Assuming database.py is in ./data/ relative to main.py or in root
 try:
     # Try importing from 'data' first
-    from data import database
+    from data import database, validation, profiling
 except ImportError:
     # Fallback if not in 'data' subdirectory
     try:
-        import database
+        import database, validation, profiling
     except ImportError:
         logging.error("Could not import database module. Ensure database.py exists (in project root or 'data' subdir).")
         sys.exit(1)
 
 
+def _data_module(name: str):
+    """Imports a data-layer module on first use, keeping import/export code off the startup path."""
+    try: return importlib.import_module(f"data.{name}")
+    except ImportError: return importlib.import_module(name)
+
+def _webview():
+    """pywebview, imported on first use so headless --serve runs without it installed; None when it is missing."""
+    try: import webview
+    except ImportError: return None
+    return webview
+
+_STARTUP_IMPORTS_DONE = time.perf_counter()
+
 # --- Setup Logging ---
 log_format = '%(asctime)s - %(levelname)s - API - %(message)s'
 logging.basicConfig(level=logging.INFO, format=log_format)
@@ -39,27 +54,302 @@ def api_response(success: bool, data: Optional[Dict[str, Any]] = None, error: Op
     if data is not None: response["data"] = data
     if error is not None: response["error"] = error
     try:
-        return json.dumps(response, cls=DecimalEncoder, ensure_ascii=True)
+        serialized = json.dumps(response, cls=DecimalEncoder, ensure_ascii=True)
+        if profiling.enabled: profiling.record_response_bytes(len(serialized))
+        return serialized
     except TypeError as e:
         logging.error(f"JSON Serialize Error: {e}. Resp: {response}", exc_info=True)
         return json.dumps({"success": False, "error": "Server serialization error."})
 
-# --- Safe String to Decimal Conversion ---
-def _parse_decimal_from_str(value_str: Optional[str], default: Decimal = Decimal('0.00')) -> Decimal:
-    if value_str is None: return default
-    cleaned_str = str(value_str).strip()
-    if not cleaned_str: return default
-    try: return Decimal(cleaned_str.replace(',', '.'))
-    except InvalidOperation: logging.warning(f"Could not parse '{value_str}' as Decimal."); return default
-
-# --- Input Validation Constants ---
-MAX_NAME_LENGTH = 100; MAX_DESC_LENGTH = 255; DATE_FORMAT = '%Y-%m-%d'; MONTH_FORMAT = '%Y-%m'
+# --- Safe String to Decimal Conversion / Input Validation Constants (shared with the importer) ---
+_parse_decimal_from_str = validation.parse_decimal_from_str
+MAX_NAME_LENGTH = validation.MAX_NAME_LENGTH; MAX_DESC_LENGTH = validation.MAX_DESC_LENGTH; DATE_FORMAT = validation.DATE_FORMAT; MONTH_FORMAT = validation.MONTH_FORMAT
+
+# --- Transaction Filter Parsing ---
+def _parse_transaction_filters(filters_json: Optional[str]) -> Dict[str, Any]:
+    """Parses and validates a JSON filter object from JS into database filter kwargs. Raises ValueError."""
+    if not filters_json or filters_json == "null": return {}
+    raw = json.loads(filters_json)
+    if not isinstance(raw, dict): raise ValueError("Filters must be a JSON object.")
+    filters: Dict[str, Any] = {}
+    for key in ('start_date', 'end_date'):
+        if raw.get(key): datetime.datetime.strptime(str(raw[key]), DATE_FORMAT); filters[key] = str(raw[key])
+    for key in ('min_amount', 'max_amount'):
+        if raw.get(key) not in (None, ''): filters[key] = _parse_decimal_from_str(str(raw[key]), default=None)
+    if raw.get('type') in ('income', 'expense'): filters['type'] = raw['type']
+    if raw.get('account_ids'): filters['account_ids'] = [int(acc_id) for acc_id in raw['account_ids']]
+    if raw.get('category_ids'): filters['category_ids'] = [None if cat_id in (None, '', 'null') else int(cat_id) for cat_id in raw['category_ids']]
+    return filters
+
+# --- Categorization Rule Parsing ---
+def _parse_rule(rule_json: Optional[str]) -> Dict[str, Any]:
+    """Parses and validates a JSON rule object from JS into database.add_category_rule kwargs. Raises ValueError/TypeError."""
+    raw = json.loads(rule_json) if rule_json and rule_json != "null" else None
+    if not isinstance(raw, dict): raise ValueError("Rule must be a JSON object.")
+    pattern = str(raw.get('pattern') or '').strip(); match_type = str(raw.get('match_type') or 'keyword').strip().lower()
+    if len(pattern) > MAX_DESC_LENGTH: raise ValueError(f"Pattern > {MAX_DESC_LENGTH} chars.")
+    _data_module('rules').validate_rule(match_type, pattern)
+    rule: Dict[str, Any] = {'category_id': int(raw['category_id']), 'pattern': pattern, 'match_type': match_type,
+                            'account_id': int(raw['account_id']) if raw.get('account_id') not in (None, '', 'null') else None,
+                            'priority': int(raw.get('priority', 100)), 'enabled': raw.get('enabled', True) not in (False, 0, '0', 'false')}
+    for key in ('min_amount', 'max_amount'):
+        rule[key] = _parse_decimal_from_str(str(raw[key]), default=None) if raw.get(key) not in (None, '') else None
+        if raw.get(key) not in (None, '') and rule[key] is None: raise ValueError(f"Invalid {key.replace('_', ' ')}.")
+    if rule['min_amount'] is not None and rule['max_amount'] is not None and rule['min_amount'] > rule['max_amount']: raise ValueError("Minimum amount is above the maximum.")
+    if not pattern and rule['account_id'] is None and rule['min_amount'] is None and rule['max_amount'] is None: raise ValueError("A rule needs a pattern, an account or an amount range.")
+    return rule
+
+# --- Background Job Parameters ---
+def _parse_job_params(kind: str, raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Validates a JSON job parameter object from JS into jobs.JobManager params. Raises ValueError/TypeError."""
+    params: Dict[str, Any] = {}
+    if kind in ('export', 'import'):
+        if not isinstance(raw.get('path'), str) or not os.path.isabs(raw['path']): raise ValueError(f"Job '{kind}' needs an absolute file path.")
+        params['path'] = raw['path']
+        if raw.get('format'): params['format'] = str(raw['format']).strip().lower()
+    if kind == 'export' and raw.get('filters'): params['filters'] = _parse_transaction_filters(json.dumps(raw['filters']))
+    if kind == 'import':
+        params['account_id'] = int(raw.get('account_id'))
+        if raw.get('mapping') is not None:
+            if not isinstance(raw['mapping'], dict): raise ValueError("CSV mapping must be a JSON object.")
+            params['mapping'] = raw['mapping']
+    if kind in ('archive_year', 'restore_year'):
+        params['year'] = int(raw.get('year'))
+        if not 1900 <= params['year'] <= 9999: raise ValueError("Year must be between 1900 and 9999.")
+    if kind == 'maintenance' and raw.get('tasks') is not None:
+        known = _data_module('maintenance').TASKS
+        if not isinstance(raw['tasks'], list) or not all(task in known for task in raw['tasks']): raise ValueError(f"Maintenance tasks must be a list of: {', '.join(known)}.")
+        params['tasks'] = raw['tasks']
+    if kind == 'apply_rules':
+        params['scope'] = str(raw.get('scope') or 'uncategorized')
+        if params['scope'] not in _data_module('rules').SCOPES: raise ValueError(f"Scope must be one of {', '.join(_data_module('rules').SCOPES)}.")
+        if raw.get('filters'): params['filters'] = _parse_transaction_filters(json.dumps(raw['filters']))
+    return params
+
+MAX_BATCH_CALLS = 50
+
+def _is_columnar(format_str: Optional[str]) -> bool:
+    """True when the caller opted into the columnar response format (column names once, arrays per column)."""
+    return str(format_str).strip().lower() == 'columnar'
 
 # --- API Class ---
+@profiling.profile_methods(exclude=('get_performance_stats', 'configure_profiling'))
 class Api:
+    # Methods that open native dialogs (and so would hold the batch transaction open) or nest batches
+    _UNBATCHABLE = frozenset({'batch', 'export_data', 'export_data_to_excel', 'import_transactions'})
+    # Methods that never write to the database; a batch made only of these runs without taking the write lock
+    _READ_ONLY = frozenset({'get_performance_stats', 'get_job_status', 'list_jobs', 'get_archived_years', 'get_maintenance_status', 'get_changes_since',
+                            'get_rules', 'get_theme_preference', 'get_accounts', 'get_transactions', 'query_transactions', 'search_transactions',
+                            'get_transaction_details', 'find_duplicates', 'get_categories', 'get_budget_data_for_month', 'get_budget_matrix',
+                            'get_spending_by_category_report', 'get_balance_history', 'get_dashboard_data'})
+
     def __init__(self):
+        self._job_manager = None; self._job_manager_lock = threading.Lock(); self._maintenance = None
         logging.info("API Initialized")
 
+    def _jobs(self):
+        """The JobManager, created on first use so the job machinery stays off the startup path."""
+        with self._job_manager_lock:
+            if self._job_manager is None: self._job_manager = _data_module('jobs').JobManager()
+            return self._job_manager
+
+    def _shutdown_jobs(self):
+        if self._job_manager is not None: self._job_manager.shutdown()
+
+    def _jobs_running(self) -> bool:
+        finished = _data_module('jobs').FINISHED_STATES
+        return self._job_manager is not None and any(job['state'] not in finished for job in self._job_manager.list())
+
+    def _start_maintenance(self):
+        """Starts the idle-time maintenance scheduler; it stands by while background jobs run."""
+        self._maintenance = _data_module('maintenance').MaintenanceScheduler(busy=self._jobs_running); self._maintenance.start()
+
+    def _stop_maintenance(self):
+        if self._maintenance is not None: self._maintenance.stop()
+
+    # === Batch Method ===
+    def batch(self, calls_json: str) -> str:
+        """Runs several Api calls in one bridge round trip, on one DB connection and snapshot.
+        calls_json is a JSON list of {"method": name, "args": [str|null, ...]}; data.results holds each
+        call's own response object, in order. Each call's response is spliced in as-is, not re-encoded.
+        A batch with any method outside _READ_ONLY takes the write lock before its first call (BEGIN IMMEDIATE,
+        waiting for other writers such as jobs or maintenance to finish), so no write in it can fail for a
+        commit made elsewhere after the batch's reads. Calls succeed or fail one by one, as data.results reports:
+        each call that may write runs in its own SAVEPOINT, rolled back when it fails or raises, so it leaves no
+        partial writes, as it would outside a batch. The writes of the calls that succeeded commit together
+        when the batch ends."""
+        try:
+            calls = json.loads(calls_json)
+            if not isinstance(calls, list) or not all(isinstance(call, dict) for call in calls): raise ValueError("not a list of objects")
+        except (ValueError, TypeError): return api_response(False, error="Batch must be a JSON list of {method, args} objects.")
+        if len(calls) > MAX_BATCH_CALLS: return api_response(False, error=f"Batch too large (max {MAX_BATCH_CALLS} calls).")
+        logging.debug(f"API: batch called with {len(calls)} call(s)")
+        results: List[str] = []
+        try:
+            writes = any(str(call.get('method', '')) not in self._READ_ONLY for call in calls)
+            with database.snapshot_transaction(write=writes) as conn:
+                for call in calls:
+                    method_name = str(call.get('method', '')); args = call.get('args') or []
+                    method = getattr(self, method_name, None) if not method_name.startswith('_') and method_name not in self._UNBATCHABLE else None
+                    if not callable(method): results.append(api_response(False, error=f"Unknown or unbatchable method '{method_name}'.")); continue
+                    if not isinstance(args, list) or not all(arg is None or isinstance(arg, str) for arg in args):
+                        results.append(api_response(False, error=f"Arguments for '{method_name}' must be strings or null.")); continue
+                    savepoint = method_name not in self._READ_ONLY
+                    if savepoint: conn.execute("SAVEPOINT batch_call")
+                    try: response = method(*args)
+                    except TypeError as e: response = api_response(False, error=f"Bad arguments for '{method_name}': {e}")
+                    except Exception: logging.exception(f"API: Unhandled error in batched {method_name}"); response = api_response(False, error=f"Error in '{method_name}'.")
+                    if savepoint and conn.in_transaction:
+                        if not response.startswith('{"success": true'): conn.execute("ROLLBACK TO batch_call") # api_response writes "success" first
+                        conn.execute("RELEASE batch_call")
+                    results.append(response)
+        except Exception as e: logging.exception("API: Error committing batch"); return api_response(False, error="Error running batch.")
+        response = '{"success": true, "data": {"results": [' + ', '.join(results) + ']}}'
+        if profiling.enabled: profiling.record_response_bytes(len(response))
+        return response
+
+    # === Profiling Methods ===
+    def get_performance_stats(self, reset_str: Optional[str] = None) -> str:
+        """Per-method and per-statement latency histograms, the slow-query log and read-cache counters.
+        reset_str 'true' clears the collected statistics after reading them."""
+        try:
+            stats = profiling.get_stats(); stats['cache'] = database.get_cache_stats()
+            if str(reset_str).lower() in ('1', 'true'): profiling.reset()
+            return api_response(True, data=stats)
+        except Exception as e: logging.exception("API: Error getting performance stats"); return api_response(False, error="Error getting performance stats.")
+
+    def configure_profiling(self, enabled_str: Optional[str] = None, slow_query_ms_str: Optional[str] = None) -> str:
+        """Turns profiling on/off ('true'/'false'; null keeps the current state) and sets the slow-query threshold (ms)."""
+        logging.info(f"API: configure_profiling Enabled:{enabled_str}, SlowMs:{slow_query_ms_str}")
+        try:
+            enable = None if enabled_str in (None, '', 'null') else str(enabled_str).lower() in ('1', 'true')
+            slow_ms = float(slow_query_ms_str) if slow_query_ms_str not in (None, '', 'null') else None
+            profiling.configure(enable, slow_ms)
+            return api_response(True, data={'enabled': profiling.enabled, 'slow_query_ms': profiling.slow_query_ms})
+        except ValueError: return api_response(False, error="Slow-query threshold must be a non-negative number of milliseconds.")
+
+    def configure_analytics_snapshot(self, enabled_str: str) -> str:
+        """Turns the in-memory analytics snapshot for reports and queries on or off ('true'/'false'); the choice is
+        saved and applied again at the next start."""
+        logging.info(f"API: configure_analytics_snapshot Enabled:{enabled_str}")
+        enable = str(enabled_str).lower() in ('1', 'true', 'on')
+        try: database.configure_analytics_snapshot(enable)
+        except ValueError as e: return api_response(False, error=str(e))
+        if not database.set_setting('analytics_snapshot', 'on' if enable else 'off'): return api_response(False, error="Snapshot setting applied but could not be saved.")
+        return api_response(True, data={'enabled': enable})
+
+    # === Background Job Methods ===
+    def start_job(self, kind: str, params_json: Optional[str] = None) -> str:
+        """Starts a background job and returns at once with its status in data.job (poll get_job_status with job.id).
+        Kinds and params: 'export' {path, format?, filters?}, 'import' {path, account_id, format?, mapping?},
+        'rebuild_rollups' {}, 'archive_year' {year}, 'restore_year' {year}, 'maintenance' {tasks?},
+        'apply_rules' {scope?, filters?}."""
+        logging.info(f"API: start_job called: Kind={kind}")
+        try:
+            raw = json.loads(params_json) if params_json and params_json != "null" else {}
+            if not isinstance(raw, dict): return api_response(False, error="Job parameters must be a JSON object.")
+            params = _parse_job_params(str(kind), raw)
+        except json.JSONDecodeError: return api_response(False, error="Invalid job parameters.")
+        except (ValueError, TypeError) as e: return api_response(False, error=str(e) if isinstance(e, ValueError) and str(e) else "Invalid job parameters.")
+        return self._start_job(str(kind), params)
+
+    def _start_job(self, kind: str, params: Dict[str, Any]) -> str:
+        try: return api_response(True, data={"job": self._jobs().start(kind, params)})
+        except ValueError as e: return api_response(False, error=str(e))
+        except Exception as e: logging.exception("API: Error starting job"); return api_response(False, error="Error starting background job.")
+
+    def get_job_status(self, job_id_str: str) -> str:
+        """State ('queued', 'running', 'succeeded', 'failed', 'cancelled'), progress (0-1 or null), result and error of a job."""
+        try: job = self._jobs().status(int(job_id_str))
+        except (ValueError, TypeError): return api_response(False, error="Invalid job ID.")
+        return api_response(True, data={"job": job}) if job else api_response(False, error=f"Job {job_id_str} not found.")
+
+    def list_jobs(self) -> str:
+        return api_response(True, data={"jobs": self._jobs().list()})
+
+    def cancel_job(self, job_id_str: str) -> str:
+        """Requests cancellation; data.job.state turns 'cancelled' once the job has stopped and rolled back."""
+        logging.info(f"API: cancel_job called: ID={job_id_str}")
+        try: job = self._jobs().cancel(int(job_id_str))
+        except (ValueError, TypeError): return api_response(False, error="Invalid job ID.")
+        return api_response(True, data={"job": job}) if job else api_response(False, error=f"Job {job_id_str} not found.")
+
+    # === Archive Methods ===
+    def get_archived_years(self) -> str:
+        """Years moved out to archive files (archive_year / restore_year jobs), oldest first, with whether each file is present."""
+        try:
+            archive_dir = database.archive_dir()
+            years = [dict(row, file_exists=(archive_dir / row['file']).is_file()) for row in database.get_archived_years()]
+            return api_response(True, data={"archived_years": years, "archive_dir": str(archive_dir)})
+        except Exception as e: logging.exception("API: Error getting archived years"); return api_response(False, error="Error getting archived years.")
+
+    # === Maintenance Methods ===
+    def get_maintenance_status(self) -> str:
+        """Last run of each maintenance task (null if never), whether it is due, and the file's page and size figures.
+        Run tasks now with start_job('maintenance', {tasks?})."""
+        try:
+            maintenance = _data_module('maintenance'); runs = maintenance.get_last_runs(); due = maintenance.due_tasks()
+            tasks = {name: dict(run=runs[name], interval_seconds=interval, due=name in due) for name, (_, interval) in maintenance.TASKS.items()}
+            return api_response(True, data={"tasks": tasks, "storage": database.get_storage_stats(), "scheduler_running": bool(self._maintenance and self._maintenance.running)})
+        except Exception as e: logging.exception("API: Error getting maintenance status"); return api_response(False, error="Error getting maintenance status.")
+
+    # === Change Feed Methods ===
+    def get_changes_since(self, version_str: Optional[str] = None) -> str:
+        """Rows changed after version (see database.get_changes_since) and the new version to ask from next time.
+        null, or data.reset true in the answer, means the caller should reload what it shows; data.version then
+        is the version that reload starts from."""
+        try: version = None if version_str in (None, '', 'null') else int(version_str)
+        except (ValueError, TypeError): return api_response(False, error="Invalid change version.")
+        try: return api_response(True, data=database.get_changes_since(version))
+        except Exception as e: logging.exception("API: Error getting changes"); return api_response(False, error="Error fetching changes.")
+
+    # === Categorization Rule Methods ===
+    def get_rules(self) -> str:
+        """Every rule in the order they are tried (priority, then id)."""
+        logging.debug("API: get_rules called")
+        try: return api_response(True, data={"rules": [dict(rule) for rule in database.get_category_rules()]})
+        except Exception as e: logging.exception("API: Error getting rules"); return api_response(False, error="Error fetching rules.")
+
+    def add_rule(self, rule_json: str) -> str:
+        """rule_json: {category_id, pattern?, match_type? ('keyword' | 'regex'), account_id?, min_amount?, max_amount?
+        (signed, inclusive), priority? (lower first, default 100), enabled?}."""
+        logging.info(f"API: add_rule called: {rule_json}")
+        try: rule = _parse_rule(rule_json)
+        except (ValueError, TypeError, KeyError) as e: return api_response(False, error=str(e) if isinstance(e, ValueError) and str(e) else "Invalid rule (category_id required).")
+        try:
+            rule_id = database.add_category_rule(**rule)
+            return api_response(True, data={"new_id": rule_id}) if rule_id else api_response(False, error="Failed to add rule (check category/account).")
+        except Exception as e: logging.exception("API: Error adding rule"); return api_response(False, error="Error adding rule.")
+
+    def update_rule(self, rule_id_str: str, rule_json: str) -> str:
+        logging.info(f"API: update_rule ID: {rule_id_str}")
+        try: rule_id = int(rule_id_str); rule = _parse_rule(rule_json)
+        except (ValueError, TypeError, KeyError) as e: return api_response(False, error=str(e) if isinstance(e, ValueError) and str(e) else "Invalid rule ID or rule.")
+        try:
+            updated = database.update_category_rule(rule_id, **rule)
+            return api_response(updated, error=None if updated else "Update failed (check rule/category/account IDs).")
+        except Exception as e: logging.exception(f"API: Error updating rule {rule_id_str}"); return api_response(False, error="Error updating rule.")
+
+    def delete_rule(self, rule_id_str: str) -> str:
+        logging.info(f"API: delete_rule ID: {rule_id_str}")
+        try:
+            deleted = database.delete_category_rule(int(rule_id_str))
+            return api_response(deleted, error=None if deleted else "Rule not found.")
+        except ValueError: return api_response(False, error="Invalid Rule ID.")
+        except Exception as e: logging.exception(f"API: Error deleting rule {rule_id_str}"); return api_response(False, error="Error deleting rule.")
+
+    def apply_rules(self, scope: Optional[str] = 'uncategorized', filters_json: Optional[str] = None) -> str:
+        """Recategorizes the (optionally filtered) ledger with the enabled rules and returns the report. scope
+        'uncategorized' only fills in missing categories; 'all' also overrides categories a rule disagrees with.
+        Runs in this call; start_job('apply_rules', {scope, filters}) runs it in the background instead."""
+        logging.info(f"API: apply_rules Scope:{scope}, Filters:{filters_json}")
+        rules = _data_module('rules')
+        try: filters = _parse_transaction_filters(filters_json)
+        except (ValueError, TypeError): return api_response(False, error="Invalid rule scope filters.")
+        try: return api_response(True, data={"report": rules.apply_rules(str(scope or 'uncategorized').strip().lower(), filters)})
+        except ValueError as e: return api_response(False, error=str(e))
+        except Exception as e: logging.exception("API: Error applying rules"); return api_response(False, error="Error applying rules.")
+
     # === Settings Methods ===
     def get_theme_preference(self) -> str:
         """Retrieves the saved theme preference from the database."""
@@ -92,9 +382,8 @@ class Api:
     def get_accounts(self) -> str:
         logging.debug("API: get_accounts called")
         try:
-            accounts_processed = database.get_all_accounts_with_balances()
-            total_balance = database.get_total_net_balance()
-            return api_response(True, data={"accounts": accounts_processed, "total_balance": total_balance})
+            summary = database.get_account_balances_summary()
+            return api_response(True, data={"accounts": summary['accounts'], "total_balance": summary['total_balance']})
         except Exception as e: logging.exception("API: Error getting accounts"); return api_response(False, error="Error fetching account data.")
 
     def add_account(self, name: str, initial_balance_str: Optional[str]) -> str:
@@ -134,17 +423,49 @@ class Api:
         except Exception as e: logging.exception(f"API: Error updating account {account_id_str}"); return api_response(False, error="Error updating account.")
 
     # === Transaction Methods ===
-    def get_transactions(self, account_id_str: Optional[str] = None, limit_str: Optional[str] = None) -> str:
-        logging.debug(f"API: get_transactions (Acc:{account_id_str}, Lim:{limit_str})")
+    def get_transactions(self, account_id_str: Optional[str] = None, limit_str: Optional[str] = None, running_balance_str: Optional[str] = None, format_str: Optional[str] = None) -> str:
+        """format_str 'columnar' returns {"columns", "values", "row_count"} with integer-cent *_cents columns (see decodeColumnar in script.js)."""
+        logging.debug(f"API: get_transactions (Acc:{account_id_str}, Lim:{limit_str}, Bal:{running_balance_str}, Fmt:{format_str})")
         try:
             account_id = int(account_id_str) if account_id_str and account_id_str != "null" and account_id_str.isdigit() else None
             limit = int(limit_str) if limit_str and limit_str.isdigit() else None
-            transactions_raw = database.get_transactions(account_id=account_id, limit=limit)
+            include_running_balance = str(running_balance_str).lower() in ('1', 'true')
+            if _is_columnar(format_str):
+                columns = database.get_transactions(account_id=account_id, limit=limit, include_running_balance=include_running_balance, columnar=True)
+                return api_response(True, data={"transactions": columns, "format": "columnar"})
+            transactions_raw = database.get_transactions(account_id=account_id, limit=limit, include_running_balance=include_running_balance)
             transactions = [dict(tran) for tran in transactions_raw] if transactions_raw else []
             return api_response(True, data={"transactions": transactions})
         except ValueError: return api_response(False, error="Invalid account ID or limit format.")
         except Exception as e: logging.exception("API: Error getting transactions"); return api_response(False, error="Error fetching transactions.")
 
+    def query_transactions(self, filters_json: Optional[str] = None, cursor: Optional[str] = None, page_size_str: Optional[str] = None, include_total_str: Optional[str] = None, format_str: Optional[str] = None) -> str:
+        """One page of the filtered ledger plus an opaque cursor for the next page (keyset pagination).
+        format_str 'columnar' returns the page as {"columns", "values", "row_count"} with integer cents."""
+        logging.debug(f"API: query_transactions (Filters:{filters_json}, Cursor:{cursor}, Size:{page_size_str}, Fmt:{format_str})")
+        try:
+            filters = _parse_transaction_filters(filters_json)
+            page_size = int(page_size_str) if page_size_str and page_size_str.isdigit() else 100
+            include_total = str(include_total_str).lower() not in ('0', 'false'); columnar = _is_columnar(format_str)
+            page = database.query_transactions(filters, cursor=cursor if cursor and cursor != "null" else None, page_size=page_size, include_total=include_total, columnar=columnar)
+            transactions = page['transactions'] if columnar else [dict(tran) for tran in page['transactions']]
+            return api_response(True, data={"transactions": transactions, "next_cursor": page['next_cursor'], "total_count": page['total_count'], "format": "columnar" if columnar else "rows"})
+        except ValueError as e: return api_response(False, error=f"Invalid filter or cursor: {e}")
+        except Exception as e: logging.exception("API: Error querying transactions"); return api_response(False, error="Error fetching transactions.")
+
+    def search_transactions(self, query: str, filters_json: Optional[str] = None, limit_str: Optional[str] = None) -> str:
+        """Full-text description search (BM25-ranked, highlighted snippets), combinable with query_transactions filters."""
+        logging.debug(f"API: search_transactions (Query:{query!r}, Filters:{filters_json})")
+        try:
+            query = str(query or '').strip()
+            if len(query) > MAX_DESC_LENGTH: return api_response(False, error=f"Search > {MAX_DESC_LENGTH} chars.")
+            filters = _parse_transaction_filters(filters_json)
+            limit = int(limit_str) if limit_str and limit_str.isdigit() else 100
+            results = database.search_transactions(query, filters, limit=limit)
+            return api_response(True, data={"transactions": results})
+        except ValueError as e: return api_response(False, error=f"Invalid search filters: {e}")
+        except Exception as e: logging.exception("API: Error searching transactions"); return api_response(False, error="Error searching transactions.")
+
     def add_transaction(self, account_id_str: str, date_str: str, description: str, amount_str: str, category_id_str: Optional[str]) -> str:
         logging.debug(f"API: add_transaction called")
         try:
@@ -157,6 +478,7 @@ class Api:
             date_str = str(date_str).strip()
             try: datetime.datetime.strptime(date_str, DATE_FORMAT)
             except ValueError: return api_response(False, error="Invalid date format (YYYY-MM-DD).")
+            if category_id is None: category_id = _data_module('rules').categorize(account_id_int, description, amount) # None when no rule matches
 
             transaction_id = database.add_transaction(account_id_int, date_str, description, amount, category_id)
             if transaction_id: return api_response(True, data={"new_id": transaction_id})
@@ -164,6 +486,7 @@ class Api:
                 exists_check = database.get_accounts()
                 if not any(acc['id'] == account_id_int for acc in exists_check): return api_response(False, error=f"Account ID {account_id_int} does not exist.")
                 else: return api_response(False, error="Database failed to add transaction.")
+        except database.DuplicateTransactionError as e: return api_response(False, data={"duplicate_of": e.duplicate_id}, error=f"This transaction already exists (ID {e.duplicate_id}).")
         except ValueError: return api_response(False, error="Invalid Account/Category ID.")
         except Exception as e: logging.exception("API: Error adding transaction"); return api_response(False, error="Error adding transaction.")
 
@@ -198,9 +521,33 @@ class Api:
 
             updated = database.update_transaction(trans_id_int, account_id_int, date_str, description, amount, category_id)
             return api_response(updated, error=None if updated else "Update failed (check IDs/data).")
+        except database.DuplicateTransactionError as e: return api_response(False, data={"duplicate_of": e.duplicate_id}, error=f"Another transaction is identical (ID {e.duplicate_id}).")
         except ValueError: return api_response(False, error="Invalid ID format.")
         except Exception as e: logging.exception(f"API: Error updating tx {transaction_id_str}"); return api_response(False, error="Error updating transaction.")
 
+    def find_duplicates(self, window_days_str: Optional[str] = '3', filters_json: Optional[str] = None, limit_str: Optional[str] = None) -> str:
+        """Groups of likely duplicate transactions: same account and amount, dated at most window_days apart (0 = same
+        day), optionally within query_transactions filters. 'exact' groups also share date and description."""
+        logging.debug(f"API: find_duplicates (Window:{window_days_str}, Filters:{filters_json})")
+        try:
+            window_days = int(window_days_str) if window_days_str not in (None, '', 'null') else 3
+            filters = _parse_transaction_filters(filters_json)
+            limit = int(limit_str) if limit_str and limit_str.isdigit() else 500
+        except (ValueError, TypeError): return api_response(False, error="Invalid duplicate search window or filters.")
+        try: return api_response(True, data=database.find_duplicates(window_days, filters or None, limit))
+        except ValueError as e: return api_response(False, error=str(e))
+        except Exception as e: logging.exception("API: Error finding duplicates"); return api_response(False, error="Error finding duplicate transactions.")
+
+    def configure_duplicate_policy(self, policy: Optional[str] = None) -> str:
+        """Sets what adding or editing an exact duplicate of a stored transaction does: 'warn' (logged, stored) or
+        'reject' (refused with data.duplicate_of). null leaves it unchanged; data.policy is the policy in effect."""
+        logging.info(f"API: configure_duplicate_policy Policy:{policy}")
+        if policy not in (None, '', 'null'):
+            policy = str(policy).strip().lower()
+            if policy not in database.DUPLICATE_POLICIES: return api_response(False, error=f"Duplicate policy must be one of {', '.join(database.DUPLICATE_POLICIES)}.")
+            if not database.set_setting('duplicate_policy', policy): return api_response(False, error="Failed to save duplicate policy.")
+        return api_response(True, data={'policy': database.get_duplicate_policy()})
+
     # === Category API Methods ===
     def get_categories(self, category_type: Optional[str] = None) -> str:
         logging.debug(f"API: get_categories (type: {category_type})")
@@ -246,22 +593,25 @@ class Api:
         logging.debug(f"API: get_budget_data_for_month M:{month_str}")
         try:
             datetime.datetime.strptime(month_str, MONTH_FORMAT)
-            expense_categories = database.get_categories(category_type='expense')
-            if not expense_categories: return api_response(True, data={"budget_data": []})
-            budgets_raw = database.get_budgets_for_month(month_str)
-            budgets_dict: Dict[int, Decimal] = {b['category_id']: b['amount'] for b in budgets_raw}
-            budget_data = []
-            for cat in expense_categories:
-                cat_id = cat['id']; cat_name = cat['name']
-                if cat_name.lower() == 'uncategorized': continue
-                budget_amount = budgets_dict.get(cat_id, Decimal('0.00'))
-                actual_spending = database.get_spending_for_category_month(cat_id, month_str)
-                budget_data.append({"category_id": cat_id, "category_name": cat_name, "budgeted_amount": budget_amount, "spent_amount": actual_spending, "remaining_amount": budget_amount - actual_spending})
-            budget_data.sort(key=lambda x: x['category_name'])
+            budget_data = database.get_budget_vs_actual_for_month(month_str)
             return api_response(True, data={"budget_data": budget_data})
         except ValueError: return api_response(False, error=f"Invalid month format: '{month_str}'.")
         except Exception as e: logging.exception("API: Error getting budget data"); return api_response(False, error="Error fetching budget data.")
 
+    def get_budget_matrix(self, end_month_str: str, months_str: Optional[str] = '12') -> str:
+        """Budget vs actual for every expense category over the trailing N months ending at end_month_str."""
+        logging.debug(f"API: get_budget_matrix End:{end_month_str}, Months:{months_str}")
+        try:
+            end_month = datetime.datetime.strptime(end_month_str, MONTH_FORMAT)
+            month_count = int(months_str) if months_str else 12
+            if not 1 <= month_count <= 120: return api_response(False, error="Month count must be between 1 and 120.")
+            start_index = end_month.year * 12 + end_month.month - 1 - (month_count - 1)
+            start_month_str = f"{start_index // 12:04d}-{start_index % 12 + 1:02d}"
+            matrix = database.get_budget_matrix(start_month_str, end_month_str)
+            return api_response(True, data=matrix)
+        except ValueError: return api_response(False, error="Invalid month format or month count.")
+        except Exception as e: logging.exception("API: Error getting budget matrix"); return api_response(False, error="Error fetching budget matrix.")
+
     def set_budget_amount(self, category_id_str: str, month_str: str, amount_str: str) -> str:
         logging.info(f"API: set_budget C:{category_id_str}, M:{month_str}")
         try:
@@ -286,16 +636,33 @@ class Api:
         except ValueError: return api_response(False, error="Invalid date format (YYYY-MM-DD).")
         except Exception as e: logging.exception("API: Error generating spending report"); return api_response(False, error="Error generating report.")
 
+    def get_balance_history(self, start_date_str: str, end_date_str: str, granularity: Optional[str] = 'monthly', account_ids_json: Optional[str] = None) -> str:
+        """Per-account and total balance series plus income/expense flows (integer cents) for a daily, weekly or
+        monthly chart. account_ids_json is a JSON list of account IDs; omitted means all accounts."""
+        logging.info(f"API: get_balance_history: {start_date_str} to {end_date_str}, {granularity}, Accs={account_ids_json}")
+        analytics = _data_module('analytics')
+        try:
+            if not start_date_str or not end_date_str: return api_response(False, error="Start/end dates required.")
+            datetime.datetime.strptime(start_date_str, DATE_FORMAT); datetime.datetime.strptime(end_date_str, DATE_FORMAT)
+            account_ids = json.loads(account_ids_json) if account_ids_json and account_ids_json != "null" else None
+            if account_ids is not None: account_ids = tuple(sorted({int(acc_id) for acc_id in account_ids}))
+        except (ValueError, TypeError): return api_response(False, error="Invalid date format (YYYY-MM-DD) or account ID list.")
+        try:
+            history = analytics.get_balance_history(start_date_str, end_date_str, str(granularity or 'monthly').strip().lower(), account_ids)
+            return api_response(True, data=history)
+        except ValueError as e: return api_response(False, error=str(e))
+        except Exception as e: logging.exception("API: Error building balance history"); return api_response(False, error="Error building balance history.")
+
     # === Dashboard Method ===
     def get_dashboard_data(self) -> str:
         logging.debug("API: get_dashboard_data called")
         try:
-            accounts = database.get_all_accounts_with_balances()
+            balances = database.get_account_balances_summary(); accounts = balances['accounts']
             recent_tx = [dict(tran) for tran in database.get_transactions(limit=15)]
             current_month = datetime.datetime.now().strftime(MONTH_FORMAT)
             flow_summary = database.get_income_expense_summary_for_month(current_month)
             dashboard_data = {
-                "accounts": accounts, "total_balance": database.get_total_net_balance(),
+                "accounts": accounts, "total_balance": balances['total_balance'],
                 "account_count": len(accounts), "recent_transactions": recent_tx,
                 "monthly_flow": flow_summary['total_income'] - flow_summary['total_expense'],
                 "current_month": current_month
@@ -306,23 +673,47 @@ class Api:
             empty = {"accounts": [], "total_balance": "0.00", "account_count": 0, "recent_transactions": [], "monthly_flow": "0.00", "current_month": ""}
             return api_response(False, data=empty, error="Error fetching dashboard data.")
 
-    # === Export Method ===
-    def export_data_to_excel(self, base_filename: str) -> str:
-        logging.info(f"API: export_data_to_excel called: '{base_filename}'")
+    # === Import Method ===
+    def import_transactions(self, account_id_str: str, format_str: Optional[str] = None, mapping_json: Optional[str] = None) -> str:
+        """Asks for a bank export file (CSV/OFX/QIF) and starts a background 'import' job streaming it into the account;
+        returns the job status (see get_job_status). mapping_json overrides importer.DEFAULT_CSV_MAPPING (column
+        names/indexes, date_format, delimiter, decimal_comma, negate, ...)."""
+        logging.info(f"API: import_transactions called: Acc={account_id_str}, Format={format_str}")
+        importer = _data_module('importer')
+        try:
+            account_id_int = int(account_id_str)
+            file_format = str(format_str).strip().lower() if format_str and format_str != "null" else None
+            if file_format and file_format not in importer.IMPORT_FORMATS: return api_response(False, error=f"Unsupported import format '{file_format}'.")
+            mapping = json.loads(mapping_json) if mapping_json and mapping_json != "null" else None
+            if mapping is not None and not isinstance(mapping, dict): return api_response(False, error="CSV mapping must be a JSON object.")
+        except (ValueError, TypeError): return api_response(False, error="Invalid account ID or CSV mapping.")
+        try:
+            webview = _webview()
+            if webview is None or not webview.windows: logging.error("Import: No active window."); return api_response(False, error="Application window not found.")
+            file_types = ('Bank exports (*.csv;*.ofx;*.qfx;*.qif)', 'All files (*.*)')
+            result = webview.windows[0].create_file_dialog(webview.OPEN_DIALOG, directory='', allow_multiple=False, file_types=file_types)
+            open_path = result[0] if isinstance(result, (tuple, list)) and result else result
+            if not open_path or not isinstance(open_path, str): logging.info("Import cancelled."); return api_response(False, error="Import cancelled.")
+            return self._start_job('import', {'path': open_path, 'account_id': account_id_int, 'format': file_format, 'mapping': mapping})
+        except Exception as e: logging.exception("API: Error during import prep"); return api_response(False, error=f"Error preparing import: {e}")
+
+    # === Export Methods ===
+    def export_data(self, base_filename: str, format_str: Optional[str] = 'xlsx', filters_json: Optional[str] = None) -> str:
+        """Asks for a target file and starts a background 'export' job streaming the (optionally filtered) ledger to
+        it as XLSX, CSV or Parquet; returns the job status (see get_job_status)."""
+        logging.info(f"API: export_data called: '{base_filename}', Format={format_str}")
+        exporter = _data_module('exporter')
+        file_format = str(format_str or 'xlsx').strip().lower()
+        if file_format not in exporter.EXPORT_FORMATS: return api_response(False, error=f"Unsupported export format '{file_format}'.")
+        try: filters = _parse_transaction_filters(filters_json)
+        except (ValueError, TypeError): return api_response(False, error="Invalid export filters.")
         safe_base_filename = "".join(c for c in base_filename if c.isalnum() or c in (' ', '_', '-')).rstrip()
         if not safe_base_filename: safe_base_filename = "financxpert_export"
-        suggested_filename = f"{safe_base_filename}.xlsx"
+        suggested_filename = f"{safe_base_filename}.{file_format}"
         logging.info(f"Suggested save filename: {suggested_filename}")
         try:
-            accounts_list = [dict(r) for r in database.get_accounts()]
-            transactions_list = [dict(r) for r in database.get_transactions()] # ALL transactions
-            categories_list = [dict(r) for r in database.get_categories()]
-
-            accounts_df = pd.DataFrame(accounts_list)[['id', 'name', 'initial_balance']]
-            transactions_df = pd.DataFrame(transactions_list)[['id', 'date', 'account_name', 'description', 'category_name', 'amount']]
-            categories_df = pd.DataFrame(categories_list)[['id', 'name', 'type']]
-
-            if not webview.windows: logging.error("Export: No active window."); return api_response(False, error="Application window not found.")
+            webview = _webview()
+            if webview is None or not webview.windows: logging.error("Export: No active window."); return api_response(False, error="Application window not found.")
             active_window = webview.windows[0]
             result = active_window.create_file_dialog( webview.SAVE_DIALOG, directory='', save_filename=suggested_filename)
             logging.info(f"File dialog result: {result!r} (Type: {type(result)})")
@@ -331,32 +722,56 @@ class Api:
             if result and isinstance(result, str) and result.strip(): save_path = result
             elif result and isinstance(result, (tuple, list)) and len(result) > 0 and isinstance(result[0], str) and result[0].strip(): save_path = result[0]
 
-            if save_path:
-                logging.info(f"Saving export to: {save_path}")
-                try:
-                    with pd.ExcelWriter(save_path, engine='openpyxl') as writer:
-                        transactions_df.to_excel(writer, sheet_name='Transactions', index=False)
-                        accounts_df.to_excel(writer, sheet_name='Accounts', index=False)
-                        categories_df.to_excel(writer, sheet_name='Categories', index=False)
-                    logging.info(f"Export successful: {save_path}")
-                    display_path = save_path.replace('\\', '/')
-                    return api_response(True, data={"message": f"Data exported to {display_path}"})
-                except PermissionError: logging.exception(f"Permission error: {save_path}"); return api_response(False, error=f"Permission denied: Cannot write to '{save_path}'.")
-                except Exception as write_error: logging.exception(f"Error writing file: {save_path}"); return api_response(False, error=f"Error writing file: {write_error}")
+            if save_path: logging.info(f"Saving export to: {save_path}"); return self._start_job('export', {'path': save_path, 'format': file_format, 'filters': filters})
             else: logging.info("Export cancelled."); return api_response(False, error="Export cancelled.")
         except Exception as e: logging.exception("API: Error during export prep"); return api_response(False, error=f"Error preparing export: {e}")
 
+    def export_data_to_excel(self, base_filename: str) -> str:
+        return self.export_data(base_filename, 'xlsx')
+
 
 # --- Main Execution ---
 if __name__ == '__main__':
+    import argparse, multiprocessing
+    multiprocessing.freeze_support() # Background job processes re-launch the frozen executable
+    parser = argparse.ArgumentParser(description="FinancXpert personal finance manager.")
+    parser.add_argument('--serve', action='store_true', help="Run headless, serving the Api as JSON endpoints over HTTP instead of opening a window")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to serve on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="Port to serve on (default: 8765; 0 picks a free port)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Api calls served at once (default: 8)")
+    parser.add_argument('--db', help="Database file to use instead of the default")
+    cli_args, _ = parser.parse_known_args() # Tolerate launcher-added arguments (e.g. macOS -psn_*)
     logging.info("Starting application...")
+    # FINANCXPERT_PROFILE=1 profiles from startup; FINANCXPERT_SLOW_QUERY_MS sets the slow-query log threshold
+    if os.environ.get('FINANCXPERT_PROFILE') or os.environ.get('FINANCXPERT_SLOW_QUERY_MS'):
+        try: profiling.configure(os.environ.get('FINANCXPERT_PROFILE', '').lower() in ('1', 'true'), float(os.environ['FINANCXPERT_SLOW_QUERY_MS']) if os.environ.get('FINANCXPERT_SLOW_QUERY_MS') else None)
+        except ValueError as e: logging.warning(f"Ignoring invalid profiling settings: {e}")
+    db_init_started = time.perf_counter()
     try:
+        if cli_args.db: database.set_db_file(cli_args.db)
         database.initialize_db()
+        # FINANCXPERT_ANALYTICS_SNAPSHOT=1/0 overrides the saved choice (Api.configure_analytics_snapshot)
+        if os.environ.get('FINANCXPERT_ANALYTICS_SNAPSHOT', database.get_setting('analytics_snapshot', 'off')).lower() in ('1', 'true', 'on'):
+            try: database.configure_analytics_snapshot(True)
+            except ValueError as e: logging.warning(f"Analytics snapshot unavailable: {e}")
     except Exception as db_init_error:
          logging.critical("CRITICAL: Database initialization failed!", exc_info=True)
          sys.exit(f"Database initialization failed: {db_init_error}")
+    db_init_done = time.perf_counter()
 
     api_instance = Api()
+    # FINANCXPERT_MAINTENANCE=0 turns off idle-time maintenance (it can still be run as a 'maintenance' job)
+    if os.environ.get('FINANCXPERT_MAINTENANCE', '1').lower() not in ('0', 'false', 'off'): api_instance._start_maintenance()
+
+    if cli_args.serve:
+        import server
+        try: server.serve(api_instance, cli_args.host, cli_args.port, cli_args.concurrency)
+        except (OSError, ValueError) as e: logging.critical(f"Could not start server: {e}"); sys.exit(1)
+        finally: api_instance._stop_maintenance(); api_instance._shutdown_jobs(); database.close_db_connections()
+        sys.exit(0)
+
+    webview = _webview()
+    if webview is None: logging.critical("pywebview is not installed; run with --serve to use the app headless."); sys.exit("pywebview is not installed.")
 
     # Determine frontend path
     if getattr(sys, 'frozen', False):
@@ -377,8 +792,12 @@ if __name__ == '__main__':
     # Define window events (optional but good practice)
     def on_loaded(): logging.info("Event: DOM Ready (window.events.loaded).")
     def on_closing(): logging.info("Event: WebView closing.")
-    def on_shown(): logging.info("Event: WebView shown.")
+    def on_shown():
+        logging.info("Event: WebView shown.")
+        logging.info(f"Startup timing: imports {(_STARTUP_IMPORTS_DONE - _STARTUP_T0) * 1000:.0f} ms, DB init {(db_init_done - db_init_started) * 1000:.0f} ms, "
+                     f"window create {(window_created - window_create_started) * 1000:.0f} ms, first window shown at {(time.perf_counter() - _STARTUP_T0) * 1000:.0f} ms")
 
+    window_create_started = time.perf_counter()
     window = webview.create_window(
         'Personal Finance v1.0',
         html_file_uri,
@@ -386,6 +805,8 @@ if __name__ == '__main__':
         width=1280, height=800, resizable=True, min_size=(1000, 650), confirm_close=False
     )
 
+    window_created = time.perf_counter()
+
     # Attach events after window creation
     window.events.loaded += on_loaded
     window.events.closing += on_closing
@@ -395,4 +816,7 @@ if __name__ == '__main__':
     logging.info("Starting pywebview event loop...")
     webview.start(debug=False) # debug=True enables dev tools
 
+    api_instance._stop_maintenance()
+    api_instance._shutdown_jobs()
+    database.close_db_connections()
     logging.info("Application finished.")
\ No newline at end of file
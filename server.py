@@ -0,0 +1,105 @@
+# server.py
+"""Headless mode: serves the Api class as JSON endpoints on localhost (python main.py --serve).
+
+    POST /api/<method>   body: JSON list of arguments (strings or null, as the frontend passes them; numbers,
+                         booleans, objects and lists are sent on as their JSON text). Empty body = no arguments.
+                         Response: the method's own {"success", "data", "error"} JSON, unchanged.
+    GET  /api            the callable methods and their parameter names.
+
+Each connection is handled on its own thread (ThreadingHTTPServer); at most `concurrency` Api calls run at once
+and the rest wait their turn. Database access goes through the same connection pool the GUI uses, sized to the
+concurrency so busy threads reuse warm connections. Methods that open native file dialogs answer with an error
+here; use start_job with an explicit path instead."""
+import inspect
+import json
+import logging
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+try:
+    from data import database
+except ImportError:
+    import database
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_CONCURRENCY = 8
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+_LOOPBACK_HOSTS = ('127.0.0.1', 'localhost')
+
+def _public_methods(api) -> Dict[str, List[str]]:
+    methods = {}
+    for name in dir(type(api)):
+        member = getattr(api, name)
+        if not name.startswith('_') and callable(member): methods[name] = list(inspect.signature(member).parameters)
+    return methods
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, api, concurrency: int):
+        super().__init__(address, ApiRequestHandler)
+        self.api = api; self.methods = _public_methods(api); self.call_slots = threading.BoundedSemaphore(concurrency)
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, so load generators can reuse connections
+    server: ApiServer
+
+    def log_message(self, format, *args): logging.debug(f"HTTP {self.address_string()} {format % args}")
+
+    def _send(self, status: HTTPStatus, body: str):
+        payload = body.encode('utf-8')
+        self.send_response(status); self.send_header('Content-Type', 'application/json'); self.send_header('Content-Length', str(len(payload)))
+        self.end_headers(); self.wfile.write(payload)
+
+    def _error(self, status: HTTPStatus, message: str):
+        self._send(status, json.dumps({"success": False, "error": message}))
+
+    def _rejected(self) -> bool:
+        # Browsers send Origin on cross-site requests; refusing them keeps web pages from driving the local API
+        if self.headers.get('Origin'): self._error(HTTPStatus.FORBIDDEN, "Cross-origin requests are not allowed."); return True
+        return False
+
+    def do_GET(self):
+        if self._rejected(): return
+        if self.path.split('?', 1)[0].rstrip('/') != '/api': self._error(HTTPStatus.NOT_FOUND, "Not found. POST /api/<method> to call a method."); return
+        self._send(HTTPStatus.OK, json.dumps({"success": True, "data": {"methods": self.server.methods}}))
+
+    def do_POST(self):
+        if self._rejected(): return
+        try: length = int(self.headers.get('Content-Length') or 0)
+        except ValueError: length = -1
+        # A bad length would raise here or block reading a body that never ends; the connection cannot be reused either way
+        if length < 0: self._error(HTTPStatus.BAD_REQUEST, "Invalid Content-Length."); self.close_connection = True; return
+        if length > MAX_REQUEST_BYTES: self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large."); self.close_connection = True; return
+        body = self.rfile.read(length) if length else b''
+        prefix, _, method_name = self.path.split('?', 1)[0].partition('/api/')
+        if prefix or method_name not in self.server.methods: self._error(HTTPStatus.NOT_FOUND, f"Unknown method '{method_name or self.path}'."); return
+        try:
+            args = json.loads(body) if body.strip() else []
+            if not isinstance(args, list): raise ValueError("not a list")
+        except ValueError: self._error(HTTPStatus.BAD_REQUEST, "Body must be a JSON list of arguments."); return
+        args = [arg if arg is None or isinstance(arg, str) else json.dumps(arg) for arg in args]
+        method = getattr(self.server.api, method_name)
+        with self.server.call_slots:
+            try: response = method(*args)
+            except TypeError as e: self._error(HTTPStatus.BAD_REQUEST, f"Bad arguments for '{method_name}': {e}"); return
+            except Exception: logging.exception(f"HTTP: Unhandled error in {method_name}"); self._error(HTTPStatus.INTERNAL_SERVER_ERROR, f"Error in '{method_name}'."); return
+        self._send(HTTPStatus.OK, response)
+
+def make_server(api, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, concurrency: int = DEFAULT_CONCURRENCY) -> ApiServer:
+    """Binds an ApiServer for api (port 0 picks a free port) and sizes the connection pool to its concurrency."""
+    if concurrency < 1: raise ValueError("Concurrency must be at least 1.")
+    if host not in _LOOPBACK_HOSTS: logging.warning(f"Serving on non-loopback address {host}: the API has no authentication.")
+    database.set_pool_size(concurrency)
+    return ApiServer((host, port), api, concurrency)
+
+def serve(api, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, concurrency: int = DEFAULT_CONCURRENCY):
+    """Serves api until interrupted (Ctrl+C)."""
+    with make_server(api, host, port, concurrency) as httpd:
+        logging.info(f"Serving {len(httpd.methods)} Api methods on http://{host}:{httpd.server_address[1]}/api (concurrency {concurrency}).")
+        try: httpd.serve_forever()
+        except KeyboardInterrupt: logging.info("Server interrupted.")
@@ -0,0 +1,16 @@
+# conftest.py
+"""Shared fixtures. Tests run against small deterministic ledgers from bench.generate, which go through the normal
+data layer, so indexes, triggers and the derived tables are populated exactly as in the app."""
+import pytest
+
+from bench import generate
+from data import database
+
+LEDGER_TRANSACTIONS = 5000
+
+@pytest.fixture
+def ledger(tmp_path):
+    """A freshly generated ledger, set as the data layer's database file; yields generate_ledger()'s summary."""
+    summary = generate.generate_ledger(str(tmp_path / 'ledger.db'), transactions=LEDGER_TRANSACTIONS, rules=0)
+    yield summary
+    database.close_db_connections()
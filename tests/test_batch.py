@@ -0,0 +1,42 @@
+# test_batch.py
+"""Api.batch: a batch that reads and then writes keeps working when another connection commits in between."""
+import json
+import threading
+from decimal import Decimal
+
+from data import database
+import main
+
+class _InterleavingApi(main.Api):
+    """get_categories also starts a write on another thread and gives it time to commit, as a background job might."""
+    outside = None
+
+    def get_categories(self, *args):
+        response = super().get_categories(*args)
+        self.outside = threading.Thread(target=database.add_account, args=('Outside', Decimal('0'))); self.outside.start(); self.outside.join(0.5)
+        return response
+
+def _batch(api, *calls):
+    return json.loads(api.batch(json.dumps([{'method': method, 'args': list(args)} for method, *args in calls])))
+
+def test_batch_read_then_write_survives_concurrent_commit(ledger):
+    api = _InterleavingApi()
+    response = _batch(api, ('get_categories',), ('add_account', 'Inside', '10.00'), ('get_accounts',))
+    api.outside.join()
+    assert response['success'] and all(result['success'] for result in response['data']['results'])
+    names = {acc['name'] for acc in database.get_accounts()}
+    assert {'Inside', 'Outside'} <= names
+
+class _PartialWriteApi(main.Api):
+    """Methods that write and then fail, like a data-layer function that catches an error after its first statement."""
+    def write_then_fail(self, name):
+        database.add_account(name, Decimal('0')); return main.api_response(False, error="Failed after writing.")
+
+    def write_then_raise(self, name):
+        database.add_account(name, Decimal('0')); raise RuntimeError("Raised after writing.")
+
+def test_failed_calls_leave_no_partial_writes(ledger):
+    response = _batch(_PartialWriteApi(), ('add_account', 'Kept', '1.00'), ('write_then_fail', 'Failed'), ('write_then_raise', 'Raised'), ('add_account', 'Also kept', '2.00'))
+    assert [result['success'] for result in response['data']['results']] == [True, False, False, True]
+    names = {acc['name'] for acc in database.get_accounts()}
+    assert {'Kept', 'Also kept'} <= names and not {'Failed', 'Raised'} & names
@@ -0,0 +1,55 @@
+# test_cache.py
+"""The read cache (database.cached/invalidates): writes bump table generations, reads inside a transaction bypass
+it, commits from other connections invalidate it, and it stays within RESULT_CACHE_SIZE."""
+import sqlite3
+import threading
+from decimal import Decimal
+
+from data import database
+
+def _stats():
+    stats = database.get_cache_stats(); return stats['hits'], stats['misses']
+
+def test_writes_bump_generations(ledger):
+    account_id = database.get_accounts()[0]['id']
+    before = database.get_account_current_balance(account_id)
+    hits, misses = _stats()
+    assert database.get_account_current_balance(account_id) == before and _stats() == (hits + 1, misses)
+    database.add_transaction(account_id, '2025-07-01', 'Cache test', Decimal('-3.00'), duplicate_policy='warn')
+    assert database.get_account_current_balance(account_id) == before - Decimal('3.00')
+    assert _stats()[1] == misses + 1
+
+def test_reads_inside_a_transaction_bypass_the_cache(ledger):
+    account_id = database.get_accounts()[0]['id']; before = database.get_account_current_balance(account_id)
+    with database.get_db_connection():
+        database.add_transaction(account_id, '2025-07-02', 'Uncommitted', Decimal('-2.00'), duplicate_policy='warn')
+        hits, misses = _stats()
+        assert database.get_account_current_balance(account_id) == before - Decimal('2.00') # Own uncommitted write
+        assert _stats() == (hits, misses) # Neither looked up nor stored
+    assert database.get_account_current_balance(account_id) == before - Decimal('2.00')
+
+def test_snapshot_reads_are_not_cached_under_newer_generations(ledger):
+    account_id = database.get_accounts()[0]['id']; before = database.get_account_current_balance(account_id); after = before - Decimal('5.00')
+    def write():
+        database.add_transaction(account_id, '2025-07-03', 'Concurrent', Decimal('-5.00'), None, 'warn')
+        database.get_accounts() # Its connection has now seen its own commit, so it detects no external change later
+    def read(): seen.append(database.get_account_current_balance(account_id))
+    seen = []
+    with database.snapshot_transaction() as conn:
+        conn.execute("SELECT COUNT(*) FROM accounts").fetchone() # Starts the read snapshot
+        writer = threading.Thread(target=write); writer.start(); writer.join()
+        assert database.get_account_current_balance(account_id) == before # The snapshot predates the commit
+        reader = threading.Thread(target=read); reader.start(); reader.join() # Reuses the writer's pooled connection
+    assert seen == [after] and database.get_account_current_balance(account_id) == after
+
+def test_commits_from_other_connections_invalidate(ledger):
+    account_id = database.get_accounts()[0]['id']; before = database.get_account_current_balance(account_id)
+    with sqlite3.connect(database.DB_FILE) as outside: outside.execute("UPDATE accounts SET initial_balance = initial_balance + 100 WHERE id = ?", (account_id,))
+    assert database.get_account_current_balance(account_id) == before + Decimal('1.00')
+
+def test_cache_size_is_bounded(ledger, monkeypatch):
+    monkeypatch.setattr(database, 'RESULT_CACHE_SIZE', 8)
+    for month in range(1, 13): database.get_income_expense_summary_for_month(f"2025-{month:02d}")
+    assert database.get_cache_stats()['size'] == 8
+    hits, _ = _stats(); database.get_income_expense_summary_for_month('2025-12'); database.get_income_expense_summary_for_month('2025-01')
+    assert _stats()[0] == hits + 1 # The newest entry is kept, the oldest was evicted
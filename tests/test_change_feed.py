@@ -0,0 +1,83 @@
+# test_change_feed.py
+"""The change_log triggers record every mutation, and get_changes_since turns them into the rows a client needs."""
+from decimal import Decimal
+
+from data import database
+
+def _balances():
+    return {acc['id']: acc['current_balance'] for acc in database.get_account_balances_summary()['accounts']}
+
+def test_transaction_changes(ledger):
+    first, second = [acc['id'] for acc in database.get_accounts()][:2]
+    version = database.get_change_version()
+    new_id = database.add_transaction(first, '2025-03-01', 'Feed test', Decimal('-10.00'), duplicate_policy='warn')
+    changes = database.get_changes_since(version)
+    assert not changes['reset'] and [row['id'] for row in changes['transactions']['inserted']] == [new_id]
+    assert changes['transactions']['inserted'][0]['amount'] == Decimal('-10.00')
+    assert [acc['id'] for acc in changes['accounts']['changed']] == [first]
+    assert changes['accounts']['changed'][0]['current_balance'] == _balances()[first]
+
+    version = changes['version']
+    assert database.update_transaction(new_id, second, '2025-03-02', 'Feed test moved', Decimal('-11.00'), duplicate_policy='warn')
+    changes = database.get_changes_since(version)
+    assert [(row['account_id'], row['previous_account_id']) for row in changes['transactions']['updated']] == [(second, first)]
+    assert not changes['transactions']['inserted']
+    balances = _balances()
+    assert {acc['id']: acc['current_balance'] for acc in changes['accounts']['changed']} == {first: balances[first], second: balances[second]}
+
+    version = changes['version']
+    assert database.delete_transaction(new_id)
+    changes = database.get_changes_since(version)
+    assert changes['transactions']['deleted'] == [{'id': new_id, 'account_id': second}]
+    assert database.get_changes_since(changes['version'])['transactions'] == {'inserted': [], 'updated': [], 'deleted': []}
+
+def test_moves_report_the_account_at_the_clients_version(ledger):
+    first, second, third = [acc['id'] for acc in database.get_accounts()][:3]
+    moved = database.add_transaction(first, '2025-03-04', 'Moved twice', Decimal('-2.00'), duplicate_policy='warn')
+    gone = database.add_transaction(first, '2025-03-05', 'Moved then deleted', Decimal('-3.00'), duplicate_policy='warn')
+    version = database.get_change_version()
+    for account_id in (second, third): database.update_transaction(moved, account_id, '2025-03-04', 'Moved twice', Decimal('-2.00'), duplicate_policy='warn')
+    database.update_transaction(gone, second, '2025-03-05', 'Moved then deleted', Decimal('-3.00'), duplicate_policy='warn'); database.delete_transaction(gone)
+    changes = database.get_changes_since(version)
+    assert [(row['id'], row['account_id'], row['previous_account_id']) for row in changes['transactions']['updated']] == [(moved, third, first)]
+    assert changes['transactions']['deleted'] == [{'id': gone, 'account_id': first}]
+    assert {acc['id'] for acc in changes['accounts']['changed']} == {first, second, third}
+
+def test_added_then_deleted_rows_collapse(ledger):
+    account_id = database.get_accounts()[0]['id']; version = database.get_change_version()
+    new_id = database.add_transaction(account_id, '2025-03-03', 'Gone again', Decimal('-1.00'), duplicate_policy='warn')
+    database.delete_transaction(new_id)
+    assert database.get_changes_since(version)['transactions'] == {'inserted': [], 'updated': [], 'deleted': []}
+
+def test_account_and_category_changes(ledger):
+    version = database.get_change_version()
+    account_id = database.add_account('Feed account', Decimal('5.00')); category_id = database.add_category('Feed category')
+    changes = database.get_changes_since(version)
+    assert [(acc['id'], acc['current_balance']) for acc in changes['accounts']['changed']] == [(account_id, Decimal('5.00'))]
+    assert changes['categories']['changed'] == [{'id': category_id, 'name': 'Feed category', 'type': 'expense'}]
+    version = changes['version']
+    assert database.delete_account(account_id) and database.delete_category(category_id)
+    changes = database.get_changes_since(version)
+    assert changes['accounts'] == {'changed': [], 'deleted': [account_id]} and changes['categories']['deleted'] == [category_id]
+
+def test_bulk_loads(ledger):
+    account_id = database.get_accounts()[0]['id']; version = database.get_change_version()
+    database.bulk_insert_transactions([(account_id, '2025-04-01', f"Small bulk {n}", Decimal('-1.00'), None) for n in range(5)])
+    changes = database.get_changes_since(version)
+    assert len(changes['transactions']['inserted']) == 5
+    rows = [(account_id, '2025-04-02', f"Large bulk {n}", Decimal('-1.00'), None) for n in range(database.CHANGE_FEED_MAX_CHANGES + 1)]
+    database.bulk_insert_transactions(rows)
+    assert database.get_changes_since(changes['version'])['reset']
+    # The triggers dropped for the load are back
+    version = database.get_change_version(); database.add_transaction(account_id, '2025-04-03', 'After bulk', Decimal('-1.00'), duplicate_policy='warn')
+    assert len(database.get_changes_since(version)['transactions']['inserted']) == 1
+
+def test_reset_for_unknown_versions(ledger):
+    current = database.get_change_version()
+    assert database.get_changes_since(None) == {'version': current, 'reset': True}
+    assert database.get_changes_since(current + 1)['reset']
+    account_id = database.get_accounts()[0]['id']
+    for n in range(5): database.add_transaction(account_id, '2025-05-01', f"Prune {n}", Decimal('-1.00'), duplicate_policy='warn')
+    assert database.prune_change_log(keep=2)['kept'] == 2
+    assert database.get_changes_since(current)['reset']
+    assert not database.get_changes_since(database.get_change_version() - 2)['reset']
@@ -0,0 +1,86 @@
+# test_importer.py
+"""Statement parsers and import_file, run against the small CSV/OFX/QIF statements in tests/fixtures."""
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+from data import database, importer
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+CSV_MAPPING = {'date': 'posted', 'description': 'PAYEE', 'amount': None, 'debit': 'Debit', 'credit': 'Credit', 'category': 'Category'}
+
+def _read(name, parser, *args):
+    with open(FIXTURES / name, 'r', encoding='utf-8', newline='') as stream: return list(parser(stream, *args))
+
+def _imported(account_id, since_id):
+    sql = 'SELECT description, amount AS "amount [CENTS]", category_id FROM transactions WHERE account_id = ? AND id > ? ORDER BY date, id'
+    with database.get_db_connection() as conn: return [tuple(row) for row in conn.execute(sql, (account_id, since_id))]
+
+def _last_id():
+    with database.get_db_connection() as conn: return conn.execute("SELECT IFNULL(MAX(id), 0) FROM transactions").fetchone()[0]
+
+@pytest.mark.parametrize('text, expected', [
+    ('12,50', '12.50'), ('-12,50', '-12.50'), ('1.234,56', '1234.56'), ('1,234.56', '1234.56'), ('1,234', '1234'),
+    ('1.234', '1234'), ('(5.00)', '-5.00'), ('$ 7.5', '7.5'), ('1 234,5 €', '1234.5'),
+])
+def test_amounts_detect_the_decimal_separator(text, expected):
+    assert importer._parse_amount(text) == Decimal(expected)
+
+def test_amount_separator_can_be_forced():
+    assert importer._parse_amount('12,50', decimal_comma=False) == Decimal('1250')
+    assert importer._parse_amount('1.234', decimal_comma=True) == Decimal('1234')
+    with pytest.raises(importer.ImportRowError): importer._parse_amount('1-2')
+
+def test_csv_columns_by_header_name():
+    rows = _read('statement.csv', importer.parse_csv, dict(importer.DEFAULT_CSV_MAPPING, **CSV_MAPPING))
+    assert [line for line, _ in rows] == [2, 3, 5, 6, 7]  # Blank line 4 is skipped
+    assert rows[0][1] == {'date': '2025-01-03', 'description': 'Coffee shop', 'debit': '4,50', 'credit': '', 'category': 'Expense 1'}
+
+def test_csv_columns_by_index():
+    mapping = dict(importer.DEFAULT_CSV_MAPPING, date=0, description='1', amount=None, debit=2, credit=3, has_header=False)
+    rows = _read('statement.csv', importer.parse_csv, mapping)
+    assert rows[0] == (1, {'date': 'Posted', 'description': 'Payee', 'debit': 'Debit', 'credit': 'Credit'})
+    assert rows[2][1]['credit'] == '1.234,56'
+
+def test_csv_missing_column_is_rejected():
+    with pytest.raises(ValueError, match="'Amount'"):
+        _read('statement.csv', importer.parse_csv, dict(importer.DEFAULT_CSV_MAPPING, date='Posted', description='Payee', amount='Amount'))
+
+def test_ofx_records_survive_chunk_boundaries(monkeypatch):
+    expected = _read('statement.ofx', importer.parse_ofx)
+    assert expected == [
+        (8, {'date': '20250103', 'description': 'Coffee shop', 'amount': '-12,50'}),
+        (14, {'date': '20250104', 'description': 'Salary', 'amount': '1234.56'}),
+        (20, {'date': '20250105', 'description': 'Bakery', 'amount': '-7.00'}),
+    ]
+    for chunk_chars in (1, 7, 16, 50):  # Tags and records split at every position
+        monkeypatch.setattr(importer, 'READ_CHUNK_CHARS', chunk_chars)
+        assert _read('statement.ofx', importer.parse_ofx) == expected
+
+def test_qif_records_and_sections():
+    assert _read('statement.qif', importer.parse_qif) == [
+        (7, {'date': '01/03/25', 'amount': '-4.50', 'description': 'Coffee shop', 'category': 'Expense 1'}),
+        (12, {'date': '1/04/2025', 'amount': '1,234.56', 'memo': 'Salary', 'description': 'Salary'}),
+        (17, {'date': '01/05/2025', 'amount': '-100.00', 'description': 'Transfer to savings'}),
+        (27, {'date': '01/06/2025', 'amount': '-20,00', 'description': 'Bookshop'}),  # No closing '^'
+    ]
+
+def test_import_reports_rejected_lines(ledger):
+    account_id = database.get_accounts()[0]['id']; since_id = _last_id()
+    category_id = next(row['id'] for row in database.get_categories() if row['name'] == 'Expense 1')
+    report = importer.import_file(str(FIXTURES / 'statement.csv'), account_id, mapping=CSV_MAPPING)
+    assert (report['format'], report['rows_read'], report['rows_imported'], report['rows_rejected']) == ('csv', 5, 3, 2)
+    assert report['rejected'] == [{'line': 6, 'reason': "Invalid date '2025-13-01'."}, {'line': 7, 'reason': "Invalid amount 'abc'."}]
+    assert _imported(account_id, since_id) == [('Coffee shop', Decimal('-4.50'), category_id), ('Salary', Decimal('1234.56'), None),
+                                               ('Bookshop', Decimal('-12.99'), category_id)]
+
+@pytest.mark.parametrize('name, expected', [
+    ('statement.ofx', [('Coffee shop', Decimal('-12.50')), ('Salary', Decimal('1234.56')), ('Bakery', Decimal('-7.00'))]),
+    ('statement.qif', [('Coffee shop', Decimal('-4.50')), ('Salary', Decimal('1234.56')), ('Transfer to savings', Decimal('-100.00')), ('Bookshop', Decimal('-20.00'))]),
+])
+def test_comma_decimal_statements(ledger, name, expected):
+    account_id = database.get_accounts()[0]['id']; since_id = _last_id()
+    report = importer.import_file(str(FIXTURES / name), account_id)
+    assert (report['rows_imported'], report['rows_rejected']) == (len(expected), 0)
+    assert [(description, amount) for description, amount, _ in _imported(account_id, since_id)] == expected
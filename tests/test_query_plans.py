@@ -0,0 +1,10 @@
+# test_query_plans.py
+"""The month/range queries keep their expected index access paths (database._EXPECTED_QUERY_PLANS)."""
+from data import database
+
+def test_query_plans_use_expected_indexes(ledger):
+    assert database.check_query_plans() == {}
+
+def test_query_plans_survive_analyze(ledger):
+    database.analyze_database()
+    assert database.check_query_plans() == {}
@@ -0,0 +1,41 @@
+# test_rollups.py
+"""monthly_rollups stays equal to a fresh aggregate of transactions through every kind of write, and the balances
+read from it match the raw ledger."""
+from decimal import Decimal
+
+from data import database
+
+def _raw_balances():
+    """{account_id: balance in cents} summed straight from transactions and archived_balances."""
+    sql = """SELECT a.id, a.initial_balance + IFNULL((SELECT SUM(amount) FROM transactions t WHERE t.account_id = a.id), 0)
+                 + IFNULL((SELECT SUM(amount) FROM archived_balances ab WHERE ab.account_id = a.id), 0) FROM accounts a"""
+    with database.get_db_connection() as conn: return dict(conn.execute(sql).fetchall())
+
+def _rollup_balances():
+    return {acc['id']: database.adapt_decimal(acc['current_balance']) for acc in database.get_account_balances_summary()['accounts']}
+
+def test_rollups_follow_single_row_writes(ledger):
+    assert database.verify_monthly_rollups() == 0
+    accounts = [acc['id'] for acc in database.get_accounts()]; categories = [cat['id'] for cat in database.get_categories()]
+    new_id = database.add_transaction(accounts[0], '2025-06-15', 'Rollup test', Decimal('-12.34'), categories[0], duplicate_policy='warn')
+    assert database.update_transaction(new_id, accounts[1], '2024-01-31', 'Rollup test moved', Decimal('56.78'), None, duplicate_policy='warn')
+    oldest = database.get_transactions(accounts[0])[-1]
+    assert database.delete_transaction(oldest['id'])
+    database.set_transactions_category(categories[1], [row['id'] for row in database.get_transactions(accounts[2], limit=50)])
+    assert database.verify_monthly_rollups() == 0
+    assert _rollup_balances() == _raw_balances()
+
+def test_rollups_follow_bulk_inserts_and_account_deletes(ledger):
+    accounts = [acc['id'] for acc in database.get_accounts()]
+    rows = [(accounts[n % 2], f"2023-0{n % 9 + 1}-1{n % 10}", f"Bulk {n}", Decimal(n - 50).scaleb(-1), None) for n in range(200)]
+    assert database.bulk_insert_transactions(rows) == 200
+    assert database.delete_account(accounts[-1])
+    assert database.verify_monthly_rollups() == 0
+    assert _rollup_balances() == _raw_balances()
+
+def test_balances_include_archived_years(ledger):
+    before = database.get_account_balances_summary()
+    database.archive_year(int(ledger['start_date'][:4]))
+    assert database.get_account_balances_summary() == before
+    assert _rollup_balances() == _raw_balances()
+    assert database.verify_monthly_rollups() == 0
@@ -0,0 +1,27 @@
+# test_running_balance.py
+"""get_transactions(include_running_balance=True) only windows over the page it returns; its balances must still
+match a window over each account's whole history, archived years included."""
+from data import database
+
+_FULL_HISTORY_SQL = """SELECT t.id, a.initial_balance + IFNULL((SELECT SUM(amount) FROM archived_balances ab WHERE ab.account_id = t.account_id), 0)
+    + SUM(t.amount) OVER (PARTITION BY t.account_id ORDER BY t.date, t.id) FROM transactions t JOIN accounts a ON a.id = t.account_id"""
+
+def _reference():
+    with database.get_db_connection() as conn: return dict(conn.execute(_FULL_HISTORY_SQL).fetchall())
+
+def _check_pages(accounts):
+    reference = _reference()
+    for account_id in [None] + accounts:
+        for limit in (1, 37, None):
+            rows = database.get_transactions(account_id, limit, include_running_balance=True)
+            assert rows and all(database.adapt_decimal(row['running_balance']) == reference[row['id']] for row in rows)
+            columnar = database.get_transactions(account_id, limit, include_running_balance=True, columnar=True)
+            ids, balances = columnar['values'][0], columnar['values'][columnar['columns'].index('running_balance_cents')]
+            assert [reference[transaction_id] for transaction_id in ids] == balances
+
+def test_running_balance_pages_match_full_history(ledger):
+    _check_pages([acc['id'] for acc in database.get_accounts()])
+
+def test_running_balance_after_archiving(ledger):
+    database.archive_year(int(ledger['start_date'][:4]))
+    _check_pages([acc['id'] for acc in database.get_accounts()])
@@ -0,0 +1,38 @@
+# test_search.py
+"""The FTS5 index over descriptions is kept in step with transactions by its triggers and bulk loads."""
+from decimal import Decimal
+
+import pytest
+
+from data import database
+
+def _search_ids(query):
+    return {row['id'] for row in database.search_transactions(query, limit=database.MAX_PAGE_SIZE)}
+
+def _like_ids(*terms):
+    sql = "SELECT id FROM transactions WHERE " + " AND ".join("description LIKE ?" for _ in terms)
+    with database.get_db_connection() as conn: return {row[0] for row in conn.execute(sql, [f"%{term}%" for term in terms])}
+
+@pytest.fixture
+def fts(ledger):
+    if not database._fts_available: pytest.skip("SQLite build without FTS5")
+    return ledger
+
+def _integrity_check():
+    with database.get_db_connection() as conn: conn.execute("INSERT INTO transactions_fts(transactions_fts, rank) VALUES ('integrity-check', 1)")
+
+def test_search_matches_substring_scan(fts):
+    assert _search_ids('coffee harb') == _like_ids('Coffee', 'Harb')
+    _integrity_check()
+
+def test_search_index_follows_writes(fts):
+    account_id = database.get_accounts()[0]['id']
+    new_id = database.add_transaction(account_id, '2025-05-05', 'Café Zanzibar', Decimal('-4.20'), duplicate_policy='warn')
+    assert _search_ids('cafe zanzibar') == {new_id}
+    assert database.update_transaction(new_id, account_id, '2025-05-05', 'Quetzal Bakery', Decimal('-4.20'), duplicate_policy='warn')
+    assert _search_ids('zanzibar') == set() and _search_ids('quetzal') == {new_id}
+    assert database.delete_transaction(new_id)
+    assert _search_ids('quetzal') == set()
+    assert database.bulk_insert_transactions([(account_id, '2025-06-01', f"Bulkword {n}", Decimal('-1.00'), None) for n in range(10)]) == 10
+    assert len(_search_ids('bulkword')) == 10
+    _integrity_check()
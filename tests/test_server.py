@@ -0,0 +1,67 @@
+# test_server.py
+"""Headless mode: python main.py --serve runs without pywebview, answers over HTTP and rejects malformed requests."""
+import http.client
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+import main
+import server
+
+ROOT = Path(__file__).resolve().parent.parent
+# Runs main.py as __main__ with pywebview made unimportable, as on a headless box without it
+_LAUNCHER = "import runpy, sys; sys.modules['webview'] = None; sys.argv[0] = 'main.py'; runpy.run_path('main.py', run_name='__main__')"
+
+def _call(port, method, *args):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/api/{method}", data=json.dumps(list(args)).encode('utf-8'), method='POST')
+    with urllib.request.urlopen(request, timeout=10) as response: return json.loads(response.read())
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="stopped with SIGINT")
+def test_serve_starts_without_pywebview(tmp_path):
+    process = subprocess.Popen([sys.executable, '-c', _LAUNCHER, '--serve', '--port', '0', '--db', str(tmp_path / 'serve.db')], cwd=ROOT,
+                               stderr=subprocess.PIPE, text=True, env=dict(os.environ, FINANCXPERT_MAINTENANCE='0'))
+    try:
+        port = None
+        for line in process.stderr:
+            match = re.search(r"Serving \d+ Api methods on http://[^:]+:(\d+)/api", line)
+            if match: port = int(match.group(1)); break
+        assert port, f"server did not start (exit code {process.poll()})"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/api", timeout=10) as response: methods = json.loads(response.read())['data']['methods']
+        assert 'get_accounts' in methods and 'batch' in methods
+        assert _call(port, 'add_account', 'Headless', '12.50')['success']
+        assert [acc['name'] for acc in _call(port, 'get_accounts')['data']['accounts']] == ['Headless']
+        assert _call(port, 'export_data', 'ledger', 'csv')['error'] == "Application window not found."
+    finally:
+        process.send_signal(signal.SIGINT); process.communicate(timeout=30)
+    assert process.returncode == 0
+
+@pytest.fixture
+def api_server(ledger):
+    httpd = server.make_server(main.Api(), port=0, concurrency=2)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True); thread.start()
+    yield httpd.server_address[1]
+    httpd.shutdown(); httpd.server_close()
+
+def _post_with_length(port, content_length):
+    """POSTs a two-byte body under a raw Content-Length header; returns (status, response JSON)."""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.putrequest('POST', '/api/get_accounts'); connection.putheader('Content-Length', content_length); connection.endheaders(b'[]')
+        response = connection.getresponse(); return response.status, json.loads(response.read())
+    finally: connection.close()
+
+@pytest.mark.parametrize('content_length', ['-1', 'abc', '1.5'])
+def test_invalid_content_length_is_rejected(api_server, content_length):
+    assert _post_with_length(api_server, content_length) == (400, {'success': False, 'error': "Invalid Content-Length."})
+
+def test_valid_content_length_is_served(api_server):
+    status, body = _post_with_length(api_server, '2')
+    assert status == 200 and body['success']
@@ -5,7 +5,14 @@ let categoryData = []; // Cache for category names/ids/types
 let currentBudgetData = {}; // Cache for budget view data {cat_id: {budget_data}}
 let currentBudgetMonth = ''; // Currently selected budget month YYYY-MM
 let spendingChart = null; // Global reference for the chart instance
+let balanceChart = null; // Balance history line chart instance
 let themeToggle; // Declare globally, assign AFTER DOM ready
+const TRANSACTIONS_PAGE_SIZE = 200; // Rows per keyset page in the transactions view
+let transactionsFilters = {}; // Active server-side filters for the transactions view
+let transactionsCursor = null; // Opaque cursor for the next transactions page (null = no more)
+let transactionsTotalCount = 0; // Total rows matching transactionsFilters
+const JOB_POLL_MS = 400; // How often a running background job (export/import) is polled
+const JOB_FINISHED_STATES = ['succeeded', 'failed', 'cancelled'];
 
 // Debounce helper
 function debounce(func, wait) {
@@ -50,6 +57,14 @@ function applyThemeAndToggle(theme) {
               spendingChart.update();
          } catch (e) { console.error("Error updating chart theme:", e); }
     }
+    if (currentView === 'reports' && balanceChart) {
+         try {
+              const textColor = getComputedStyle(document.documentElement).getPropertyValue('--text-secondary').trim();
+              balanceChart.options.plugins.legend.labels.color = textColor;
+              balanceChart.options.scales.x.ticks.color = textColor; balanceChart.options.scales.y.ticks.color = textColor;
+              balanceChart.update();
+         } catch (e) { console.error("Error updating balance chart theme:", e); }
+    }
 }
 
 // Saves theme preference using the backend API
@@ -109,12 +124,13 @@ async function waitForPywebview(timeoutMs = 5000) {
     // Check essential functions exist
     const essentialFunctions = [
         'get_accounts', 'add_account', 'delete_account', 'update_account',
-        'get_transactions', 'add_transaction', 'delete_transaction', 'update_transaction', 'get_transaction_details',
+        'get_transactions', 'query_transactions', 'search_transactions', 'add_transaction', 'delete_transaction', 'update_transaction', 'get_transaction_details',
         'get_categories', 'add_category', 'delete_category', 'update_category',
         'get_budget_data_for_month', 'set_budget_amount',
-        'get_spending_by_category_report',
+        'get_spending_by_category_report', 'get_balance_history',
         'get_dashboard_data',
-        'export_data_to_excel',
+        'export_data', 'import_transactions', 'batch',
+        'start_job', 'get_job_status', 'cancel_job', 'get_archived_years',
         'get_theme_preference', 
         'save_theme_preference'
      ];
@@ -144,18 +160,7 @@ async function callPython(funcName, ...args) {
         let parsedResult;
         try { parsedResult = JSON.parse(resultString); }
         catch (parseError) { console.error(`JS Error parsing JSON from ${funcName}:`, parseError, "\nRaw Response:", resultString); showToast(`Error processing server response (${funcName}).`, 'error'); return { success: false, error: `JSON Parse Error: ${parseError.message}` }; }
-
-        if (typeof parsedResult.success === 'boolean') {
-            if (!parsedResult.success && parsedResult.error) {
-                console.error(`<- PY [${funcName}] Failed:`, parsedResult.error);
-                showToast(parsedResult.error, 'error'); // Show backend error
-            }
-            return parsedResult;
-        } else {
-            console.warn(`<- PY [${funcName}] Response format unexpected:`, parsedResult);
-            showToast(`Unexpected response format from ${funcName}.`, 'warning');
-            return { success: false, error: "Unexpected response format.", data: parsedResult };
-        }
+        return checkPythonResult(funcName, parsedResult);
     } catch (error) {
         console.error(`JS Error during API call ${funcName}:`, error);
         let errorMessage = `Frontend error calling ${funcName}: ${error.message}`;
@@ -165,6 +170,52 @@ async function callPython(funcName, ...args) {
     }
 }
 
+function checkPythonResult(funcName, parsedResult) {
+    if (typeof parsedResult?.success === 'boolean') {
+        if (!parsedResult.success && parsedResult.error) {
+            console.error(`<- PY [${funcName}] Failed:`, parsedResult.error);
+            showToast(parsedResult.error, 'error'); // Show backend error
+        }
+        return parsedResult;
+    } else {
+        console.warn(`<- PY [${funcName}] Response format unexpected:`, parsedResult);
+        showToast(`Unexpected response format from ${funcName}.`, 'warning');
+        return { success: false, error: "Unexpected response format.", data: parsedResult };
+    }
+}
+
+// --- Batched API Calls ---
+// Calls queued within the same tick travel to Api.batch as one bridge round trip and run on one DB snapshot;
+// each caller still receives its own result, exactly as from callPython.
+let pendingPythonBatch = [];
+function callPythonBatched(funcName, ...args) {
+    return new Promise(resolve => {
+        pendingPythonBatch.push({ funcName, args, resolve });
+        if (pendingPythonBatch.length === 1) setTimeout(flushPythonBatch, 0);
+    });
+}
+async function flushPythonBatch() {
+    const calls = pendingPythonBatch; pendingPythonBatch = [];
+    if (calls.length === 1) { calls[0].resolve(await callPython(calls[0].funcName, ...calls[0].args)); return; }
+    const payload = calls.map(({ funcName, args }) => ({ method: funcName, args: args.map(arg => (arg === null || arg === undefined) ? null : String(arg)) }));
+    const batchResult = await callPython('batch', JSON.stringify(payload));
+    const results = batchResult?.success && Array.isArray(batchResult.data?.results) ? batchResult.data.results : null;
+    calls.forEach((call, i) => call.resolve(results ? checkPythonResult(call.funcName, results[i]) : { success: false, error: batchResult?.error || 'Batch call failed.' }));
+}
+
+// --- Columnar Responses ---
+// Decodes {columns, values, row_count} (format 'columnar') into row objects. Integer-cent columns named
+// '<name>_cents' become fixed-point strings under '<name>', matching the row-format amounts.
+function centsToFixed(cents) { if (cents === null || cents === undefined) return null; const abs = Math.abs(cents); return `${cents < 0 ? '-' : ''}${Math.floor(abs / 100)}.${String(abs % 100).padStart(2, '0')}`; }
+function decodeColumnar(table) {
+    if (Array.isArray(table)) return table; // Already row format
+    const rows = new Array(table?.row_count || 0); if (!rows.length) return [];
+    const names = table.columns.map(col => col.endsWith('_cents') ? col.slice(0, -'_cents'.length) : col);
+    const isCents = table.columns.map(col => col.endsWith('_cents'));
+    for (let r = 0; r < rows.length; r++) { const row = {}; for (let c = 0; c < names.length; c++) { const value = table.values[c][r]; row[names[c]] = isCents[c] ? centsToFixed(value) : value; } rows[r] = row; }
+    return rows;
+}
+
 // --- View Switching ---
 function switchView(viewId) {
     document.querySelectorAll('.view').forEach(view => { view.classList.remove('active-view'); });
@@ -180,7 +231,7 @@ function switchView(viewId) {
                 case 'categories': loadCategoriesData(); break;
                 case 'budget': loadBudgetData(); break;
                 case 'reports': loadReportsData(); break;
-                case 'settings': /* No load needed */ break;
+                case 'settings': loadRules(); loadDuplicatePolicy(); loadArchivedYears(); loadMaintenanceStatus(); break;
             }
         }, 0);
     } else { console.error(`View element not found: ${viewId}-view`); showToast(`Failed to switch to view: ${viewId}`, 'error'); }
@@ -206,36 +257,42 @@ function renderPlaceholder(containerElement, type = 'loading', customMessage = n
     if (!containerElement) return; const messages = { loading: 'Loading...', empty: 'No items found.', error: 'Error loading data.', info: '' }; const icons = { loading: 'hourglass_top', empty: 'sentiment_dissatisfied', error: 'error_outline', info: 'info_outline' }; const message = customMessage ?? messages[type] ?? messages.loading; const icon = icons[type] ?? icons.loading; containerElement.innerHTML = `<p class="placeholder-text ${type}"><span class="material-symbols-outlined">${icon}</span> ${message}</p>`;
 }
 function renderTableRow(itemData, type) {
-     const row = document.createElement('div'); row.className = 'table-row'; row.dataset.id = itemData.id; try { switch (type) { case 'account': { const balance = parseFloat(itemData.current_balance ?? '0'); row.innerHTML = `<div class="td col-name">${escapeHtml(itemData.name)}</div> <div class="td col-balance ${balance >= 0 ? 'positive' : 'negative'}">${formatCurrency(itemData.current_balance)}</div> <div class="td col-actions"> <div class="action-buttons"> <button class="button action-btn" onclick="editAccount(${itemData.id})" title="Edit Account"><span class="material-symbols-outlined">edit</span></button> <button class="button action-btn danger" onclick="deleteAccount(${itemData.id}, '${escapeJsString(itemData.name)}')" title="Delete Account"><span class="material-symbols-outlined">delete</span></button> </div> </div>`; break; } case 'transaction': { const amount = parseFloat(itemData.amount ?? '0'); row.innerHTML = `<div class="td col-date">${escapeHtml(itemData.date)}</div> <div class="td col-account">${escapeHtml(itemData.account_name)}</div> <div class="td col-desc" title="${escapeHtml(itemData.description)}">${escapeHtml(itemData.description)}</div> <div class="td col-cat">${escapeHtml(itemData.category_name || 'Uncategorized')}</div> <div class="td col-amount ${amount >= 0 ? 'positive' : 'negative'}">${formatCurrency(itemData.amount)}</div> <div class="td col-actions"> <div class="action-buttons"> <button class="button action-btn" onclick="editTransaction(${itemData.id})" title="Edit Transaction"><span class="material-symbols-outlined">edit</span></button> <button class="button action-btn danger" onclick="deleteTransaction(${itemData.id})" title="Delete Transaction"><span class="material-symbols-outlined">delete</span></button> </div> </div>`; break; } case 'category': { const isUncategorized = itemData.name.toLowerCase() === 'uncategorized'; row.innerHTML = `<div class="td col-cat-name">${escapeHtml(itemData.name)}</div> <div class="td col-cat-type">${escapeHtml(itemData.type)}</div> <div class="td col-actions"> <div class="action-buttons"> <button class="button action-btn" onclick="editCategory(${itemData.id}, '${escapeJsString(itemData.name)}', '${itemData.type}')" title="Edit Category" ${isUncategorized ? 'disabled' : ''}><span class="material-symbols-outlined">edit</span></button> <button class="button action-btn danger" onclick="deleteCategory(${itemData.id}, '${escapeJsString(itemData.name)}')" title="Delete Category" ${isUncategorized ? 'disabled' : ''}><span class="material-symbols-outlined">delete</span></button> </div> </div>`; break; } case 'budget': { const budgeted = parseFloat(itemData.budgeted_amount || '0'); const spent = parseFloat(itemData.spent_amount || '0'); const remaining = parseFloat(itemData.remaining_amount || '0'); let progress = 0; if (budgeted > 0) { progress = (spent / budgeted) * 100; } else if (spent > 0) { progress = Infinity; } const isOverBudget = budgeted > 0 && spent > budgeted; const displayProgress = budgeted > 0 ? Math.min(100, progress) : 0; let progressTitle = `${progress.toFixed(1)}% Spent`; if (progress === Infinity) progressTitle = "Spending with zero budget"; if (isOverBudget) progressTitle += ' (Over Budget!)'; row.innerHTML = `<div class="td col-cat-name">${escapeHtml(itemData.category_name)}</div> <div class="td col-budgeted"> <input type="text" value="${Number(budgeted).toFixed(2)}" data-category-id="${itemData.category_id}" class="budget-input" placeholder="0.00" inputmode="decimal" pattern="\\d*([.,]\\d{0,2})?$" title="Enter budget amount"> </div> <div class="td col-spent ${spent > 0 ? 'negative' : ''}">${formatCurrency(spent > 0 ? -spent : 0)}</div> <div class="td col-remaining ${remaining >= 0 ? 'positive' : 'negative'}">${formatCurrency(remaining)}</div> <div class="td col-progress"> <div class="budget-progress-bar" title="${progressTitle}"> <div class="budget-progress-bar-inner ${isOverBudget ? 'over-budget' : ''} ${progress === Infinity ? 'infinite-progress' : ''}" style="width: ${displayProgress}%"></div> </div> </div>`; break; } default: console.warn(`Unknown row type: ${type}`); row.innerHTML = `<div class="td error" colspan="5">Unknown row type</div>`; } } catch (error) { console.error("Error rendering table row:", error, "Data:", itemData, "Type:", type); row.innerHTML = `<div class="td error" colspan="5">Render Error</div>`; } return row;
+     const row = document.createElement('div'); row.className = 'table-row'; row.dataset.id = itemData.id; try { switch (type) { case 'account': { const balance = parseFloat(itemData.current_balance ?? '0'); row.innerHTML = `<div class="td col-name">${escapeHtml(itemData.name)}</div> <div class="td col-balance ${balance >= 0 ? 'positive' : 'negative'}">${formatCurrency(itemData.current_balance)}</div> <div class="td col-actions"> <div class="action-buttons"> <button class="button action-btn" onclick="editAccount(${itemData.id})" title="Edit Account"><span class="material-symbols-outlined">edit</span></button> <button class="button action-btn danger" onclick="deleteAccount(${itemData.id}, '${escapeJsString(itemData.name)}')" title="Delete Account"><span class="material-symbols-outlined">delete</span></button> </div> </div>`; break; } case 'transaction': { const amount = parseFloat(itemData.amount ?? '0'); row.dataset.date = itemData.date; row.innerHTML = `<div class="td col-date">${escapeHtml(itemData.date)}</div> <div class="td col-account">${escapeHtml(itemData.account_name)}</div> <div class="td col-desc" title="${escapeHtml(itemData.description)}">${escapeHtml(itemData.description)}</div> <div class="td col-cat">${escapeHtml(itemData.category_name || 'Uncategorized')}</div> <div class="td col-amount ${amount >= 0 ? 'positive' : 'negative'}">${formatCurrency(itemData.amount)}</div> <div class="td col-actions"> <div class="action-buttons"> <button class="button action-btn" onclick="editTransaction(${itemData.id})" title="Edit Transaction"><span class="material-symbols-outlined">edit</span></button> <button class="button action-btn danger" onclick="deleteTransaction(${itemData.id})" title="Delete Transaction"><span class="material-symbols-outlined">delete</span></button> </div> </div>`; break; } case 'category': { const isUncategorized = itemData.name.toLowerCase() === 'uncategorized'; row.innerHTML = `<div class="td col-cat-name">${escapeHtml(itemData.name)}</div> <div class="td col-cat-type">${escapeHtml(itemData.type)}</div> <div class="td col-actions"> <div class="action-buttons"> <button class="button action-btn" onclick="editCategory(${itemData.id}, '${escapeJsString(itemData.name)}', '${itemData.type}')" title="Edit Category" ${isUncategorized ? 'disabled' : ''}><span class="material-symbols-outlined">edit</span></button> <button class="button action-btn danger" onclick="deleteCategory(${itemData.id}, '${escapeJsString(itemData.name)}')" title="Delete Category" ${isUncategorized ? 'disabled' : ''}><span class="material-symbols-outlined">delete</span></button> </div> </div>`; break; } case 'budget': { const budgeted = parseFloat(itemData.budgeted_amount || '0'); const spent = parseFloat(itemData.spent_amount || '0'); const remaining = parseFloat(itemData.remaining_amount || '0'); let progress = 0; if (budgeted > 0) { progress = (spent / budgeted) * 100; } else if (spent > 0) { progress = Infinity; } const isOverBudget = budgeted > 0 && spent > budgeted; const displayProgress = budgeted > 0 ? Math.min(100, progress) : 0; let progressTitle = `${progress.toFixed(1)}% Spent`; if (progress === Infinity) progressTitle = "Spending with zero budget"; if (isOverBudget) progressTitle += ' (Over Budget!)'; row.innerHTML = `<div class="td col-cat-name">${escapeHtml(itemData.category_name)}</div> <div class="td col-budgeted"> <input type="text" value="${Number(budgeted).toFixed(2)}" data-category-id="${itemData.category_id}" class="budget-input" placeholder="0.00" inputmode="decimal" pattern="\\d*([.,]\\d{0,2})?$" title="Enter budget amount"> </div> <div class="td col-spent ${spent > 0 ? 'negative' : ''}">${formatCurrency(spent > 0 ? -spent : 0)}</div> <div class="td col-remaining ${remaining >= 0 ? 'positive' : 'negative'}">${formatCurrency(remaining)}</div> <div class="td col-progress"> <div class="budget-progress-bar" title="${progressTitle}"> <div class="budget-progress-bar-inner ${isOverBudget ? 'over-budget' : ''} ${progress === Infinity ? 'infinite-progress' : ''}" style="width: ${displayProgress}%"></div> </div> </div>`; break; } default: console.warn(`Unknown row type: ${type}`); row.innerHTML = `<div class="td error" colspan="5">Unknown row type</div>`; } } catch (error) { console.error("Error rendering table row:", error, "Data:", itemData, "Type:", type); row.innerHTML = `<div class="td error" colspan="5">Render Error</div>`; } return row;
 }
 
 // --- Data Loading Functions ---
-async function loadAccountsData() { const tableBody = document.getElementById('accounts-table-body'); if (!tableBody) return; renderPlaceholder(tableBody, 'loading'); const result = await callPython('get_accounts'); tableBody.innerHTML = ''; if (result?.success && result.data?.accounts) { accountsData = result.data.accounts; if (accountsData.length === 0) { renderPlaceholder(tableBody, 'empty', 'No accounts found. Click "Add Account".'); } else { accountsData.forEach(acc => tableBody.appendChild(renderTableRow(acc, 'account'))); } populateAccountDropdowns(); } else { renderPlaceholder(tableBody, 'error', result?.error || 'Failed to load accounts.'); accountsData = []; populateAccountDropdowns(); } }
-async function loadTransactionsData(accountId = null, limit = null) { const tableBody = document.getElementById('transactions-table-body'); if (!tableBody) return; renderPlaceholder(tableBody, 'loading'); const result = await callPython('get_transactions', accountId ? String(accountId) : null, limit ? String(limit) : null); tableBody.innerHTML = ''; if (result?.success && result.data?.transactions) { if (result.data.transactions.length === 0) { renderPlaceholder(tableBody, 'empty', accountId ? 'No transactions for this account.' : 'No transactions recorded yet.'); } else { result.data.transactions.forEach(tran => tableBody.appendChild(renderTableRow(tran, 'transaction'))); } } else { renderPlaceholder(tableBody, 'error', result?.error || 'Failed to load transactions.'); } }
-async function loadDashboardData() { console.log("Loading dashboard data..."); const dbAccountList = document.getElementById('db-account-list'); const dbTransList = document.getElementById('db-recent-transactions'); const totalBalanceElem = document.getElementById('db-total-balance'); const accountCountElem = document.getElementById('db-account-count'); const monthlyFlowElem = document.getElementById('db-monthly-flow'); const monthlyFlowCard = monthlyFlowElem?.closest('.card'); if (dbAccountList) renderPlaceholder(dbAccountList, 'loading'); if (dbTransList) renderPlaceholder(dbTransList, 'loading'); if (totalBalanceElem) totalBalanceElem.textContent = '...'; if (accountCountElem) accountCountElem.textContent = '...'; if (monthlyFlowElem) monthlyFlowElem.textContent = '--'; if (monthlyFlowCard) monthlyFlowCard.classList.add('placeholder'); const result = await callPython('get_dashboard_data'); if (result?.success && result.data) { const data = result.data; const totalBalance = parseFloat(data.total_balance ?? '0'); if (totalBalanceElem) { totalBalanceElem.textContent = formatCurrency(totalBalance); totalBalanceElem.className = `card-value large ${totalBalance >= 0 ? 'positive' : 'negative'}`; } const accountCount = data.account_count ?? 0; if (accountCountElem) { accountCountElem.textContent = accountCount; } const monthlyFlow = parseFloat(data.monthly_flow ?? '0'); if (monthlyFlowElem) { monthlyFlowElem.textContent = formatCurrency(monthlyFlow); monthlyFlowElem.className = `card-value ${monthlyFlow >= 0 ? 'positive' : 'negative'}`; monthlyFlowElem.style.fontSize = '1.5rem'; monthlyFlowElem.style.color = ''; } if (monthlyFlowCard) monthlyFlowCard.classList.remove('placeholder'); if (dbAccountList) { dbAccountList.innerHTML = ''; const accounts = data.accounts || []; if (accountCount > 0 && accounts.length > 0) { accounts.forEach(acc => { const balance = parseFloat(acc.current_balance ?? '0'); const item = document.createElement('div'); item.className = 'list-item'; item.innerHTML = `<span class="account-name">${escapeHtml(acc.name)}</span> <span class="amount ${balance >= 0 ? 'positive' : 'negative'}">${formatCurrency(acc.current_balance)}</span>`; dbAccountList.appendChild(item); }); } else { renderPlaceholder(dbAccountList, 'empty', 'No accounts yet.'); } } if (dbTransList) { dbTransList.innerHTML = ''; const transactions = data.recent_transactions || []; if (transactions.length > 0) { transactions.forEach(tran => { const amount = parseFloat(tran.amount ?? '0'); const item = document.createElement('div'); item.className = 'list-item'; const accountNameChip = accountCount > 1 ? `<span class="trans-account-chip">${escapeHtml(tran.account_name)}</span>` : ''; const categoryChip = tran.category_name && tran.category_name !== 'Uncategorized' ? `<span class="trans-cat-chip">${escapeHtml(tran.category_name)}</span>` : ''; item.innerHTML = `<span class="transaction-info"><span class="trans-date">${escapeHtml(tran.date)}:</span> <span class="trans-desc">${escapeHtml(tran.description)}</span> ${categoryChip} ${accountNameChip}</span> <span class="amount ${amount >= 0 ? 'positive' : 'negative'}">${formatCurrency(tran.amount)}</span>`; dbTransList.appendChild(item); }); } else if (accountCount > 0) { renderPlaceholder(dbTransList, 'empty', 'No recent transactions.'); } else { renderPlaceholder(dbTransList, 'info', 'Add an account to start tracking activity.'); } } } else { console.error("Failed to load dashboard data:", result?.error); if (totalBalanceElem) totalBalanceElem.textContent = 'Error'; if (accountCountElem) accountCountElem.textContent = 'Error'; if (monthlyFlowElem) monthlyFlowElem.textContent = 'Error'; if (monthlyFlowCard) monthlyFlowCard.classList.remove('placeholder'); if (dbAccountList) renderPlaceholder(dbAccountList, 'error', 'Failed to load accounts.'); if (dbTransList) renderPlaceholder(dbTransList, 'error', 'Failed to load transactions.'); } console.log("Dashboard data loading finished."); }
-async function loadCategoriesData() { const tableBody = document.getElementById('categories-table-body'); if (!tableBody) return; renderPlaceholder(tableBody, 'loading'); const result = await callPython('get_categories'); tableBody.innerHTML = ''; if (result?.success && result.data?.categories) { categoryData = result.data.categories; const customCategories = categoryData.filter(c => c.name.toLowerCase() !== 'uncategorized'); if (customCategories.length === 0) { renderPlaceholder(tableBody, 'empty', 'No custom categories. Click "Add Category".'); } const sortedForDisplay = [...categoryData].sort((a, b) => { if (a.name.toLowerCase() === 'uncategorized') return 1; if (b.name.toLowerCase() === 'uncategorized') return -1; if (a.type !== b.type) return a.type.localeCompare(b.type); return a.name.localeCompare(b.name, undefined, { sensitivity: 'base' }); }); sortedForDisplay.forEach(cat => tableBody.appendChild(renderTableRow(cat, 'category'))); populateCategoryDropdowns(); } else { renderPlaceholder(tableBody, 'error', result?.error || 'Failed to load categories.'); categoryData = []; populateCategoryDropdowns(); } }
-async function loadBudgetData() { const tableBody = document.getElementById('budget-table-body'); const monthInput = document.getElementById('budget-month'); if (!tableBody || !monthInput) { console.error("Budget UI elements missing."); return; } if (!monthInput.value) { const today = new Date(); monthInput.value = today.toISOString().slice(0, 7); } currentBudgetMonth = monthInput.value; renderPlaceholder(tableBody, 'loading'); const result = await callPython('get_budget_data_for_month', currentBudgetMonth); tableBody.innerHTML = ''; if (result?.success && result.data?.budget_data) { currentBudgetData = {}; const budgetItems = result.data.budget_data; if (budgetItems.length === 0) { const allCategoriesResult = await callPython('get_categories', 'expense'); if (allCategoriesResult?.success && allCategoriesResult.data?.categories?.length > 0 && !allCategoriesResult.data.categories.every(c => c.name.toLowerCase() === 'uncategorized')) { renderPlaceholder(tableBody, 'info', 'No budgets set for this month.'); } else { renderPlaceholder(tableBody, 'info', 'Add expense categories first.'); } } else { budgetItems.forEach(b => { currentBudgetData[b.category_id] = b; tableBody.appendChild(renderTableRow(b, 'budget')); }); } } else { renderPlaceholder(tableBody, 'error', result?.error || 'Failed to load budget data.'); currentBudgetData = {}; } }
-async function loadReportsData() { const startDateInput = document.getElementById('report-start-date'); const endDateInput = document.getElementById('report-end-date'); const chartContainer = document.getElementById('spending-chart-container'); const placeholder = document.getElementById('report-placeholder'); const canvas = document.getElementById('spending-pie-chart'); if (!startDateInput || !endDateInput || !chartContainer || !placeholder || !canvas) { console.error("Report UI elements missing."); return; } if (!startDateInput.value || !endDateInput.value) { const today = new Date(); const firstDay = new Date(today.getFullYear(), today.getMonth(), 1); const lastDay = new Date(today.getFullYear(), today.getMonth() + 1, 0); startDateInput.value = firstDay.toISOString().split('T')[0]; endDateInput.value = lastDay.toISOString().split('T')[0]; } if (spendingChart) { spendingChart.destroy(); spendingChart = null; } canvas.style.display = 'none'; placeholder.style.display = 'block'; placeholder.className = 'placeholder-text info'; placeholder.innerHTML = '<span class="material-symbols-outlined">info_outline</span> Select dates and click "Run Report".'; }
+async function loadAccountsData() { const tableBody = document.getElementById('accounts-table-body'); if (!tableBody) return; renderPlaceholder(tableBody, 'loading'); const result = await callPythonBatched('get_accounts'); tableBody.innerHTML = ''; if (result?.success && result.data?.accounts) { accountsData = result.data.accounts; if (accountsData.length === 0) { renderPlaceholder(tableBody, 'empty', 'No accounts found. Click "Add Account".'); } else { accountsData.forEach(acc => tableBody.appendChild(renderTableRow(acc, 'account'))); } populateAccountDropdowns(); } else { renderPlaceholder(tableBody, 'error', result?.error || 'Failed to load accounts.'); accountsData = []; populateAccountDropdowns(); } }
+async function loadTransactionsData(accountId = null, limit = null) { const tableBody = document.getElementById('transactions-table-body'); if (!tableBody) return; renderPlaceholder(tableBody, 'loading'); transactionsFilters = accountId ? { account_ids: [accountId] } : {}; transactionsCursor = null; const result = await callPythonBatched('query_transactions', JSON.stringify(transactionsFilters), null, String(limit || TRANSACTIONS_PAGE_SIZE), 'true', 'columnar'); if (result?.success && result.data?.transactions) result.data.transactions = decodeColumnar(result.data.transactions); tableBody.innerHTML = ''; if (result?.success && result.data?.transactions) { if (result.data.transactions.length === 0) { renderPlaceholder(tableBody, 'empty', accountId ? 'No transactions for this account.' : 'No transactions recorded yet.'); } else { result.data.transactions.forEach(tran => tableBody.appendChild(renderTableRow(tran, 'transaction'))); } transactionsTotalCount = result.data.total_count ?? 0; transactionsCursor = result.data.next_cursor; updateTransactionsFooter(); } else { renderPlaceholder(tableBody, 'error', result?.error || 'Failed to load transactions.'); transactionsCursor = null; transactionsTotalCount = 0; updateTransactionsFooter(); } }
+async function searchTransactionsData(query) { const tableBody = document.getElementById('transactions-table-body'); if (!tableBody) return; const accountFilter = document.getElementById('account-filter')?.value; const filters = accountFilter && accountFilter !== 'null' ? { account_ids: [accountFilter] } : {}; renderPlaceholder(tableBody, 'loading'); const result = await callPython('search_transactions', query, JSON.stringify(filters), String(TRANSACTIONS_PAGE_SIZE)); tableBody.innerHTML = ''; transactionsCursor = null; if (result?.success && result.data?.transactions) { if (result.data.transactions.length === 0) { renderPlaceholder(tableBody, 'empty', `No transactions match "${escapeHtml(query)}".`); } else { result.data.transactions.forEach(tran => { const row = renderTableRow(tran, 'transaction'); const descCell = row.querySelector('.col-desc'); if (descCell && tran.snippet_html) descCell.innerHTML = tran.snippet_html; tableBody.appendChild(row); }); } transactionsTotalCount = result.data.transactions.length; updateTransactionsFooter(); } else { renderPlaceholder(tableBody, 'error', result?.error || 'Search failed.'); transactionsTotalCount = 0; updateTransactionsFooter(); } }
+const debouncedTransactionSearch = debounce((query) => { if (query) { searchTransactionsData(query); } else { const accountFilter = document.getElementById('account-filter')?.value; loadTransactionsData(accountFilter === 'null' ? null : accountFilter); } }, 300);
+async function loadMoreTransactions() { const tableBody = document.getElementById('transactions-table-body'); if (!tableBody || !transactionsCursor) return; const loadMoreBtn = document.getElementById('load-more-transactions-btn'); if (loadMoreBtn) loadMoreBtn.disabled = true; const result = await callPythonBatched('query_transactions', JSON.stringify(transactionsFilters), transactionsCursor, String(TRANSACTIONS_PAGE_SIZE), 'false', 'columnar'); if (result?.success && result.data?.transactions) result.data.transactions = decodeColumnar(result.data.transactions); if (loadMoreBtn) loadMoreBtn.disabled = false; if (result?.success && result.data?.transactions) { result.data.transactions.forEach(tran => tableBody.appendChild(renderTableRow(tran, 'transaction'))); transactionsCursor = result.data.next_cursor; updateTransactionsFooter(); } }
+function updateTransactionsFooter() { const countElem = document.getElementById('transactions-count'); const loadMoreBtn = document.getElementById('load-more-transactions-btn'); const shown = document.querySelectorAll('#transactions-table-body .table-row').length; if (countElem) countElem.textContent = transactionsTotalCount ? `Showing ${shown} of ${transactionsTotalCount}` : ''; if (loadMoreBtn) loadMoreBtn.style.display = transactionsCursor ? '' : 'none'; }
+async function loadDashboardData() { console.log("Loading dashboard data..."); const dbAccountList = document.getElementById('db-account-list'); const dbTransList = document.getElementById('db-recent-transactions'); const totalBalanceElem = document.getElementById('db-total-balance'); const accountCountElem = document.getElementById('db-account-count'); const monthlyFlowElem = document.getElementById('db-monthly-flow'); const monthlyFlowCard = monthlyFlowElem?.closest('.card'); if (dbAccountList) renderPlaceholder(dbAccountList, 'loading'); if (dbTransList) renderPlaceholder(dbTransList, 'loading'); if (totalBalanceElem) totalBalanceElem.textContent = '...'; if (accountCountElem) accountCountElem.textContent = '...'; if (monthlyFlowElem) monthlyFlowElem.textContent = '--'; if (monthlyFlowCard) monthlyFlowCard.classList.add('placeholder'); const result = await callPythonBatched('get_dashboard_data'); if (result?.success && result.data) { const data = result.data; const totalBalance = parseFloat(data.total_balance ?? '0'); if (totalBalanceElem) { totalBalanceElem.textContent = formatCurrency(totalBalance); totalBalanceElem.className = `card-value large ${totalBalance >= 0 ? 'positive' : 'negative'}`; } const accountCount = data.account_count ?? 0; if (accountCountElem) { accountCountElem.textContent = accountCount; } const monthlyFlow = parseFloat(data.monthly_flow ?? '0'); if (monthlyFlowElem) { monthlyFlowElem.textContent = formatCurrency(monthlyFlow); monthlyFlowElem.className = `card-value ${monthlyFlow >= 0 ? 'positive' : 'negative'}`; monthlyFlowElem.style.fontSize = '1.5rem'; monthlyFlowElem.style.color = ''; } if (monthlyFlowCard) monthlyFlowCard.classList.remove('placeholder'); if (dbAccountList) { dbAccountList.innerHTML = ''; const accounts = data.accounts || []; if (accountCount > 0 && accounts.length > 0) { accounts.forEach(acc => { const balance = parseFloat(acc.current_balance ?? '0'); const item = document.createElement('div'); item.className = 'list-item'; item.innerHTML = `<span class="account-name">${escapeHtml(acc.name)}</span> <span class="amount ${balance >= 0 ? 'positive' : 'negative'}">${formatCurrency(acc.current_balance)}</span>`; dbAccountList.appendChild(item); }); } else { renderPlaceholder(dbAccountList, 'empty', 'No accounts yet.'); } } if (dbTransList) { dbTransList.innerHTML = ''; const transactions = data.recent_transactions || []; if (transactions.length > 0) { transactions.forEach(tran => { const amount = parseFloat(tran.amount ?? '0'); const item = document.createElement('div'); item.className = 'list-item'; const accountNameChip = accountCount > 1 ? `<span class="trans-account-chip">${escapeHtml(tran.account_name)}</span>` : ''; const categoryChip = tran.category_name && tran.category_name !== 'Uncategorized' ? `<span class="trans-cat-chip">${escapeHtml(tran.category_name)}</span>` : ''; item.innerHTML = `<span class="transaction-info"><span class="trans-date">${escapeHtml(tran.date)}:</span> <span class="trans-desc">${escapeHtml(tran.description)}</span> ${categoryChip} ${accountNameChip}</span> <span class="amount ${amount >= 0 ? 'positive' : 'negative'}">${formatCurrency(tran.amount)}</span>`; dbTransList.appendChild(item); }); } else if (accountCount > 0) { renderPlaceholder(dbTransList, 'empty', 'No recent transactions.'); } else { renderPlaceholder(dbTransList, 'info', 'Add an account to start tracking activity.'); } } } else { console.error("Failed to load dashboard data:", result?.error); if (totalBalanceElem) totalBalanceElem.textContent = 'Error'; if (accountCountElem) accountCountElem.textContent = 'Error'; if (monthlyFlowElem) monthlyFlowElem.textContent = 'Error'; if (monthlyFlowCard) monthlyFlowCard.classList.remove('placeholder'); if (dbAccountList) renderPlaceholder(dbAccountList, 'error', 'Failed to load accounts.'); if (dbTransList) renderPlaceholder(dbTransList, 'error', 'Failed to load transactions.'); } console.log("Dashboard data loading finished."); }
+async function loadCategoriesData() { const tableBody = document.getElementById('categories-table-body'); if (!tableBody) return; renderPlaceholder(tableBody, 'loading'); const result = await callPythonBatched('get_categories'); tableBody.innerHTML = ''; if (result?.success && result.data?.categories) { categoryData = result.data.categories; const customCategories = categoryData.filter(c => c.name.toLowerCase() !== 'uncategorized'); if (customCategories.length === 0) { renderPlaceholder(tableBody, 'empty', 'No custom categories. Click "Add Category".'); } const sortedForDisplay = [...categoryData].sort((a, b) => { if (a.name.toLowerCase() === 'uncategorized') return 1; if (b.name.toLowerCase() === 'uncategorized') return -1; if (a.type !== b.type) return a.type.localeCompare(b.type); return a.name.localeCompare(b.name, undefined, { sensitivity: 'base' }); }); sortedForDisplay.forEach(cat => tableBody.appendChild(renderTableRow(cat, 'category'))); populateCategoryDropdowns(); } else { renderPlaceholder(tableBody, 'error', result?.error || 'Failed to load categories.'); categoryData = []; populateCategoryDropdowns(); } }
+async function loadBudgetData() { const tableBody = document.getElementById('budget-table-body'); const monthInput = document.getElementById('budget-month'); if (!tableBody || !monthInput) { console.error("Budget UI elements missing."); return; } if (!monthInput.value) { const today = new Date(); monthInput.value = today.toISOString().slice(0, 7); } currentBudgetMonth = monthInput.value; renderPlaceholder(tableBody, 'loading'); const result = await callPythonBatched('get_budget_data_for_month', currentBudgetMonth); tableBody.innerHTML = ''; if (result?.success && result.data?.budget_data) { currentBudgetData = {}; const budgetItems = result.data.budget_data; if (budgetItems.length === 0) { const allCategoriesResult = await callPython('get_categories', 'expense'); if (allCategoriesResult?.success && allCategoriesResult.data?.categories?.length > 0 && !allCategoriesResult.data.categories.every(c => c.name.toLowerCase() === 'uncategorized')) { renderPlaceholder(tableBody, 'info', 'No budgets set for this month.'); } else { renderPlaceholder(tableBody, 'info', 'Add expense categories first.'); } } else { budgetItems.forEach(b => { currentBudgetData[b.category_id] = b; tableBody.appendChild(renderTableRow(b, 'budget')); }); } } else { renderPlaceholder(tableBody, 'error', result?.error || 'Failed to load budget data.'); currentBudgetData = {}; } }
+async function loadReportsData() { const startDateInput = document.getElementById('report-start-date'); const endDateInput = document.getElementById('report-end-date'); const chartContainer = document.getElementById('spending-chart-container'); const placeholder = document.getElementById('report-placeholder'); const canvas = document.getElementById('spending-pie-chart'); if (!startDateInput || !endDateInput || !chartContainer || !placeholder || !canvas) { console.error("Report UI elements missing."); return; } if (!startDateInput.value || !endDateInput.value) { const today = new Date(); const firstDay = new Date(today.getFullYear(), today.getMonth(), 1); const lastDay = new Date(today.getFullYear(), today.getMonth() + 1, 0); startDateInput.value = firstDay.toISOString().split('T')[0]; endDateInput.value = lastDay.toISOString().split('T')[0]; } if (spendingChart) { spendingChart.destroy(); spendingChart = null; } canvas.style.display = 'none'; placeholder.style.display = 'block'; placeholder.className = 'placeholder-text info'; placeholder.innerHTML = '<span class="material-symbols-outlined">info_outline</span> Select dates and click "Run Report".'; if (balanceChart) { balanceChart.destroy(); balanceChart = null; } const balanceCanvas = document.getElementById('balance-history-chart'); const balancePlaceholder = document.getElementById('balance-placeholder'); if (balanceCanvas && balancePlaceholder) { balanceCanvas.style.display = 'none'; balancePlaceholder.style.display = 'block'; balancePlaceholder.className = 'placeholder-text info'; balancePlaceholder.innerHTML = placeholder.innerHTML; } }
 
 // --- Action Handlers (Forms, Buttons) ---
-async function handleAddAccount(event) { event.preventDefault(); const form = event.target; const nameInput = form.elements['acc-name']; const balanceInput = form.elements['acc-balance']; const name = nameInput?.value.trim(); const balance = balanceInput?.value; if (!name) { showToast("Account name cannot be empty.", 'warning'); nameInput?.focus(); return; } if (balance && !/^-?\d*([.,]?\d{0,2})?$/.test(balance.trim())) { showToast("Invalid balance format.", 'warning'); balanceInput?.focus(); return; } const result = await callPython('add_account', name, balance); if (result?.success) { showToast(`Account '${name}' added.`, 'success'); closeModal('add-account-modal'); if (currentView === 'accounts') await loadAccountsData(); if (currentView === 'dashboard') await loadDashboardData(); await ensureInitialData(true); } else { nameInput?.focus(); } }
-async function deleteAccount(id, name) { if (confirm(`ARE YOU SURE?\nDeleting account "${escapeJsString(name)}" will also PERMANENTLY DELETE all its transactions!`)) { const result = await callPython('delete_account', String(id)); if (result?.success) { showToast(`Account '${name}' deleted.`, 'success'); if (currentView === 'accounts') await loadAccountsData(); if (currentView === 'dashboard') await loadDashboardData(); if (currentView === 'transactions') { const filterSelect = document.getElementById('account-filter'); if (filterSelect) filterSelect.value = 'null'; await loadTransactionsData(null); } await ensureInitialData(true); } } }
+async function handleAddAccount(event) { event.preventDefault(); const form = event.target; const nameInput = form.elements['acc-name']; const balanceInput = form.elements['acc-balance']; const name = nameInput?.value.trim(); const balance = balanceInput?.value; if (!name) { showToast("Account name cannot be empty.", 'warning'); nameInput?.focus(); return; } if (balance && !/^-?\d*([.,]?\d{0,2})?$/.test(balance.trim())) { showToast("Invalid balance format.", 'warning'); balanceInput?.focus(); return; } const result = await callPython('add_account', name, balance); if (result?.success) { showToast(`Account '${name}' added.`, 'success'); closeModal('add-account-modal'); await syncChanges(); } else { nameInput?.focus(); } }
+async function deleteAccount(id, name) { if (confirm(`ARE YOU SURE?\nDeleting account "${escapeJsString(name)}" will also PERMANENTLY DELETE all its transactions!`)) { const result = await callPython('delete_account', String(id)); if (result?.success) { showToast(`Account '${name}' deleted.`, 'success'); await syncChanges(); } } }
 async function editAccount(id) { let account = accountsData.find(acc => acc.id === id); if (!account) { await loadAccountsData(); account = accountsData.find(acc => acc.id === id); } if (account) { document.getElementById('edit-acc-id').value = account.id; document.getElementById('edit-acc-name').value = account.name; document.getElementById('edit-acc-balance').value = parseFloat(account.initial_balance ?? '0').toFixed(2); openModal('edit-account-modal'); } else { showToast("Error: Account not found.", 'error'); } }
-async function handleEditAccount(event) { event.preventDefault(); const form = event.target; const id = form.elements['edit-acc-id']?.value; const nameInput = form.elements['edit-acc-name']; const balanceInput = form.elements['edit-acc-balance']; const name = nameInput?.value.trim(); const balance = balanceInput?.value; if (!id) { console.error("Edit account ID missing!"); return; } if (!name) { showToast("Account name cannot be empty.", 'warning'); nameInput?.focus(); return; } if (balance && !/^-?\d*([.,]?\d{0,2})?$/.test(balance.trim())) { showToast("Invalid balance format.", 'warning'); balanceInput?.focus(); return; } const result = await callPython('update_account', String(id), name, balance); if (result?.success) { showToast(`Account '${name}' updated.`, 'success'); closeModal('edit-account-modal'); if (currentView === 'accounts') await loadAccountsData(); if (currentView === 'dashboard') await loadDashboardData(); await ensureInitialData(true); } else { nameInput?.focus(); } }
-async function handleAddTransaction(event) { event.preventDefault(); const form = event.target; const accountId = form.elements['trans-acc']?.value; const date = form.elements['trans-date']?.value; const descriptionInput = form.elements['trans-desc']; const typeSelect = form.elements['trans-type']; const transactionType = typeSelect?.value; const amountInput = form.elements['trans-amount']; const categoryId = form.elements['trans-cat']?.value || null; const description = descriptionInput?.value.trim(); let amountStr = amountInput?.value.trim().replace(',', '.'); if (!amountStr || !/^\d*\.?\d{0,2}$/.test(amountStr) || parseFloat(amountStr) < 0) { showToast("Invalid amount format. Enter a positive number.", 'warning'); amountInput?.focus(); return; } const amountToSend = (transactionType === 'expense') ? `-${amountStr}` : amountStr; if (!accountId) { showToast("Please select an account.", 'warning'); form.elements['trans-acc']?.focus(); return; } if (!date) { showToast("Please select a date.", 'warning'); form.elements['trans-date']?.focus(); return; } if (!description) { showToast("Description cannot be empty.", 'warning'); descriptionInput?.focus(); return; } if (!transactionType) { showToast("Please select a transaction type.", 'warning'); typeSelect?.focus(); return; } const result = await callPython('add_transaction', String(accountId), date, description, amountToSend, categoryId ? String(categoryId) : null ); if (result?.success) { showToast('Transaction added.', 'success'); closeModal('add-transaction-modal'); const currentFilter = document.getElementById('account-filter')?.value; if (currentView === 'transactions') await loadTransactionsData(currentFilter === 'null' ? null : currentFilter); if (currentView === 'dashboard') await loadDashboardData(); if (currentView === 'budget') await loadBudgetData(); await loadAccountsData(); } else { form.elements['trans-acc']?.focus(); } }
+async function handleEditAccount(event) { event.preventDefault(); const form = event.target; const id = form.elements['edit-acc-id']?.value; const nameInput = form.elements['edit-acc-name']; const balanceInput = form.elements['edit-acc-balance']; const name = nameInput?.value.trim(); const balance = balanceInput?.value; if (!id) { console.error("Edit account ID missing!"); return; } if (!name) { showToast("Account name cannot be empty.", 'warning'); nameInput?.focus(); return; } if (balance && !/^-?\d*([.,]?\d{0,2})?$/.test(balance.trim())) { showToast("Invalid balance format.", 'warning'); balanceInput?.focus(); return; } const result = await callPython('update_account', String(id), name, balance); if (result?.success) { showToast(`Account '${name}' updated.`, 'success'); closeModal('edit-account-modal'); await syncChanges(); } else { nameInput?.focus(); } }
+async function handleAddTransaction(event) { event.preventDefault(); const form = event.target; const accountId = form.elements['trans-acc']?.value; const date = form.elements['trans-date']?.value; const descriptionInput = form.elements['trans-desc']; const typeSelect = form.elements['trans-type']; const transactionType = typeSelect?.value; const amountInput = form.elements['trans-amount']; const categoryId = form.elements['trans-cat']?.value || null; const description = descriptionInput?.value.trim(); let amountStr = amountInput?.value.trim().replace(',', '.'); if (!amountStr || !/^\d*\.?\d{0,2}$/.test(amountStr) || parseFloat(amountStr) < 0) { showToast("Invalid amount format. Enter a positive number.", 'warning'); amountInput?.focus(); return; } const amountToSend = (transactionType === 'expense') ? `-${amountStr}` : amountStr; if (!accountId) { showToast("Please select an account.", 'warning'); form.elements['trans-acc']?.focus(); return; } if (!date) { showToast("Please select a date.", 'warning'); form.elements['trans-date']?.focus(); return; } if (!description) { showToast("Description cannot be empty.", 'warning'); descriptionInput?.focus(); return; } if (!transactionType) { showToast("Please select a transaction type.", 'warning'); typeSelect?.focus(); return; } const result = await callPython('add_transaction', String(accountId), date, description, amountToSend, categoryId ? String(categoryId) : null ); if (result?.success) { showToast('Transaction added.', 'success'); closeModal('add-transaction-modal'); await syncChanges(); } else { form.elements['trans-acc']?.focus(); } }
 async function editTransaction(id) { const result = await callPython('get_transaction_details', String(id)); if (result?.success && result.data?.transaction) { const tran = result.data.transaction; await ensureInitialData(); populateAccountDropdowns('edit-trans-acc'); populateCategoryDropdowns('edit-trans-cat'); document.getElementById('edit-trans-id').value = tran.id; document.getElementById('edit-trans-acc').value = tran.account_id; document.getElementById('edit-trans-date').value = tran.date; document.getElementById('edit-trans-desc').value = tran.description; document.getElementById('edit-trans-cat').value = tran.category_id || ''; const amountValue = parseFloat(tran.amount); const isExpense = amountValue < 0; const typeSelect = document.getElementById('edit-trans-type'); if (typeSelect) { typeSelect.value = isExpense ? 'expense' : 'income'; } const amountInput = document.getElementById('edit-trans-amount'); if (amountInput) { amountInput.value = Math.abs(amountValue).toFixed(2); } openModal('edit-transaction-modal'); } else { showToast(result?.error || "Could not fetch transaction details.", 'error'); } }
-async function handleEditTransaction(event) { event.preventDefault(); const form = event.target; const id = form.elements['edit-trans-id']?.value; const accountId = form.elements['edit-trans-acc']?.value; const date = form.elements['edit-trans-date']?.value; const descriptionInput = form.elements['edit-trans-desc']; const typeSelect = form.elements['edit-trans-type']; const transactionType = typeSelect?.value; const amountInput = form.elements['edit-trans-amount']; const categoryId = form.elements['edit-trans-cat']?.value || null; const description = descriptionInput?.value.trim(); let amountStr = amountInput?.value.trim().replace(',', '.'); if (!amountStr || !/^\d*\.?\d{0,2}$/.test(amountStr) || parseFloat(amountStr) < 0) { showToast("Invalid amount format. Enter a positive number.", 'warning'); amountInput?.focus(); return; } const amountToSend = (transactionType === 'expense') ? `-${amountStr}` : amountStr; if (!id) { console.error("Edit transaction ID missing!"); return; } if (!accountId) { showToast("Please select an account.", 'warning'); form.elements['edit-trans-acc']?.focus(); return; } if (!date) { showToast("Please select a date.", 'warning'); form.elements['edit-trans-date']?.focus(); return; } if (!description) { showToast("Description cannot be empty.", 'warning'); descriptionInput?.focus(); return; } if (!transactionType) { showToast("Please select a transaction type.", 'warning'); typeSelect?.focus(); return; } const result = await callPython('update_transaction', String(id), String(accountId), date, description, amountToSend, categoryId ? String(categoryId) : null ); if (result?.success) { showToast('Transaction updated.', 'success'); closeModal('edit-transaction-modal'); const currentFilter = document.getElementById('account-filter')?.value; if (currentView === 'transactions') await loadTransactionsData(currentFilter === 'null' ? null : currentFilter); if (currentView === 'dashboard') await loadDashboardData(); if (currentView === 'budget') await loadBudgetData(); await loadAccountsData(); } else { form.elements['edit-trans-acc']?.focus(); } }
-async function deleteTransaction(id) { if (confirm(`Are you sure you want to delete this transaction?\nThis cannot be undone.`)) { const result = await callPython('delete_transaction', String(id)); if (result?.success) { showToast('Transaction deleted.', 'success'); const currentFilter = document.getElementById('account-filter')?.value; if (currentView === 'transactions') await loadTransactionsData(currentFilter === 'null' ? null : currentFilter); if (currentView === 'dashboard') await loadDashboardData(); if (currentView === 'budget') await loadBudgetData(); await loadAccountsData(); } } }
+async function handleEditTransaction(event) { event.preventDefault(); const form = event.target; const id = form.elements['edit-trans-id']?.value; const accountId = form.elements['edit-trans-acc']?.value; const date = form.elements['edit-trans-date']?.value; const descriptionInput = form.elements['edit-trans-desc']; const typeSelect = form.elements['edit-trans-type']; const transactionType = typeSelect?.value; const amountInput = form.elements['edit-trans-amount']; const categoryId = form.elements['edit-trans-cat']?.value || null; const description = descriptionInput?.value.trim(); let amountStr = amountInput?.value.trim().replace(',', '.'); if (!amountStr || !/^\d*\.?\d{0,2}$/.test(amountStr) || parseFloat(amountStr) < 0) { showToast("Invalid amount format. Enter a positive number.", 'warning'); amountInput?.focus(); return; } const amountToSend = (transactionType === 'expense') ? `-${amountStr}` : amountStr; if (!id) { console.error("Edit transaction ID missing!"); return; } if (!accountId) { showToast("Please select an account.", 'warning'); form.elements['edit-trans-acc']?.focus(); return; } if (!date) { showToast("Please select a date.", 'warning'); form.elements['edit-trans-date']?.focus(); return; } if (!description) { showToast("Description cannot be empty.", 'warning'); descriptionInput?.focus(); return; } if (!transactionType) { showToast("Please select a transaction type.", 'warning'); typeSelect?.focus(); return; } const result = await callPython('update_transaction', String(id), String(accountId), date, description, amountToSend, categoryId ? String(categoryId) : null ); if (result?.success) { showToast('Transaction updated.', 'success'); closeModal('edit-transaction-modal'); await syncChanges(); } else { form.elements['edit-trans-acc']?.focus(); } }
+async function deleteTransaction(id) { if (confirm(`Are you sure you want to delete this transaction?\nThis cannot be undone.`)) { const result = await callPython('delete_transaction', String(id)); if (result?.success) { showToast('Transaction deleted.', 'success'); await syncChanges(); } } }
 async function handleAddCategory(event) { event.preventDefault(); const form = event.target; const nameInput = form.elements['cat-name']; const typeSelect = form.elements['cat-type']; const name = nameInput?.value.trim(); const category_type = typeSelect?.value; if (!name) { showToast("Category name cannot be empty.", 'warning'); nameInput?.focus(); return; } if (name.toLowerCase() === 'uncategorized') { showToast("Cannot add 'Uncategorized'.", 'warning'); nameInput?.focus(); return; } if (!category_type) { showToast("Please select a category type.", 'warning'); typeSelect?.focus(); return; } const result = await callPython('add_category', name, category_type); if (result?.success) { showToast(`Category '${name}' added.`, 'success'); closeModal('add-category-modal'); form.reset(); await loadCategoriesData(); if (currentView === 'budget') await loadBudgetData(); await ensureInitialData(true); } else { nameInput?.focus(); } }
 function editCategory(id, currentName, currentType) { if (currentName.toLowerCase() === 'uncategorized') { showToast("Cannot edit 'Uncategorized'.", 'warning'); return; } document.getElementById('edit-cat-id').value = id; document.getElementById('edit-cat-name').value = currentName; document.getElementById('edit-cat-type').value = currentType; openModal('edit-category-modal'); }
 async function handleEditCategory(event) { event.preventDefault(); const form = event.target; const idInput = form.elements['edit-cat-id']; const nameInput = form.elements['edit-cat-name']; const typeSelect = form.elements['edit-cat-type']; const id = idInput?.value; const name = nameInput?.value.trim(); const category_type = typeSelect?.value; if (!id) { console.error("Edit category ID missing!"); return; } if (!name) { showToast("Category name cannot be empty.", 'warning'); nameInput?.focus(); return; } if (name.toLowerCase() === 'uncategorized') { showToast("Cannot rename to 'Uncategorized'.", 'warning'); nameInput?.focus(); return; } if (!category_type) { showToast("Please select a category type.", 'warning'); typeSelect?.focus(); return; } const result = await callPython('update_category', String(id), name, category_type); if (result?.success) { showToast(`Category '${name}' updated.`, 'success'); closeModal('edit-category-modal'); form.reset(); await loadCategoriesData(); if (currentView === 'budget') await loadBudgetData(); if (currentView === 'transactions') await loadTransactionsData(document.getElementById('account-filter')?.value === 'null' ? null : document.getElementById('account-filter')?.value); await ensureInitialData(true); } else { nameInput?.focus(); } }
 async function deleteCategory(id, name) { if (name.toLowerCase() === 'uncategorized') { showToast("Cannot delete 'Uncategorized'.", 'warning'); return; } if (confirm(`Delete category "${escapeJsString(name)}"? Transactions will become 'Uncategorized'. Budgets will be deleted.`)) { const result = await callPython('delete_category', String(id)); if (result?.success) { showToast(`Category '${name}' deleted.`, 'success'); await loadCategoriesData(); if (currentView === 'budget') await loadBudgetData(); if (currentView === 'transactions') await loadTransactionsData(document.getElementById('account-filter')?.value === 'null' ? null : document.getElementById('account-filter')?.value); await ensureInitialData(true); } } }
 const debouncedBudgetUpdate = debounce(async (categoryId, newAmountStr, month) => { const sanitizedAmount = newAmountStr.trim().replace(',', '.'); if (sanitizedAmount !== '' && !/^\d*\.?\d{0,2}$/.test(sanitizedAmount)) { showToast("Invalid budget amount format.", 'warning'); await loadBudgetData(); return; } const amountToSend = sanitizedAmount === '' ? '0.00' : sanitizedAmount; const result = await callPython('set_budget_amount', String(categoryId), month, amountToSend); if (!result?.success) { showToast('Failed to update budget. Reverting.', 'error'); } await loadBudgetData(); }, 800);
 function handleBudgetInputChange(event) { const inputElement = event.target; if (inputElement.classList.contains('budget-input') && event.type === 'change') { const categoryId = inputElement.dataset.categoryId; const newAmount = inputElement.value; const monthInput = document.getElementById('budget-month'); const currentMonth = monthInput?.value; if (!currentMonth) { showToast("Month not selected.", 'warning'); return; } if (!categoryId) { console.error("Missing category ID on budget input:", inputElement); return; } debouncedBudgetUpdate(categoryId, newAmount, currentMonth); } }
-async function handleRunReport() { const startDateInput = document.getElementById('report-start-date'); const endDateInput = document.getElementById('report-end-date'); const chartContainer = document.getElementById('spending-chart-container'); const placeholder = document.getElementById('report-placeholder'); const canvas = document.getElementById('spending-pie-chart'); if (!startDateInput || !endDateInput || !chartContainer || !placeholder || !canvas) { console.error("Report UI elements missing."); return; } const startDate = startDateInput.value; const endDate = endDateInput.value; if (!startDate || !endDate) { showToast("Please select both start and end dates.", "warning"); return; } if (new Date(startDate) > new Date(endDate)) { showToast("Start date cannot be after end date.", "warning"); return; } if (spendingChart) { spendingChart.destroy(); spendingChart = null; } canvas.style.display = 'none'; placeholder.style.display = 'block'; placeholder.className = 'placeholder-text loading'; placeholder.innerHTML = '<span class="material-symbols-outlined">hourglass_top</span> Generating report...'; const result = await callPython('get_spending_by_category_report', startDate, endDate); if (result?.success && result.data?.report_data) { const reportData = result.data.report_data; if (reportData.length > 0) { placeholder.style.display = 'none'; canvas.style.display = 'block'; createSpendingChart(reportData); } else { placeholder.className = 'placeholder-text empty'; placeholder.innerHTML = '<span class="material-symbols-outlined">sentiment_dissatisfied</span> No spending data found.'; canvas.style.display = 'none'; } } else { placeholder.className = 'placeholder-text error'; placeholder.innerHTML = `<span class="material-symbols-outlined">error_outline</span> ${result?.error || 'Failed to generate report.'}`; canvas.style.display = 'none'; } }
+async function handleRunReport() { const startDateInput = document.getElementById('report-start-date'); const endDateInput = document.getElementById('report-end-date'); const chartContainer = document.getElementById('spending-chart-container'); const placeholder = document.getElementById('report-placeholder'); const canvas = document.getElementById('spending-pie-chart'); if (!startDateInput || !endDateInput || !chartContainer || !placeholder || !canvas) { console.error("Report UI elements missing."); return; } const startDate = startDateInput.value; const endDate = endDateInput.value; if (!startDate || !endDate) { showToast("Please select both start and end dates.", "warning"); return; } if (new Date(startDate) > new Date(endDate)) { showToast("Start date cannot be after end date.", "warning"); return; } runBalanceHistoryReport(startDate, endDate, document.getElementById('report-granularity')?.value || 'monthly'); if (spendingChart) { spendingChart.destroy(); spendingChart = null; } canvas.style.display = 'none'; placeholder.style.display = 'block'; placeholder.className = 'placeholder-text loading'; placeholder.innerHTML = '<span class="material-symbols-outlined">hourglass_top</span> Generating report...'; const result = await callPython('get_spending_by_category_report', startDate, endDate); if (result?.success && result.data?.report_data) { const reportData = result.data.report_data; if (reportData.length > 0) { placeholder.style.display = 'none'; canvas.style.display = 'block'; createSpendingChart(reportData); } else { placeholder.className = 'placeholder-text empty'; placeholder.innerHTML = '<span class="material-symbols-outlined">sentiment_dissatisfied</span> No spending data found.'; canvas.style.display = 'none'; } } else { placeholder.className = 'placeholder-text error'; placeholder.innerHTML = `<span class="material-symbols-outlined">error_outline</span> ${result?.error || 'Failed to generate report.'}`; canvas.style.display = 'none'; } }
 function createSpendingChart(data) { if (typeof Chart === 'undefined') { console.error("Chart.js library is not loaded!"); showToast("Error: Chart library not available.", "error"); return; } const canvas = document.getElementById('spending-pie-chart'); if (!canvas) { console.error("Spending chart canvas not found!"); return; } const ctx = canvas.getContext('2d'); if (!ctx) { console.error("Failed to get 2D context"); return; } if (spendingChart) { spendingChart.destroy(); } const labels = data.map(item => item.category_name); const amounts = data.map(item => parseFloat(item.spent_amount)); const bgColors = generateChartColors(data.length); const textColor = getComputedStyle(document.documentElement).getPropertyValue('--text-secondary').trim(); const borderColor = document.documentElement.classList.contains('dark-theme') ? '#2D3748' : '#FFFFFF'; try { spendingChart = new Chart(ctx, { type: 'pie', data: { labels: labels, datasets: [{ label: 'Spent Amount', data: amounts, backgroundColor: bgColors, borderColor: borderColor, borderWidth: 1.5 }] }, options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { position: 'bottom', labels: { padding: 20, boxWidth: 12, font: { size: 11 }, color: textColor } }, title: { display: false }, tooltip: { callbacks: { label: function(context) { let label = context.label || ''; if (label) label += ': '; label += formatCurrency(context.parsed); return label; } }, backgroundColor: 'rgba(0, 0, 0, 0.7)', titleFont: { size: 14 }, bodyFont: { size: 12 }, padding: 10, bodyColor: '#ffffff', titleColor: '#ffffff' } } } }); } catch (chartError) { console.error("Error creating chart:", chartError); showToast("Error occurred while displaying the chart.", "error"); } }
 
 // --- Utility Functions ---
+async function runBalanceHistoryReport(startDate, endDate, granularity) { const canvas = document.getElementById('balance-history-chart'); const placeholder = document.getElementById('balance-placeholder'); if (!canvas || !placeholder) { console.error("Balance history UI elements missing."); return; } if (balanceChart) { balanceChart.destroy(); balanceChart = null; } canvas.style.display = 'none'; placeholder.style.display = 'block'; placeholder.className = 'placeholder-text loading'; placeholder.innerHTML = '<span class="material-symbols-outlined">hourglass_top</span> Generating report...'; const result = await callPython('get_balance_history', startDate, endDate, granularity, null); if (result?.success && result.data?.periods?.length) { placeholder.style.display = 'none'; canvas.style.display = 'block'; createBalanceChart(result.data); } else { placeholder.className = 'placeholder-text error'; placeholder.innerHTML = `<span class="material-symbols-outlined">error_outline</span> ${result?.error || 'Failed to load balance history.'}`; } }
+function createBalanceChart(history) { if (typeof Chart === 'undefined') { console.error("Chart.js library is not loaded!"); return; } const canvas = document.getElementById('balance-history-chart'); const ctx = canvas?.getContext('2d'); if (!ctx) { console.error("Balance chart canvas not found!"); return; } if (balanceChart) { balanceChart.destroy(); } const toAmounts = cents => cents.map(c => c / 100); const colors = generateChartColors(history.accounts.length + 1); const textColor = getComputedStyle(document.documentElement).getPropertyValue('--text-secondary').trim(); const datasets = [{ label: 'Net Worth', data: toAmounts(history.total_balance_cents), borderColor: colors[0], backgroundColor: colors[0], borderWidth: 2.5, pointRadius: 0, tension: 0.2 }, ...history.accounts.map((acc, i) => ({ label: acc.name, data: toAmounts(acc.balance_cents), borderColor: colors[i + 1], backgroundColor: colors[i + 1], borderWidth: 1.5, pointRadius: 0, tension: 0.2 }))]; try { balanceChart = new Chart(ctx, { type: 'line', data: { labels: history.periods, datasets: datasets }, options: { responsive: true, maintainAspectRatio: false, animation: history.periods.length > 1000 ? false : undefined, interaction: { mode: 'index', intersect: false }, scales: { x: { ticks: { color: textColor, maxTicksLimit: 12 } }, y: { ticks: { color: textColor, callback: value => formatCurrency(value) } } }, plugins: { legend: { position: 'bottom', labels: { padding: 20, boxWidth: 12, font: { size: 11 }, color: textColor } }, tooltip: { callbacks: { label: context => `${context.dataset.label}: ${formatCurrency(context.parsed.y)}`, footer: items => { const i = items[0]?.dataIndex; return i === undefined ? '' : `Income ${formatCurrency(history.income_cents[i] / 100)} / Expense ${formatCurrency(history.expense_cents[i] / 100)}`; } } } } } }); } catch (chartError) { console.error("Error creating balance chart:", chartError); showToast("Error occurred while displaying the chart.", "error"); } }
 function generateChartColors(count) { const colors = []; const saturation = 70; const lightness = document.documentElement.classList.contains('dark-theme') ? 60 : 55; const hueStep = count > 1 ? 360 / count : 0; const startHue = 30; for (let i = 0; i < count; i++) { const hue = (startHue + i * hueStep) % 360; colors.push(`hsl(${hue}, ${saturation}%, ${lightness}%)`); } return colors; }
 function formatCurrency(value) { const num = parseFloat(String(value ?? '0').replace(/[$,]/g, '')); if (isNaN(num)) return "$0.00"; return new Intl.NumberFormat('en-US', { style: 'currency', currency: 'USD', minimumFractionDigits: 2, maximumFractionDigits: 2 }).format(num); }
 function escapeHtml(unsafe) {
@@ -248,7 +305,7 @@ function escapeHtml(unsafe) {
       .replace(/'/g, "&#39;");
   }
 function escapeJsString(unsafe) { if (unsafe === null || unsafe === undefined) return ''; return String(unsafe) .replace(/\\/g, '\\\\').replace(/'/g, "\\'").replace(/"/g, '\\"') .replace(/\n/g, '\\n').replace(/\r/g, '\\r'); }
-function populateAccountDropdowns(targetSelectId = null) { const selectorIds = targetSelectId ? [targetSelectId] : ['account-filter', 'trans-acc', 'edit-trans-acc']; selectorIds.forEach(selectId => { const selectElement = document.getElementById(selectId); if (!selectElement) return; const currentValue = selectElement.value; const isDisabled = selectElement.disabled; selectElement.innerHTML = ''; if (selectId === 'account-filter') { selectElement.add(new Option("All Accounts", "null")); } if (accountsData && accountsData.length > 0) { const sortedAccounts = [...accountsData].sort((a, b) => a.name.localeCompare(b.name, undefined, { sensitivity: 'base' })); sortedAccounts.forEach(acc => { selectElement.add(new Option(escapeHtml(acc.name), acc.id)); }); selectElement.disabled = isDisabled; } else { if (selectId !== 'account-filter') { const noAccOption = new Option("No accounts available", ""); noAccOption.disabled = true; selectElement.add(noAccOption); selectElement.disabled = true; } else { selectElement.disabled = false; } } selectElement.value = Array.from(selectElement.options).some(opt => opt.value === currentValue) ? currentValue : (selectId === 'account-filter' ? 'null' : ''); if (!isDisabled && selectElement.options.length > (selectId === 'account-filter' ? 1 : 0)) { selectElement.disabled = false; } }); }
+function populateAccountDropdowns(targetSelectId = null) { const selectorIds = targetSelectId ? [targetSelectId] : ['account-filter', 'trans-acc', 'edit-trans-acc', 'import-acc']; selectorIds.forEach(selectId => { const selectElement = document.getElementById(selectId); if (!selectElement) return; const currentValue = selectElement.value; const isDisabled = selectElement.disabled; selectElement.innerHTML = ''; if (selectId === 'account-filter') { selectElement.add(new Option("All Accounts", "null")); } if (accountsData && accountsData.length > 0) { const sortedAccounts = [...accountsData].sort((a, b) => a.name.localeCompare(b.name, undefined, { sensitivity: 'base' })); sortedAccounts.forEach(acc => { selectElement.add(new Option(escapeHtml(acc.name), acc.id)); }); selectElement.disabled = isDisabled; } else { if (selectId !== 'account-filter') { const noAccOption = new Option("No accounts available", ""); noAccOption.disabled = true; selectElement.add(noAccOption); selectElement.disabled = true; } else { selectElement.disabled = false; } } selectElement.value = Array.from(selectElement.options).some(opt => opt.value === currentValue) ? currentValue : (selectId === 'account-filter' ? 'null' : ''); if (!isDisabled && selectElement.options.length > (selectId === 'account-filter' ? 1 : 0)) { selectElement.disabled = false; } }); }
 function populateCategoryDropdowns(targetSelectId = null) { const selectorIds = targetSelectId ? [targetSelectId] : ['trans-cat', 'edit-trans-cat']; selectorIds.forEach(selectId => { const selectElement = document.getElementById(selectId); if (!selectElement) return; const currentValue = selectElement.value; selectElement.innerHTML = '<option value="">Uncategorized</option>'; const isDisabled = selectElement.disabled; if (categoryData && categoryData.length > 0) { const sortedCategories = [...categoryData] .filter(cat => cat.name.toLowerCase() !== 'uncategorized') .sort((a, b) => a.name.localeCompare(b.name, undefined, { sensitivity: 'base' })); sortedCategories.forEach(cat => { selectElement.add(new Option(escapeHtml(cat.name), cat.id)); }); selectElement.disabled = isDisabled; } else { selectElement.disabled = isDisabled; } selectElement.value = Array.from(selectElement.options).some(opt => opt.value === currentValue) ? currentValue : ""; if (!isDisabled) { selectElement.disabled = false; } }); }
 
 
@@ -265,11 +322,22 @@ function setupEventListeners() {
     // Form Submissions
     document.addEventListener('submit', (event) => { const form = event.target; switch (form.id) { case 'add-account-form': handleAddAccount(event); break; case 'edit-account-form': handleEditAccount(event); break; case 'add-transaction-form': handleAddTransaction(event); break; case 'edit-transaction-form': handleEditTransaction(event); break; case 'add-category-form': handleAddCategory(event); break; case 'edit-category-form': handleEditCategory(event); break; } });
     // Filters and View Controls
-    document.getElementById('account-filter')?.addEventListener('change', (event) => { const selectedAccountId = event.target.value === 'null' ? null : event.target.value; loadTransactionsData(selectedAccountId); });
+    document.getElementById('account-filter')?.addEventListener('change', (event) => { const selectedAccountId = event.target.value === 'null' ? null : event.target.value; const searchQuery = document.getElementById('transaction-search')?.value.trim(); if (searchQuery) { searchTransactionsData(searchQuery); } else { loadTransactionsData(selectedAccountId); } });
+    document.getElementById('load-more-transactions-btn')?.addEventListener('click', loadMoreTransactions);
+    document.getElementById('transaction-search')?.addEventListener('input', (event) => debouncedTransactionSearch(event.target.value.trim()));
     document.getElementById('budget-month')?.addEventListener('change', loadBudgetData);
     document.getElementById('run-report-btn')?.addEventListener('click', handleRunReport);
     // Settings View Listeners
     document.getElementById('export-xlsx-btn')?.addEventListener('click', handleExportExcel);
+    document.getElementById('import-file-btn')?.addEventListener('click', handleImportTransactions);
+    document.getElementById('add-rule-btn')?.addEventListener('click', handleAddRule);
+    document.getElementById('apply-rules-btn')?.addEventListener('click', () => handleApplyRules('uncategorized'));
+    document.getElementById('reapply-rules-btn')?.addEventListener('click', () => handleApplyRules('all'));
+    document.getElementById('duplicate-policy')?.addEventListener('change', handleDuplicatePolicyChange);
+    document.getElementById('find-duplicates-btn')?.addEventListener('click', handleFindDuplicates);
+    document.getElementById('archive-year-btn')?.addEventListener('click', () => handleArchiveYear(false));
+    document.getElementById('restore-year-btn')?.addEventListener('click', () => handleArchiveYear(true));
+    document.getElementById('run-maintenance-btn')?.addEventListener('click', handleRunMaintenance);
     themeToggle = document.getElementById('theme-toggle'); // Assign here
     if (themeToggle) { themeToggle.addEventListener('change', handleThemeToggle); console.log("Theme toggle listener attached."); } else { console.error("Could not find theme toggle element to attach listener."); }
     // Placeholder buttons
@@ -300,7 +368,7 @@ async function ensureInitialData(forceRefresh = false) {
 
                 // Fetch only if data is missing or forced
                 if (accountsData.length === 0 || categoryData.length === 0 || forceRefresh) {
-                    const results = await Promise.all([ callPython('get_accounts'), callPython('get_categories') ]);
+                    const results = await Promise.all([ callPythonBatched('get_accounts'), callPythonBatched('get_categories') ]);
                     const accountResult = results[0]; const categoryResult = results[1];
                     if (accountResult?.success && accountResult.data?.accounts) { accountsData = accountResult.data.accounts; } else { console.error("Failed to load initial accounts:", accountResult?.error); accountsData = []; /* Toast handled by callPython */ }
                     if (categoryResult?.success && categoryResult.data?.categories) { categoryData = categoryResult.data.categories; } else { console.error("Failed to load initial categories:", categoryResult?.error); categoryData = []; /* Toast handled by callPython */ }
@@ -325,17 +393,231 @@ async function ensureInitialData(forceRefresh = false) {
 }
 
 
+// --- Change Feed ---
+// After an edit only what changed since changesVersion (get_changes_since) is fetched and patched into accountsData,
+// categoryData and the rendered rows, so the cost follows the edit instead of the ledger. A reset (no version yet,
+// too many changes, or a version the log no longer covers) falls back to reloading the current view.
+let changesVersion = null;
+async function syncChanges() {
+    const result = await callPython('get_changes_since', changesVersion === null ? null : String(changesVersion));
+    if (!result?.success || result.data.reset) { if (result?.success) changesVersion = result.data.version; await reloadAfterChange(); return; }
+    const changes = result.data; changesVersion = changes.version;
+    applyCategoryChanges(changes.categories); applyAccountChanges(changes.accounts); applyTransactionChanges(changes.transactions);
+    const transactionsChanged = ['inserted', 'updated', 'deleted'].some(key => changes.transactions[key].length);
+    if (currentView === 'dashboard' && (transactionsChanged || changes.accounts.changed.length || changes.accounts.deleted.length)) await loadDashboardData();
+    if (currentView === 'budget' && (transactionsChanged || changes.categories.changed.length || changes.categories.deleted.length)) await loadBudgetData();
+}
+
+async function reloadAfterChange() {
+    await loadAccountsData(); // Resets the account filter first if its account is gone
+    const currentFilter = document.getElementById('account-filter')?.value; const reloads = [ensureInitialData(true)];
+    if (currentView === 'transactions') reloads.push(loadTransactionsData(currentFilter === 'null' ? null : currentFilter));
+    if (currentView === 'dashboard') reloads.push(loadDashboardData());
+    if (currentView === 'budget') reloads.push(loadBudgetData());
+    await Promise.all(reloads); // Started together so they share one batched round trip
+}
+
+function applyCategoryChanges({ changed, deleted }) {
+    if (!changed.length && !deleted.length) return;
+    categoryData = categoryData.filter(cat => !deleted.includes(cat.id) && !changed.some(c => c.id === cat.id)).concat(changed);
+    populateCategoryDropdowns();
+}
+
+function applyAccountChanges({ changed, deleted }) {
+    if (!changed.length && !deleted.length) return;
+    const namesChanged = deleted.length > 0 || changed.some(acc => accountsData.find(a => a.id === acc.id)?.name !== acc.name);
+    accountsData = accountsData.filter(acc => !deleted.includes(acc.id) && !changed.some(c => c.id === acc.id)).concat(changed).sort((a, b) => a.name.localeCompare(b.name, undefined, { sensitivity: 'base' }));
+    const tableBody = document.getElementById('accounts-table-body');
+    if (tableBody) {
+        const rows = new Map([...tableBody.querySelectorAll('.table-row')].map(row => [Number(row.dataset.id), row]));
+        tableBody.querySelector('.placeholder-text')?.remove(); deleted.forEach(id => rows.get(id)?.remove());
+        accountsData.forEach(acc => { let row = rows.get(acc.id); if (!row || changed.some(c => c.id === acc.id)) { const fresh = renderTableRow(acc, 'account'); row?.replaceWith(fresh); row = fresh; } tableBody.appendChild(row); });
+        if (!accountsData.length) renderPlaceholder(tableBody, 'empty', 'No accounts found. Click "Add Account".');
+    }
+    if (!namesChanged) return;
+    populateAccountDropdowns();
+    if (currentView === 'transactions' && deleted.some(id => (transactionsFilters.account_ids || []).map(String).includes(String(id)))) loadTransactionsData(null); // Filtered on a deleted account
+}
+
+function applyTransactionChanges({ inserted, updated, deleted }) {
+    const tableBody = document.getElementById('transactions-table-body');
+    if (!tableBody || !(inserted.length || updated.length || deleted.length)) return;
+    const searching = !!document.getElementById('transaction-search')?.value.trim(); // Search results are patched in place, never extended
+    const filterAccounts = (transactionsFilters.account_ids || []).map(String);
+    const inFilter = accountId => !filterAccounts.length || filterAccounts.includes(String(accountId));
+    const rowFor = id => tableBody.querySelector(`.table-row[data-id="${id}"]`);
+    deleted.forEach(tran => { rowFor(tran.id)?.remove(); if (!searching && inFilter(tran.account_id)) transactionsTotalCount--; });
+    [...updated.map(tran => [tran, false]), ...inserted.map(tran => [tran, true])].forEach(([tran, isNew]) => {
+        const row = rowFor(tran.id);
+        if (searching) { row?.replaceWith(renderTableRow(tran, 'transaction')); return; }
+        row?.remove();
+        const wasIn = !isNew && inFilter(tran.previous_account_id), isIn = inFilter(tran.account_id); // The row may not be loaded, so count by account
+        transactionsTotalCount += isIn - wasIn;
+        if (isIn) insertTransactionRow(tableBody, renderTableRow(tran, 'transaction'), tran);
+    });
+    if (!tableBody.querySelector('.table-row') && !searching) renderPlaceholder(tableBody, 'empty', filterAccounts.length ? 'No transactions for this account.' : 'No transactions recorded yet.');
+    updateTransactionsFooter();
+}
+
+// Keeps the (date DESC, id DESC) order of query_transactions; a row sorting after the last loaded one is left for "Load More".
+function insertTransactionRow(tableBody, row, tran) {
+    const next = [...tableBody.querySelectorAll('.table-row')].find(r => r.dataset.date < tran.date || (r.dataset.date === tran.date && Number(r.dataset.id) < tran.id));
+    if (next) { tableBody.insertBefore(row, next); return; }
+    if (transactionsCursor) return;
+    tableBody.querySelector('.placeholder-text')?.remove(); tableBody.appendChild(row);
+}
+
 // --- Export Function ---
+// --- Background Jobs ---
+// Follows a job started by export_data/import_transactions/start_job until it finishes, showing its progress in the
+// statusId element (with a Cancel button). Resolves to the final job status, or null if the job never started.
+async function followJob(startResult, statusId, label) {
+    let job = startResult?.success ? startResult.data?.job : null;
+    if (!job) return null;
+    const statusEl = document.getElementById(statusId); const progressEl = statusEl?.querySelector('.job-progress'); const textEl = statusEl?.querySelector('.job-status-text'); const cancelBtn = statusEl?.querySelector('.job-cancel-btn');
+    const onCancel = async () => { if (cancelBtn) cancelBtn.disabled = true; await callPython('cancel_job', String(job.id)); };
+    if (statusEl) { statusEl.hidden = false; cancelBtn.disabled = false; cancelBtn.addEventListener('click', onCancel); }
+    try {
+        while (!JOB_FINISHED_STATES.includes(job.state)) {
+            if (progressEl) { if (job.progress === null || job.progress === undefined) progressEl.removeAttribute('value'); else progressEl.value = job.progress; }
+            if (textEl) textEl.textContent = job.cancel_requested ? 'Cancelling...' : job.state === 'queued' ? `${label}: waiting for another job...` : `${label}...${job.progress != null ? ` ${Math.round(job.progress * 100)}%` : ''}`;
+            await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+            const result = await callPython('get_job_status', String(job.id));
+            if (!result?.success) return null; // Error toast shown by callPython
+            job = result.data.job;
+        }
+    } finally { if (statusEl) { statusEl.hidden = true; cancelBtn.removeEventListener('click', onCancel); } }
+    if (job.state === 'failed') showToast(job.error || `${label} failed. Check logs.`, 'error');
+    else if (job.state === 'cancelled') showToast(`${label} cancelled.`, 'info');
+    return job;
+}
+
 async function handleExportExcel() {
     const filenameInput = document.getElementById('export-filename');
     const currentDate = new Date().toLocaleDateString('en-CA');
     const baseFilename = filenameInput?.value.trim() || `FinancXpert_Export_${currentDate}`;
     if (!baseFilename) { showToast('Please enter a base filename.', 'warning'); filenameInput?.focus(); return; }
     if (/[\\/:*?"<>|]/.test(baseFilename)) { showToast('Filename contains invalid characters: \\ / : * ? " < > |', 'warning'); filenameInput?.focus(); return; }
-    showToast('Generating export...', 'info');
-    const result = await callPython('export_data_to_excel', baseFilename);
-    if (result?.success) { showToast(result.data?.message || 'Export completed!', 'success'); if(filenameInput) filenameInput.value = ''; }
-    else { if (!result?.error) { showToast('Export failed. Check logs.', 'error'); } } // Error toast shown by callPython
+    const fileFormat = document.getElementById('export-format')?.value || 'xlsx';
+    const startDate = document.getElementById('export-start-date')?.value; const endDate = document.getElementById('export-end-date')?.value;
+    if (startDate && endDate && startDate > endDate) { showToast('Export start date must be before the end date.', 'warning'); return; }
+    const filters = {}; if (startDate) filters.start_date = startDate; if (endDate) filters.end_date = endDate;
+    const job = await followJob(await callPython('export_data', baseFilename, fileFormat, JSON.stringify(filters)), 'export-job-status', 'Exporting');
+    if (job?.state === 'succeeded') { showToast(job.result?.message || 'Export completed!', 'success'); if(filenameInput) filenameInput.value = ''; }
+}
+
+// --- Import Function ---
+async function handleImportTransactions() {
+    const accountId = document.getElementById('import-acc')?.value;
+    const fileFormat = document.getElementById('import-format')?.value || null;
+    if (!accountId) { showToast('Please select an account to import into.', 'warning'); return; }
+    const job = await followJob(await callPython('import_transactions', String(accountId), fileFormat, null), 'import-job-status', 'Importing');
+    if (job?.state === 'succeeded') {
+        const report = job.result?.report;
+        showToast(job.result?.message || 'Import completed!', report?.rows_rejected ? 'warning' : 'success');
+        if (report?.rejected?.length) { console.warn(`Import rejected ${report.rows_rejected} line(s):`, report.rejected.map(r => `line ${r.line}: ${r.reason}`).join('\n')); }
+        await syncChanges();
+    }
+}
+
+// --- Categorization Rule Functions ---
+async function loadRules() {
+    const listEl = document.getElementById('rule-list'); if (!listEl) return;
+    const [ruleResult, catResult] = await Promise.all([callPython('get_rules'), callPython('get_categories')]);
+    const catSelect = document.getElementById('rule-cat'), accSelect = document.getElementById('rule-acc');
+    if (catSelect && catResult?.success) { const current = catSelect.value; catSelect.innerHTML = ''; catResult.data.categories.forEach(cat => catSelect.add(new Option(cat.name, cat.id))); if (current) catSelect.value = current; }
+    if (accSelect) { const current = accSelect.value; accSelect.innerHTML = ''; accSelect.add(new Option('Any account', '')); accountsData.forEach(acc => accSelect.add(new Option(acc.name, acc.id))); accSelect.value = current; }
+    listEl.innerHTML = '';
+    const rules = ruleResult?.success ? ruleResult.data.rules : [];
+    if (!rules.length) { listEl.innerHTML = '<li>No rules yet.</li>'; return; }
+    rules.forEach(rule => {
+        const match = rule.pattern ? (rule.match_type === 'regex' ? `matches /${escapeHtml(rule.pattern)}/` : `contains "${escapeHtml(rule.pattern)}"`) : 'any description';
+        const range = rule.min_amount != null || rule.max_amount != null ? `, amount ${rule.min_amount != null ? formatCurrency(rule.min_amount) : '…'} to ${rule.max_amount != null ? formatCurrency(rule.max_amount) : '…'}` : '';
+        const item = document.createElement('li');
+        item.innerHTML = `<span>${match}${rule.account_name ? ` in ${escapeHtml(rule.account_name)}` : ''}${range} → <strong>${escapeHtml(rule.category_name)}</strong></span> <button class="button action-btn danger" onclick="deleteRule(${rule.id})" title="Delete Rule"><span class="material-symbols-outlined">delete</span></button>`;
+        listEl.appendChild(item);
+    });
+}
+
+async function handleAddRule() {
+    const value = id => document.getElementById(id)?.value.trim() || null;
+    const rule = { pattern: value('rule-pattern'), match_type: value('rule-type') || 'keyword', category_id: value('rule-cat'), account_id: value('rule-acc'), min_amount: value('rule-min'), max_amount: value('rule-max') };
+    if (!rule.category_id) { showToast('Please choose a category for the rule.', 'warning'); return; }
+    const result = await callPython('add_rule', JSON.stringify(rule));
+    if (result?.success) { showToast('Rule added.', 'success'); ['rule-pattern', 'rule-min', 'rule-max'].forEach(id => { const el = document.getElementById(id); if (el) el.value = ''; }); await loadRules(); }
+}
+
+async function deleteRule(ruleId) {
+    if (!confirm('Delete this rule? Transactions it already categorized keep their category.')) return;
+    const result = await callPython('delete_rule', String(ruleId));
+    if (result?.success) { showToast('Rule deleted.', 'success'); await loadRules(); }
+}
+
+async function handleApplyRules(scope) {
+    if (scope === 'all' && !confirm('Re-apply the rules to every transaction? Categories a rule disagrees with will be replaced.')) return;
+    const job = await followJob(await callPython('start_job', 'apply_rules', JSON.stringify({ scope })), 'rules-job-status', 'Categorizing');
+    if (job?.state === 'succeeded') { showToast(job.result?.message || 'Done!', 'success'); await syncChanges(); }
+}
+
+// --- Duplicate Functions ---
+async function loadDuplicatePolicy() {
+    const select = document.getElementById('duplicate-policy'); if (!select) return;
+    const result = await callPython('configure_duplicate_policy', null); if (result?.success) select.value = result.data.policy;
+}
+
+async function handleDuplicatePolicyChange(event) {
+    const result = await callPython('configure_duplicate_policy', event.target.value);
+    if (result?.success) showToast(result.data.policy === 'reject' ? 'Identical transactions will be refused.' : 'Identical transactions will be saved.', 'success');
+    else await loadDuplicatePolicy();
+}
+
+async function handleFindDuplicates() {
+    const listEl = document.getElementById('duplicate-list'); if (!listEl) return;
+    const result = await callPython('find_duplicates', document.getElementById('duplicate-window')?.value || '3', null);
+    listEl.innerHTML = ''; if (!result?.success) return;
+    const { groups, group_count, truncated } = result.data;
+    if (!groups.length) { listEl.innerHTML = '<li>No duplicates found.</li>'; return; }
+    groups.forEach(group => {
+        const item = document.createElement('li');
+        const rows = group.transactions.map(tx => `${escapeHtml(tx.date)} ${escapeHtml(tx.description)} (#${tx.id})`).join('; ');
+        item.innerHTML = `<span><strong>${escapeHtml(group.account_name)}</strong> ${formatCurrency(group.amount)}${group.exact ? ' <em>(identical)</em>' : ''}: ${rows}</span>`;
+        listEl.appendChild(item);
+    });
+    if (truncated) { const more = document.createElement('li'); more.textContent = `Showing ${groups.length} of ${group_count} groups.`; listEl.appendChild(more); }
+}
+
+// --- Archive Functions ---
+let archivedYears = [];
+async function loadArchivedYears() {
+    const noteEl = document.getElementById('archived-years-note'); const result = await callPython('get_archived_years');
+    archivedYears = result?.success ? result.data.archived_years : [];
+    if (noteEl) noteEl.textContent = archivedYears.length ? `Archived: ${archivedYears.map(y => `${y.year} (${y.tx_count} transactions${y.file_exists ? '' : ', file missing'})`).join(', ')}.` : 'No years archived.';
+    const yearInput = document.getElementById('archive-year'); if (yearInput && !yearInput.value) yearInput.value = archivedYears.length ? archivedYears[archivedYears.length - 1].year + 1 : new Date().getFullYear() - 1;
+    const restoreBtn = document.getElementById('restore-year-btn'); if (restoreBtn) restoreBtn.disabled = !archivedYears.length;
+}
+
+async function handleArchiveYear(restore) {
+    const year = restore ? archivedYears[archivedYears.length - 1]?.year : parseInt(document.getElementById('archive-year')?.value, 10);
+    if (!year) { showToast(restore ? 'No archived year to restore.' : 'Please enter a year to archive.', 'warning'); return; }
+    if (!confirm(restore ? `Move the transactions of ${year} back from its archive file?` : `Move all transactions dated in ${year} into an archive file?`)) return;
+    const job = await followJob(await callPython('start_job', restore ? 'restore_year' : 'archive_year', JSON.stringify({ year })), 'archive-job-status', restore ? 'Restoring' : 'Archiving');
+    if (job?.state === 'succeeded') { showToast(job.result?.message || 'Done!', 'success'); document.getElementById('archive-year').value = ''; await Promise.all([loadArchivedYears(), syncChanges()]); }
+}
+
+// --- Maintenance Functions ---
+const MAINTENANCE_TASK_LABELS = { analyze: 'statistics', prune_changes: 'change log', reclaim: 'free space', checkpoint: 'log checkpoint', quick_check: 'integrity check' };
+async function loadMaintenanceStatus() {
+    const noteEl = document.getElementById('maintenance-note'); if (!noteEl) return;
+    const result = await callPython('get_maintenance_status'); if (!result?.success) { noteEl.textContent = ''; return; }
+    const { tasks, storage } = result.data; const sizeMb = ((storage.file_bytes + storage.wal_bytes) / 1048576).toFixed(1);
+    const runs = Object.entries(tasks).map(([name, task]) => `${MAINTENANCE_TASK_LABELS[name] || name}: ${task.run ? `${task.run.last_run}${task.run.error ? ' (failed)' : ''}` : 'never'}`);
+    noteEl.textContent = `Database ${sizeMb} MB, ${storage.free_pages} free pages. Last runs: ${runs.join(', ')}.`;
+}
+
+async function handleRunMaintenance() {
+    const job = await followJob(await callPython('start_job', 'maintenance', null), 'maintenance-job-status', 'Maintenance');
+    if (job?.state === 'succeeded') showToast(job.result?.message || 'Maintenance done.', Object.values(job.result?.tasks || {}).some(t => t.error) ? 'warning' : 'success');
+    await loadMaintenanceStatus();
 }
 
 async function initializeApp() {
@@ -359,8 +641,9 @@ async function initializeApp() {
         if (!isReady) { throw new Error("Pywebview API failed to initialize."); }
         console.log("initializeApp: API ready.");
 
-        // Step 2: Fetch theme preference from DB via API
-        const themeResult = await callPython('get_theme_preference');
+        // Step 2: Fetch theme preference and initial account/category data together (one batched round trip)
+        const [changesResult, themeResult] = await Promise.all([ callPythonBatched('get_changes_since', null), callPythonBatched('get_theme_preference'), ensureInitialData() ]);
+        if (changesResult?.success) changesVersion = changesResult.data.version; // Taken before the first loads, so later deltas cover everything since
         if (themeResult?.success && themeResult.data?.theme) {
             initialTheme = themeResult.data.theme;
             console.log(`initializeApp: Got theme '${initialTheme}' from backend.`);
@@ -373,15 +656,13 @@ async function initializeApp() {
         // Step 3: Apply the determined theme AND set toggle state visually
         applyThemeAndToggle(initialTheme);
 
-        // Step 4: Load initial account/category data (API is confirmed ready)
-        await ensureInitialData();
         console.log("initializeApp: ensureInitialData completed.");
 
-        // Step 5: Set other defaults
+        // Step 4: Set other defaults
         const monthInput = document.getElementById('budget-month');
         if (monthInput && !monthInput.value) { monthInput.value = new Date().toISOString().slice(0, 7); }
 
-        // Step 6: Switch to initial view
+        // Step 5: Switch to initial view
         switchView('dashboard'); // Triggers loadDashboardData
 
     } catch (error) {